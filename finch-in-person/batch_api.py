@@ -0,0 +1,147 @@
+"""
+OpenAI Batch API support for the Demand Letter Evaluator
+
+Renders every evaluation request into a batch JSONL file, submits it, and
+collects the outputs once the batch has finished. The submitted batch id is
+recorded in a state file so an interrupted run can resume polling instead of
+submitting again.
+"""
+
+import json
+import logging
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def write_batch_file(requests, batch_file):
+    """
+    Write chat completion requests as a batch input file.
+
+    Args:
+        requests: Dictionary of custom_id -> chat completion request kwargs
+        batch_file: Path of the JSONL file to write
+
+    Returns:
+        Path of the written file
+    """
+    batch_file = Path(batch_file)
+    batch_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(batch_file, 'w', encoding='utf-8') as f:
+        for custom_id, body in requests.items():
+            line = {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    logger.info(f"Wrote {len(requests)} requests to {batch_file}")
+    return batch_file
+
+
+def submit_batch(client, batch_file, metadata=None):
+    """
+    Upload a batch input file and create the batch.
+
+    Args:
+        client: OpenAI client
+        batch_file: Path of the batch JSONL file
+        metadata: Optional metadata attached to the batch
+
+    Returns:
+        The created batch id
+    """
+    with open(batch_file, 'rb') as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h",
+        metadata=metadata,
+    )
+    logger.info(f"Submitted batch {batch.id} ({batch.status})")
+    return batch.id
+
+
+def wait_for_batch(client, batch_id, poll_interval=60, timeout=None):
+    """
+    Poll a batch until it reaches a terminal status.
+
+    Args:
+        client: OpenAI client
+        batch_id: Id of the batch to poll
+        poll_interval: Seconds between status checks
+        timeout: Give up after this many seconds (None = wait indefinitely)
+
+    Returns:
+        The final batch object
+
+    Raises:
+        TimeoutError: If the batch has not finished within `timeout`
+    """
+    started = time.monotonic()
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        progress = f" ({counts.completed}/{counts.total} done, {counts.failed} failed)" if counts else ""
+        logger.info(f"Batch {batch_id} is {batch.status}{progress}")
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        if timeout is not None and time.monotonic() - started > timeout:
+            raise TimeoutError(f"Batch {batch_id} still {batch.status} after {timeout}s")
+        time.sleep(poll_interval)
+
+
+def collect_batch_results(client, batch):
+    """
+    Download the outputs of a finished batch.
+
+    Args:
+        client: OpenAI client
+        batch: Finished batch object
+
+    Returns:
+        Tuple of (responses, errors): custom_id -> chat completion response
+        body, and custom_id -> error message for requests that failed
+    """
+    responses = {}
+    errors = {}
+
+    if batch.output_file_id:
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            custom_id = record["custom_id"]
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                errors[custom_id] = str(record.get("error") or response.get("body"))
+                continue
+            responses[custom_id] = response["body"]
+
+    if batch.error_file_id:
+        for line in client.files.content(batch.error_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            errors.setdefault(record["custom_id"], str(record.get("error") or record.get("response")))
+
+    if batch.status != "completed":
+        logger.error(f"Batch {batch.id} ended as {batch.status}")
+    logger.info(f"Batch {batch.id}: {len(responses)} responses, {len(errors)} errors")
+    return responses, errors
+
+
+def load_batch_state(state_file):
+    """Return the recorded batch state, or None if there is none."""
+    state_file = Path(state_file)
+    if not state_file.exists():
+        return None
+    with open(state_file, 'r') as f:
+        return json.load(f)
+
+
+def save_batch_state(state_file, state):
+    """Record the state of a submitted batch so it can be resumed."""
+    with open(state_file, 'w') as f:
+        json.dump(state, f, indent=2)
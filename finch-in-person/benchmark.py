@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput benchmark for the Demand Letter Evaluator.
+
+Generates a synthetic case (text and scanned source PDFs plus demand letters),
+starts the local OpenAI stand-in, and times the PDF extraction, fact building
+and evaluation stages. Each stage runs in a fresh process so its peak RSS is
+measured in isolation.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+from openai_stub import start_stub_server
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = Path(__file__).resolve().parent
+
+WORDS = ("patient reported cervical lumbar strain pain treatment therapy visit "
+         "collision vehicle insurance policy claim damages invoice total wage "
+         "loss hospital emergency neurology chiropractic imaging follow-up").split()
+
+
+def _random_lines(rng, count, width=12):
+    return [" ".join(rng.choice(WORDS) for _ in range(width)) for _ in range(count)]
+
+
+def write_text_pdf(path, pages):
+    """
+    Write a minimal PDF with a text layer.
+
+    Args:
+        path: Output path
+        pages: List of pages, each a list of text lines
+    """
+    def escape(line):
+        return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects = []
+    page_ids = []
+    font_id = 3
+    for idx, lines in enumerate(pages):
+        page_id = 4 + idx * 2
+        content_id = page_id + 1
+        page_ids.append(page_id)
+        stream = "BT /F1 11 Tf 14 TL 72 720 Td " + " ".join(f"({escape(line)}) '" for line in lines) + " ET"
+        objects.append((page_id, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                                 f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>"))
+        objects.append((content_id, f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream"))
+    objects.append((1, "<< /Type /Catalog /Pages 2 0 R >>"))
+    objects.append((2, f"<< /Type /Pages /Kids [{' '.join(f'{pid} 0 R' for pid in page_ids)}] /Count {len(page_ids)} >>"))
+    objects.append((font_id, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"))
+    objects.sort()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id, body in objects:
+        offsets[obj_id] = len(out)
+        out += f"{obj_id} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for obj_id in range(1, len(objects) + 1):
+        out += f"{offsets[obj_id]:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    Path(path).write_bytes(bytes(out))
+
+
+def write_scanned_pdf(path, pages):
+    """
+    Write an image-only PDF (no text layer), like a scanned record.
+
+    Args:
+        path: Output path
+        pages: List of pages, each a list of text lines
+    """
+    from PIL import Image, ImageDraw
+
+    images = []
+    for lines in pages:
+        image = Image.new("L", (1275, 1650), 255)
+        draw = ImageDraw.Draw(image)
+        for idx, line in enumerate(lines):
+            draw.text((100, 100 + idx * 30), line, fill=0)
+        images.append(image)
+    images[0].save(path, "PDF", resolution=150, save_all=True, append_images=images[1:])
+
+
+def generate_case(case_dir, num_docs, num_letters, pages_per_doc, scanned_fraction, seed=0):
+    """
+    Generate a synthetic case folder.
+
+    Args:
+        case_dir: Folder to create source_documents/ and demand_letters/ in
+        num_docs: Number of source PDFs
+        num_letters: Number of demand letter PDFs
+        pages_per_doc: Pages per source PDF
+        scanned_fraction: Fraction of source PDFs written without a text layer
+
+    Returns:
+        Tuple of (source_files, letter_files)
+    """
+    rng = random.Random(seed)
+    source_dir = Path(case_dir) / "source_documents"
+    letters_dir = Path(case_dir) / "demand_letters"
+    source_dir.mkdir(parents=True, exist_ok=True)
+    letters_dir.mkdir(parents=True, exist_ok=True)
+
+    num_scanned = round(num_docs * scanned_fraction)
+    source_files = []
+    for idx in range(num_docs):
+        path = source_dir / f"Record_{idx + 1:03d}.pdf"
+        pages = [_random_lines(rng, 40) for _ in range(pages_per_doc)]
+        if idx < num_scanned:
+            write_scanned_pdf(path, pages)
+        else:
+            write_text_pdf(path, pages)
+        source_files.append(path)
+
+    letter_files = []
+    for idx in range(num_letters):
+        path = letters_dir / f"letter_{idx + 1:03d}.pdf"
+        write_text_pdf(path, [_random_lines(rng, 45) for _ in range(3)])
+        letter_files.append(path)
+
+    return source_files, letter_files
+
+
+def _peak_rss_mb():
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(self_kb, children_kb) / 1024
+
+
+def _stage_extraction(source_files):
+    from utils import extract_pdf_pages
+
+    started = time.perf_counter()
+    tier_pages = {}
+    for path in source_files:
+        extraction = extract_pdf_pages(path, use_cache=False)
+        for tier, stats in extraction["tier_stats"].items():
+            tier_pages[tier] = tier_pages.get(tier, 0) + stats["pages"]
+    return {"wall_time": time.perf_counter() - started, "peak_rss_mb": _peak_rss_mb(), "tier_pages": tier_pages}
+
+
+def _stage_facts(source_files, extract_workers):
+    from openai import OpenAI
+    from llm import configure_llm_cache
+    from utils import process_source_documents
+
+    configure_llm_cache(mode="off")
+    client = OpenAI(max_retries=0)
+    started = time.perf_counter()
+    facts = process_source_documents(client, source_files, max_workers=extract_workers)
+    return {"wall_time": time.perf_counter() - started, "peak_rss_mb": _peak_rss_mb(), "facts": facts}
+
+
+def _stage_evaluation(letter_files, facts, workers, results_dir):
+    os.chdir(PROJECT_DIR)
+    from llm import configure_llm_cache
+    import main as evaluator
+
+    configure_llm_cache(mode="off")
+    started = time.perf_counter()
+    evaluations = evaluator.evaluate_letters(letter_files, facts, model="o3-2025-04-16",
+                                             max_workers=workers, results_dir=results_dir)
+    return {"wall_time": time.perf_counter() - started, "peak_rss_mb": _peak_rss_mb(),
+            "evaluated": len(evaluations)}
+
+
+def _stub_requests(base_url):
+    with urllib.request.urlopen(base_url.rsplit("/v1", 1)[0] + "/stats") as response:
+        return json.load(response)["requests"]
+
+
+def measure_startup(command, runs=5, env=None):
+    """
+    Time a fresh interpreter running one of the CLI entry points.
+
+    Args:
+        command: Arguments after `python`, e.g. ["main.py", "--help"]
+        runs: Number of runs; the median is reported
+        env: Environment of the runs
+
+    Returns:
+        Median wall time in seconds
+    """
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, *command], cwd=PROJECT_DIR, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def run_stage(name, func, *args, base_url=None):
+    """Run a stage in a fresh process and add calls/sec when it talks to the stand-in."""
+    calls_before = _stub_requests(base_url) if base_url else 0
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        result = executor.submit(func, *args).result()
+    if base_url:
+        result["calls"] = _stub_requests(base_url) - calls_before
+        result["calls_per_sec"] = result["calls"] / result["wall_time"] if result["wall_time"] else 0.0
+    logger.info(f"{name}: {result['wall_time']:.2f}s, peak RSS {result['peak_rss_mb']:.1f} MB")
+    return result
+
+
+def main():
+    """Generate a synthetic case and benchmark every stage against the stand-in."""
+    parser = argparse.ArgumentParser(description="Benchmark extraction, fact building and evaluation throughput.")
+    parser.add_argument("--docs", type=int, default=11, help="Number of synthetic source PDFs")
+    parser.add_argument("--letters", type=int, default=10, help="Number of synthetic demand letters")
+    parser.add_argument("--pages", type=int, default=3, help="Pages per source PDF")
+    parser.add_argument("--scanned-fraction", type=float, default=0.0, help="Fraction of source PDFs without a text layer (needs Pillow, poppler and tesseract)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stand-in response latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stand-in responses that fail with HTTP 500")
+    parser.add_argument("--workers", type=int, default=4, help="Letters evaluated concurrently")
+    parser.add_argument("--extract-workers", type=int, default=4, help="Source documents extracted concurrently")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Runs per startup measurement (median reported)")
+    parser.add_argument("--startup-target", type=float, default=0.5, help="Seconds a CLI start may take; the benchmark fails above it")
+    parser.add_argument("--output", help="Write the report as JSON to this path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    with tempfile.TemporaryDirectory(prefix="finch-bench-") as workdir:
+        server, base_url = start_stub_server(latency=args.latency, error_rate=args.error_rate, seed=0)
+        # Stage processes inherit these: a private cold cache and results store, and the stand-in endpoint
+        os.environ["FINCH_CACHE_DIR"] = str(Path(workdir) / "cache")
+        os.environ["FINCH_RESULTS_DB"] = str(Path(workdir) / "results.db")
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ["OPENAI_API_KEY"] = "stub"
+
+        source_files, letter_files = generate_case(Path(workdir) / "case", args.docs, args.letters,
+                                                   args.pages, args.scanned_fraction)
+        results_dir = Path(workdir) / "case" / "results"
+        results_dir.mkdir()
+
+        try:
+            report = {"config": vars(args), "stages": {}}
+            report["stages"]["extraction"] = run_stage("extraction", _stage_extraction, source_files)
+            facts_stage = run_stage("fact building", _stage_facts, source_files, args.extract_workers,
+                                    base_url=base_url)
+            facts = facts_stage.pop("facts")
+            report["stages"]["fact_building"] = facts_stage
+            report["stages"]["evaluation"] = run_stage("evaluation", _stage_evaluation, letter_files, facts,
+                                                       args.workers, str(results_dir), base_url=base_url)
+
+            # Startup: the CLI alone, and a cron-style re-run that finds every
+            # fact and result already stored and makes no API calls
+            facts_dir = Path(workdir) / "case" / "extracted_facts"
+            facts_dir.mkdir(exist_ok=True)
+            with open(facts_dir / "case_facts.json", 'w') as f:
+                json.dump(facts, f)
+            startup_commands = {
+                "main.py --help": ["main.py", "--help"],
+                "run_cases.py --help": ["run_cases.py", "--help"],
+                "main.py --compare (all cached)": ["main.py", "--data-dir", str(Path(workdir) / "case"), "--compare"],
+            }
+            report["startup"] = {name: measure_startup(command, args.startup_runs, env=os.environ.copy())
+                                 for name, command in startup_commands.items()}
+        finally:
+            server.shutdown()
+
+    print("\nStage              Wall (s)   Calls   Calls/s   Peak RSS (MB)")
+    print("---------------------------------------------------------------")
+    for name, stage in report["stages"].items():
+        calls = stage.get("calls", "-")
+        rate = f"{stage['calls_per_sec']:.2f}" if "calls_per_sec" in stage else "-"
+        print(f"{name:<18} {stage['wall_time']:>8.2f} {calls:>7} {rate:>9} {stage['peak_rss_mb']:>15.1f}")
+
+    print(f"\nStartup (median of {args.startup_runs})      Wall (s)   Target {args.startup_target:.2f}s")
+    print("---------------------------------------------------------------")
+    slow = [name for name, seconds in report["startup"].items() if seconds > args.startup_target]
+    for name, seconds in report["startup"].items():
+        print(f"{name:<32} {seconds:>8.3f}   {'FAIL' if name in slow else 'ok'}")
+    report["startup_target"] = args.startup_target
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Benchmark report saved to {args.output}")
+
+    if slow:
+        logger.error(f"Startup over the {args.startup_target:.2f}s target: {', '.join(slow)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+On-disk JSON cache shared by the Demand Letter Evaluator and the drafter
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Root folder of all on-disk caches
+CACHE_DIR = Path(os.environ.get("FINCH_CACHE_DIR", Path(__file__).resolve().parent / ".cache"))
+
+
+class DiskCache:
+    """
+    A small content-addressed cache that stores one JSON file per key.
+
+    Entries are evicted least-recently-used first once the directory grows past
+    `max_bytes`, and entries older than `ttl` seconds (if set) are treated as
+    misses. Writes are atomic, so several threads or processes can share a
+    cache directory.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, ttl=None):
+        """
+        Args:
+            directory: Folder that holds the cache entries
+            max_bytes: Total size above which the oldest entries are evicted
+            ttl: Maximum age of an entry in seconds (None = never expires)
+        """
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._size = None
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        """
+        Look up a cache entry.
+
+        Args:
+            key: Cache key (a hex digest)
+
+        Returns:
+            The stored dictionary, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            stat = path.stat()
+            if self.ttl is not None and time.time() - stat.st_mtime > self.ttl:
+                logger.debug(f"Cache entry {key} expired")
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.debug(f"Unreadable cache entry {path}: {e}")
+            return None
+
+        # Record the access so eviction keeps recently used entries. With a TTL
+        # the mtime doubles as the write time, so leave it alone.
+        if self.ttl is None:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return value
+
+    def put(self, key, value):
+        """
+        Store a cache entry, evicting old entries if the cache is over size.
+
+        Args:
+            key: Cache key (a hex digest)
+            value: JSON-serializable dictionary
+        """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(value, f)
+
+        with self._lock:
+            # An overwritten entry's old size no longer counts
+            try:
+                replaced = path.stat().st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += path.stat().st_size - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for path in self.directory.glob("*/*.json"):
+            try:
+                yield path, path.stat()
+            except FileNotFoundError:
+                continue
+
+    def _scan_size(self):
+        return sum(stat.st_size for _, stat in self._entries())
+
+    def _evict(self):
+        """Remove least-recently-used entries until the cache fits in max_bytes."""
+        entries = sorted(self._entries(), key=lambda entry: entry[1].st_mtime)
+        size = sum(stat.st_size for _, stat in entries)
+        removed = 0
+        for path, stat in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            size -= stat.st_size
+            removed += 1
+        self._size = size
+        if removed:
+            logger.debug(f"Evicted {removed} entries from {self.directory}")
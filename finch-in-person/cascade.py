@@ -0,0 +1,106 @@
+"""
+Model cascade for the Demand Letter Evaluator
+
+With a cascade configured, every letter is first scored by cheap screening
+models and only escalated to the next tier when the screening result cannot be
+trusted: its response failed to parse or left categories unscored, its
+samples disagree, or its weighted score lies close to a decision threshold. The evaluation model (`--model`) is
+the last tier. Source document chunks are likewise extracted by the cheapest
+tier first and escalated when its answer comes back empty or truncated.
+"""
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def _split(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+# Screening models tried before the evaluation model, cheapest first (empty = no cascade)
+CASCADE_MODELS = _split(os.environ.get("FINCH_CASCADE", ""))
+# Weighted scores at which a decision changes (e.g. send / revise / rewrite)
+DECISION_THRESHOLDS = [float(value) for value in _split(os.environ.get("FINCH_DECISION_THRESHOLDS", "2.5,3.5"))]
+# Screening scores this close to a decision threshold are escalated
+CASCADE_MARGIN = float(os.environ.get("FINCH_CASCADE_MARGIN", 0.25))
+# Largest difference between the samples' scores of any one category (with --samples)
+CASCADE_MAX_SPREAD = float(os.environ.get("FINCH_CASCADE_MAX_SPREAD", 1))
+# Model the first-pass fact extraction escalates to
+EXTRACTION_MODEL = "gpt-4o"
+
+
+def configure_cascade(models=None, thresholds=None, margin=None, max_spread=None):
+    """
+    Override the cascade settings for this process.
+
+    Args:
+        models: Comma-separated screening models, cheapest first ("" = no cascade)
+        thresholds: Comma-separated decision thresholds on the weighted score
+        margin: Distance from a threshold within which screening results are escalated
+        max_spread: Largest acceptable spread of the sample scores of one category
+    """
+    global CASCADE_MODELS, DECISION_THRESHOLDS, CASCADE_MARGIN, CASCADE_MAX_SPREAD
+    if models is not None:
+        CASCADE_MODELS = _split(models)
+    if thresholds is not None:
+        DECISION_THRESHOLDS = [float(value) for value in _split(thresholds)]
+    if margin is not None:
+        CASCADE_MARGIN = margin
+    if max_spread is not None:
+        CASCADE_MAX_SPREAD = max_spread
+
+
+def evaluation_tiers(model):
+    """Models a letter is evaluated with, in order: the screening models, then `model`."""
+    return [tier for tier in CASCADE_MODELS if tier != model] + [model]
+
+
+def extraction_tiers():
+    """Models a source document chunk is extracted with, in order."""
+    return [tier for tier in CASCADE_MODELS if tier != EXTRACTION_MODEL] + [EXTRACTION_MODEL]
+
+
+def cascade_settings(model):
+    """The settings that decide how a letter moves through the cascade, for fingerprinting."""
+    return {"tiers": evaluation_tiers(model), "thresholds": DECISION_THRESHOLDS, "margin": CASCADE_MARGIN,
+            "max_spread": CASCADE_MAX_SPREAD}
+
+
+def escalation_reason(result):
+    """
+    Decide whether a screening result must be checked by the next tier.
+
+    Args:
+        result: Evaluation result of a screening model
+
+    Returns:
+        Why the letter is escalated, or None if the result can be kept
+    """
+    if "error" in result:
+        return "response could not be parsed"
+    if result.get("missing_categories"):
+        return f"no score for {', '.join(result['missing_categories'])}"
+    if result.get("converged") is False:
+        return "samples disagree"
+    # Categories legitimately score anywhere from 1 to 5 within one letter; what
+    # makes a result untrustworthy is the samples disagreeing on the same category
+    for category, entry in result.get("category_scores", {}).items():
+        scores = entry.get("samples", [])
+        if scores and max(scores) - min(scores) > CASCADE_MAX_SPREAD:
+            return f"{category} samples range from {min(scores):g} to {max(scores):g}"
+    for threshold in DECISION_THRESHOLDS:
+        if abs(result["weighted_score"] - threshold) <= CASCADE_MARGIN:
+            return f"weighted score {result['weighted_score']:.2f} is within {CASCADE_MARGIN:g} of {threshold:g}"
+    return None
+
+
+def extraction_escalation_reason(response):
+    """Decide whether a screening model's fact extraction must be redone by the next tier."""
+    choice = response.choices[0]
+    if choice.finish_reason == "length":
+        return "response was truncated"
+    if not (choice.message.content or "").strip():
+        return "response was empty"
+    return None
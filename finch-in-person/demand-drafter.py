@@ -1,74 +1,254 @@
 #!/usr/bin/env python3
 import argparse
 import base64
+import io
+import json
 import mimetypes
 import os
+import time
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage
 from langchain_openai import ChatOpenAI
+from pypdf import PdfReader, PdfWriter
 
+from rate_limit import call_with_backoff
+from utils import chunk_text, count_tokens, extract_pdf_pages, file_sha256
 
-def encode_file_to_base64(file_path: str) -> tuple[str, str]:
-    """Encode a file to base64 and determine its MIME type."""
-    with open(file_path, "rb") as file:
-        base64_data = base64.b64encode(file.read()).decode("utf-8")
 
+# Read size for base64 encoding; a multiple of 3 so the chunks concatenate
+# into the same string as encoding the whole file at once
+ENCODE_CHUNK_BYTES = 3 * 1024 * 1024
+
+
+def guess_mime_type(file_path: str) -> str:
+    """Determine a file's MIME type from its name."""
     mime_type, _ = mimetypes.guess_type(file_path)
     if mime_type is None:
         # Default to binary if type can't be determined
         mime_type = "application/octet-stream"
+    return mime_type
+
+
+def encode_file_to_base64(file_path: str) -> tuple[str, str]:
+    """Encode a file to base64 and determine its MIME type."""
+    # Encode chunk by chunk so the raw bytes and the encoded copy of a large
+    # file are never held in memory at the same time
+    parts = []
+    with open(file_path, "rb") as file:
+        while chunk := file.read(ENCODE_CHUNK_BYTES):
+            parts.append(base64.b64encode(chunk).decode("ascii"))
+
+    return "".join(parts), guess_mime_type(file_path)
+
+
+# Files in a case folder that are not source documents
+EXCLUDED_FILES = {"case_metadata.json", "case_facts.json", "run_metrics.json"}
+# Folders the evaluator writes into (or that hold the letters it scores), when
+# the input folder is a case root; folders starting with "." are skipped too
+EXCLUDED_DIRS = {"extracted_facts", "results", "demand_letters", "__pycache__"}
+# Non-PDF files that are read as text; anything else (images, .docx, ...) is skipped
+TEXT_EXTENSIONS = {".txt", ".md", ".csv", ".tsv", ".json", ".xml", ".html", ".htm", ".eml"}
+
+# Maximum size of the attached document text, in tokens
+DRAFT_TOKEN_BUDGET = int(os.environ.get("FINCH_DRAFT_TOKEN_BUDGET", 100000))
+
+# Rough token counts for the rate limiter: per attached PDF, and for the letter itself
+ATTACHMENT_TOKEN_ESTIMATE = 2000
+LETTER_TOKEN_ESTIMATE = 4000
+
+DRAFT_INSTRUCTIONS = "Generate a professional demand letter based on the provided documents. The letter should be formal, assertive, and include relevant details from the documents. Format the response in markdown."
+
+
+def pdf_attachment(file_name: str, base64_data: str) -> Dict[str, Any]:
+    """Build a base64 PDF content block."""
+    return {
+        "type": "file",
+        "source_type": "base64",
+        "data": base64_data,
+        "mime_type": "application/pdf",
+        "filename": file_name,
+    }
+
+
+def failed_pages_attachment(file_path: str, page_numbers: List[int]) -> Dict[str, Any]:
+    """Attach only the given (0-based) pages of a PDF, as a smaller PDF."""
+    reader = PdfReader(file_path)
+    writer = PdfWriter()
+    for page_number in page_numbers:
+        writer.add_page(reader.pages[page_number])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+
+    pages = ", ".join(str(page_number + 1) for page_number in page_numbers)
+    file_name = f"{Path(file_path).stem} (pages {pages}).pdf"
+    return pdf_attachment(file_name, base64.b64encode(buffer.getvalue()).decode("ascii"))
+
+
+def whole_file_attachment(file_path: str) -> Dict[str, Any]:
+    """Attach an entire PDF."""
+    base64_data, _ = encode_file_to_base64(file_path)
+    return pdf_attachment(os.path.basename(file_path), base64_data)
+
 
-    return base64_data, mime_type
+def document_content(file_path: str) -> tuple[str, List[Dict[str, Any]]]:
+    """
+    Turn a source file into text plus the PDF attachments text can't replace.
 
+    PDFs go through the shared extraction pipeline (and its text cache); only
+    the pages no extraction tier could read are attached as a PDF.
+    """
+    if Path(file_path).suffix.lower() != ".pdf":
+        # Text files are sent as they are, without a base64 round trip
+        return Path(file_path).read_text(encoding="utf-8", errors="replace"), []
 
-def create_message_content(files: List[str]) -> List[Dict[str, Any]]:
-    """Create a message content list with text and files."""
-    content = [
-        {
-            "type": "text",
-            "text": "Generate a professional demand letter based on the provided documents. The letter should be formal, assertive, and include relevant details from the documents. Format the response in markdown.",
-        }
-    ]
+    extraction = extract_pdf_pages(file_path)
+    if not extraction["pages"]:
+        # Not even the page count could be read, so send the whole file
+        return "", [whole_file_attachment(file_path)]
+
+    text = "\n".join(page for page in extraction["pages"] if page.strip())
+    failed = [idx for idx, tier in enumerate(extraction["page_tiers"]) if tier == "none"]
+    if not failed:
+        return text, []
+    try:
+        return text, [failed_pages_attachment(file_path, failed)]
+    except Exception as e:
+        print(f"Could not split the unreadable pages out of {file_path} ({e}), attaching the whole file")
+        return text, [whole_file_attachment(file_path)]
+
+
+def create_message_content(
+    files: List[str],
+    case_facts: Optional[Dict[str, Any]] = None,
+    token_budget: int = DRAFT_TOKEN_BUDGET,
+) -> List[Dict[str, Any]]:
+    """
+    Create a message content list with text and files.
+
+    The consolidated case facts (if any) come first. Each document is then
+    sent as its extracted text while the token budget lasts; past the budget
+    a document is replaced by its previously extracted facts, or truncated
+    if there are none.
+    """
+    content = [{"type": "text", "text": DRAFT_INSTRUCTIONS}]
+    used = 0
+
+    case_facts = case_facts or {}
+    if case_facts.get("consolidated_summary"):
+        summary = f"# Case facts (extracted from the source documents)\n\n{case_facts['consolidated_summary']}"
+        content.append({"type": "text", "text": summary})
+        used += count_tokens(summary)
+    document_facts = case_facts.get("individual_documents", {})
 
     for file_path in files:
         file_name = os.path.basename(file_path)
-        base64_data, mime_type = encode_file_to_base64(file_path)
-
-        if mime_type == "application/pdf":
-            content.append(
-                {
-                    "type": "file",
-                    "source_type": "base64",
-                    "data": base64_data,
-                    "mime_type": mime_type,
-                    "filename": file_name,
-                }
-            )
+        text, attachments = document_content(file_path)
+        content.extend(attachments)
+        if not text.strip():
+            continue
 
-        else:
-            content.append(
-                {
-                    "type": "text",
-                    "text": base64.b64decode(base64_data).decode("utf-8"),
-                }
-            )
+        section = f"# Document: {file_name}\n\n{text}"
+        tokens = count_tokens(section)
+        if used + tokens > token_budget:
+            stem = Path(file_path).stem
+            if document_facts.get(stem):
+                print(f"{file_name} exceeds the token budget, sending its extracted facts instead")
+                section = f"# Document: {file_name} (extracted facts; full text omitted)\n\n{document_facts[stem]}"
+            elif token_budget - used > 500:
+                print(f"{file_name} exceeds the token budget, truncating it")
+                section = chunk_text(section, token_budget - used - 50)[0] + "\n\n[truncated]"
+            else:
+                print(f"Token budget exhausted, skipping {file_name}")
+                continue
+            tokens = count_tokens(section)
+        content.append({"type": "text", "text": section})
+        used += tokens
 
+    attached = sum(block["type"] == "file" for block in content)
+    print(f"Attached {used} tokens of text and {attached} PDFs")
     return content
 
 
+def estimate_content_tokens(content: List[Dict[str, Any]]) -> int:
+    """Estimate the tokens a drafting request counts against the rate limit."""
+    tokens = LETTER_TOKEN_ESTIMATE
+    for block in content:
+        if block["type"] == "text":
+            tokens += count_tokens(block["text"])
+        else:
+            tokens += ATTACHMENT_TOKEN_ESTIMATE
+    return tokens
+
+
 def get_files_from_directory(directory: str) -> List[str]:
-    """Get all files from a directory."""
+    """
+    Get the source files in a directory, skipping copies with identical content.
+
+    Only PDFs and text files (TEXT_EXTENSIONS) are returned; the evaluator's
+    own output folders and files are left out.
+    """
     files = []
-    for path in Path(directory).rglob("*"):
-        if path.is_file():
-            files.append(str(path))
+    seen = {}
+    for path in sorted(Path(directory).rglob("*")):
+        if not path.is_file() or path.name in EXCLUDED_FILES or path.name.startswith("."):
+            continue
+        folders = path.relative_to(directory).parts[:-1]
+        if any(folder in EXCLUDED_DIRS or folder.startswith(".") for folder in folders):
+            continue
+        if path.suffix.lower() != ".pdf" and path.suffix.lower() not in TEXT_EXTENSIONS:
+            print(f"Skipping {path}, not a PDF or text file")
+            continue
+        digest = file_sha256(path)
+        if digest in seen:
+            print(f"Skipping {path}, identical to {seen[digest]}")
+            continue
+        seen[digest] = path
+        files.append(str(path))
     return files
 
 
-def generate_demand_letter(input_dir: str, output_file: str) -> None:
+def find_case_facts(input_dir: str) -> Optional[Dict[str, Any]]:
+    """Load case_facts.json from the input folder or the case's extracted_facts/ folder."""
+    input_path = Path(input_dir)
+    for facts_file in (
+        input_path / "case_facts.json",
+        input_path.parent / "extracted_facts" / "case_facts.json",
+    ):
+        if facts_file.exists():
+            print(f"Using extracted facts from {facts_file}")
+            with open(facts_file, "r") as f:
+                return json.load(f)
+    return None
+
+
+def stream_to_file(model: ChatOpenAI, messages: List[HumanMessage], output_file: str) -> None:
+    """Write the completion to the output file token by token as it arrives."""
+    started = time.perf_counter()
+    first_token_at = None
+    with open(output_file, "w") as f:
+        for chunk in model.stream(messages):
+            text = chunk.content if isinstance(chunk.content, str) else str(chunk.content)
+            if not text:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                print(f"First token after {first_token_at - started:.1f}s")
+            f.write(text)
+            # Flush so the letter can be followed while it is being written
+            f.flush()
+    print(f"Completion streamed in {time.perf_counter() - started:.1f}s")
+
+
+def generate_demand_letter(
+    input_dir: str,
+    output_file: str,
+    stream: bool = False,
+    token_budget: int = DRAFT_TOKEN_BUDGET,
+    facts_file: Optional[str] = None,
+) -> None:
     """Generate a demand letter based on files in the input directory."""
     # Load environment variables
     load_dotenv()
@@ -85,21 +265,38 @@ def generate_demand_letter(input_dir: str, output_file: str) -> None:
 
     print(f"Found {len(files)} files in {input_dir}")
 
+    # Reuse the facts the evaluator already extracted for this case
+    if facts_file:
+        with open(facts_file, "r") as f:
+            case_facts = json.load(f)
+    else:
+        case_facts = find_case_facts(input_dir)
+
     # Create message content
-    message_content = create_message_content(files)
+    message_content = create_message_content(files, case_facts, token_budget=token_budget)
 
-    # Initialize OpenAI client - passing max_tokens through model_kwargs
-    model = ChatOpenAI(model="gpt-4.1")
+    # Initialize OpenAI client; retries are left to the shared rate limiter
+    model = ChatOpenAI(model="gpt-4.1", max_retries=0)
+    estimated_tokens = estimate_content_tokens(message_content)
 
     # Call the API
     print("Generating demand letter...")
     human_message = HumanMessage(content=message_content)  # type: ignore
-    response = model([human_message])
+    # The message holds its own reference to the attachments
+    del message_content
 
     # Save the result to output file
     output_path = Path(output_file)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
+    if stream:
+        # A failed attempt is retried from the start, overwriting the partial letter
+        call_with_backoff(lambda: stream_to_file(model, [human_message], output_file), tokens=estimated_tokens)
+        print(f"Demand letter successfully generated and saved to {output_file}")
+        return
+
+    response = call_with_backoff(lambda: model.invoke([human_message]), tokens=estimated_tokens)
+
     # Extract the content as a string
     response_content = response.content
     if not isinstance(response_content, str):
@@ -118,10 +315,31 @@ def main():
     )
     parser.add_argument("input_dir", help="Directory containing the input files")
     parser.add_argument("output_file", help="Path to save the output markdown file")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Write the letter to the output file as it is generated",
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=DRAFT_TOKEN_BUDGET,
+        help="Maximum tokens of document text to send (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--facts",
+        help="case_facts.json to include (default: found next to the input directory)",
+    )
 
     args = parser.parse_args()
 
-    generate_demand_letter(args.input_dir, args.output_file)
+    generate_demand_letter(
+        args.input_dir,
+        args.output_file,
+        stream=args.stream,
+        token_budget=args.token_budget,
+        facts_file=args.facts,
+    )
 
 
 if __name__ == "__main__":
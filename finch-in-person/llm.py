@@ -0,0 +1,158 @@
+"""
+Shared wrapper around OpenAI chat completion calls for the Demand Letter Evaluator
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+from cache import CACHE_DIR, DiskCache
+from metrics import record_call
+from rate_limit import call_with_backoff, estimate_request_tokens, get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# Response cache settings. Modes:
+#   on     – reuse recorded responses, record new ones
+#   off    – always call the API
+#   replay – only serve recorded responses; a miss raises LLMCacheMiss
+LLM_CACHE_MODES = ("on", "off", "replay")
+LLM_CACHE_MODE = os.environ.get("FINCH_LLM_CACHE", "on")
+LLM_CACHE_TTL = int(os.environ.get("FINCH_LLM_CACHE_TTL", 30 * 24 * 3600))
+LLM_CACHE_MAX_BYTES = int(os.environ.get("FINCH_LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+_llm_cache = DiskCache(CACHE_DIR / "llm", max_bytes=LLM_CACHE_MAX_BYTES, ttl=LLM_CACHE_TTL)
+
+
+class LLMCacheMiss(RuntimeError):
+    """Raised in replay mode when no recorded response matches a request."""
+
+
+def configure_llm_cache(mode=None, ttl=None, max_bytes=None):
+    """
+    Override the response cache settings for this process.
+
+    Args:
+        mode: One of LLM_CACHE_MODES
+        ttl: Maximum age of a recorded response in seconds
+        max_bytes: Size above which the oldest responses are evicted
+    """
+    global LLM_CACHE_MODE
+    if mode is not None:
+        if mode not in LLM_CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode: {mode}")
+        LLM_CACHE_MODE = mode
+    if ttl is not None:
+        _llm_cache.ttl = ttl
+    if max_bytes is not None:
+        _llm_cache.max_bytes = max_bytes
+
+
+def request_key(**request):
+    """
+    Build the cache key of a chat completion request.
+
+    The key covers the model, the messages and every sampling parameter, so
+    any change to the request is a cache miss.
+    """
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def chat_completion(client, stage="other", sample=0, refresh=False, **request):
+    """
+    Call `client.chat.completions.create`, going through the response cache.
+
+    Responses are recorded per endpoint: the client's base URL is part of the
+    cache key, so responses recorded from a stub or alternate endpoint are
+    never served to runs against another one.
+
+    API calls go through the shared rate limiter, which also retries transient
+    failures. Every call is recorded in the run metrics under `stage`, with its
+    latency, token usage and the number of retries it needed.
+
+    Args:
+        client: OpenAI client
+        stage: Pipeline stage the call belongs to (for the run metrics)
+        sample: Index of an independent sample of the same request; each
+            sample is recorded under its own cache key, so repeated samples
+            are not all served the first recorded response
+        refresh: Call the API even if a response is recorded, and record the
+            new response in its place (ignored in replay mode)
+        **request: Arguments for `chat.completions.create` (model, messages, ...)
+
+    Returns:
+        ChatCompletion response (recorded or fresh)
+    """
+    model = request.get("model")
+    if LLM_CACHE_MODE != "off":
+        scope = {"endpoint": str(getattr(client, "base_url", ""))}
+        if sample:
+            scope["sample"] = sample
+        key = request_key(**scope, **request)
+        cached = None if refresh and LLM_CACHE_MODE == "on" else _llm_cache.get(key)
+        if cached is not None:
+            logger.debug(f"LLM cache hit for {model} ({key[:12]})")
+            record_call(stage, model, cache_hit=True)
+            from openai.types.chat import ChatCompletion
+            # A replayed response cost nothing in this run, so it carries no usage
+            return ChatCompletion.model_validate(dict(cached["response"], usage=None))
+
+        if LLM_CACHE_MODE == "replay":
+            raise LLMCacheMiss(f"No recorded response for {model} request {key[:12]}")
+
+    estimated = estimate_request_tokens(request)
+    retries = 0
+
+    def count_retry(error, delay):
+        nonlocal retries
+        retries += 1
+
+    started = time.perf_counter()
+    try:
+        # The raw response exposes the rate limit headers
+        raw = call_with_backoff(lambda: client.chat.completions.with_raw_response.create(**request),
+                                tokens=estimated, on_retry=count_retry)
+        response = raw.parse()
+    except Exception:
+        record_call(stage, model, seconds=time.perf_counter() - started, retries=retries, error=True)
+        raise
+    usage = usage_from_response(response)
+    limiter = get_rate_limiter()
+    limiter.settle(estimated, usage["prompt_tokens"] + usage["completion_tokens"])
+    limiter.update_from_headers(raw.headers)
+    record_call(stage, model, usage, seconds=time.perf_counter() - started, retries=retries)
+
+    if LLM_CACHE_MODE != "off":
+        _llm_cache.put(key, {"model": model, "response": response.model_dump(mode="json")})
+    return response
+
+
+def usage_from_response(response):
+    """
+    Summarize the token usage of a chat completion response.
+
+    Args:
+        response: ChatCompletion response
+
+    Returns:
+        Dictionary with prompt_tokens, completion_tokens and cached_tokens
+        (prompt tokens served from the provider's prompt cache)
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens or 0,
+        "completion_tokens": usage.completion_tokens or 0,
+        "cached_tokens": (getattr(details, "cached_tokens", None) or 0) if details else 0,
+    }
+
+
+def add_usage(total, usage):
+    """Add one usage summary into another, in place, and return it."""
+    for key, value in usage.items():
+        total[key] = total.get(key, 0) + value
+    return total
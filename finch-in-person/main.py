@@ -5,62 +5,120 @@ Evaluates legal demand letters against source documents using OpenAI GPT models.
 """
 
 import os
+import re
 import json
+import math
+import hashlib
 import argparse
+import statistics
+import time
 from pathlib import Path
 import logging
-from openai import OpenAI
-from jinja2 import Environment, FileSystemLoader
-from utils import extract_text_from_pdf, process_source_documents, calculate_weighted_score
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from batch_api import TERMINAL_STATUSES, collect_batch_results, load_batch_state, save_batch_state, submit_batch, wait_for_batch, write_batch_file
+from cascade import cascade_settings, configure_cascade, escalation_reason, evaluation_tiers
+from llm import add_usage, chat_completion, configure_llm_cache, request_key, usage_from_response
+from metrics import log_summary, record_call, record_cascade_tier, stage_timer, write_prometheus_textfile, write_report
+from precheck import PRECHECK_MODES, configure_precheck, precheck_letter
+from rate_limit import configure_rate_limits
+from results_store import ResultsStore, case_id_for, configure_results_store, get_results_store
+from retrieval import EVIDENCE_MODES, configure_retrieval, evidence_passages, summary_needed
+from utils import CATEGORY_WEIGHTS, canonical_category, documents_changed, extract_text_from_pdf, process_source_documents, calculate_weighted_score, configure_ocr, consolidate_facts
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = OpenAI()
+# Self-consistency sampling: the first MIN_SAMPLES evaluations of a letter are
+# requested together, then SAMPLE_ROUND more at a time until the standard error
+# of every category's mean score is at most SAMPLE_TOLERANCE. Two samples within
+# a point of each other already meet the tolerance, so agreement needs three.
+MIN_SAMPLES = 3
+SAMPLE_ROUND = 2
+SAMPLE_TOLERANCE = 0.5
 
-def setup_folders():
+@lru_cache(maxsize=None)
+def get_client():
+    """
+    Create the OpenAI client on first use.
+    
+    The openai package is slow to import, so it is only loaded once a stage
+    actually calls the API. Every caller shares the one client and its
+    connection pool. The client's own retries are disabled; the shared rate
+    limiter retries instead, so backoff is coordinated across threads.
+    """
+    from openai import OpenAI
+    return OpenAI(max_retries=0)
+
+def setup_folders(data_dir="data"):
     """Create necessary folders if they don't exist."""
     folders = [
-        "data/source_documents",
-        "data/demand_letters",
-        "data/extracted_facts",
-        "data/results"
+        "source_documents",
+        "demand_letters",
+        "extracted_facts",
+        "results"
     ]
     
     for folder in folders:
-        Path(folder).mkdir(parents=True, exist_ok=True)
+        (Path(data_dir) / folder).mkdir(parents=True, exist_ok=True)
         
     logger.info("Folder structure verified.")
 
-def extract_facts_from_source_documents(force_reprocess=False):
+def extract_facts_from_source_documents(force_reprocess=False, max_workers=1, token_budget=None, data_dir="data"):
     """
     Process source documents to extract key facts.
     
     Args:
-        force_reprocess: If True, reprocess documents even if facts already exist
+        force_reprocess: If True, reprocess every document even if facts already exist;
+            otherwise only added or changed documents are re-extracted
+        max_workers: Number of source documents to extract concurrently
+        token_budget: Maximum prompt size in tokens for extraction and consolidation
+        data_dir: Case folder holding source_documents/ and extracted_facts/
     
     Returns:
         Dictionary of extracted facts
     """
-    facts_file = Path("data/extracted_facts/case_facts.json")
+    source_docs_path = Path(data_dir) / "source_documents"
+    facts_file = Path(data_dir) / "extracted_facts" / "case_facts.json"
     
     # Check if facts.json already exists and can be loaded directly
     if facts_file.exists() and not force_reprocess:
         logger.info("Loading existing extracted facts.")
+        facts = None
         try:
             with open(facts_file, 'r') as f:
-                return json.load(f)
+                facts = json.load(f)
         except Exception as e:
             logger.error(f"Error loading existing facts file: {e}")
             # Continue to reprocess if loading fails
+        
+        if facts is not None:
+            # Facts extracted from PDFs carry per-document fingerprints, so only
+            # documents added or changed since then need to be re-extracted
+            source_files = sorted(source_docs_path.glob("*.pdf"))
+            if "document_fingerprints" not in facts or not source_files:
+                return facts
+            if not documents_changed(source_files, facts):
+                logger.info("Source documents unchanged since the facts were extracted")
+                return facts
+            
+            try:
+                updated = process_source_documents(get_client(), source_files, max_workers=max_workers,
+                                                   previous_facts=facts, token_budget=token_budget)
+            except Exception as e:
+                logger.error(f"Error updating extracted facts, using existing facts: {e}")
+                return facts
+            
+            if updated != facts:
+                with open(facts_file, 'w') as f:
+                    json.dump(updated, f, indent=2)
+                logger.info(f"Updated extracted facts saved to {facts_file}")
+            return updated
     
     # Handle the case where we have a JSON file directly
-    if Path("data/source_documents/facts.json").exists():
+    if (source_docs_path / "facts.json").exists():
         logger.info("Found facts.json in source_documents, using it directly.")
         try:
-            with open(Path("data/source_documents/facts.json"), 'r') as f:
+            with open(source_docs_path / "facts.json", 'r') as f:
                 facts = json.load(f)
             
             # Save to extracted_facts location
@@ -73,7 +131,7 @@ def extract_facts_from_source_documents(force_reprocess=False):
             # Continue to standard processing if this fails
     
     # Check if we have a plain text file with facts
-    text_facts = list(Path("data/source_documents").glob("*.txt"))
+    text_facts = list(source_docs_path.glob("*.txt"))
     if text_facts:
         logger.info(f"Found {len(text_facts)} text files in source_documents, processing them.")
         facts = {"consolidated_summary": "", "individual_documents": {}}
@@ -105,18 +163,8 @@ def extract_facts_from_source_documents(force_reprocess=False):
         if facts["individual_documents"] and not facts["consolidated_summary"]:
             try:
                 # Generate a consolidated summary using OpenAI
-                docs_summary = "\n\n".join([f"## {doc_name}\n{content}" for doc_name, content in facts["individual_documents"].items()])
-                
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
-                        {"role": "system", "content": "You are a legal assistant who summarizes and organizes case facts for personal injury demand letters."},
-                        {"role": "user", "content": f"Based on these extracted facts from multiple documents, create a consolidated and organized summary of the most important facts for this case. Organize by categories like incident details, injuries, treatment, damages, etc.\n\n{docs_summary}"}
-                    ],
-                    temperature=0.2
-                )
-                
-                facts["consolidated_summary"] = response.choices[0].message.content
+                facts["consolidated_summary"] = consolidate_facts(get_client(), facts["individual_documents"],
+                                                                  token_budget=token_budget, max_workers=max_workers)
                 logger.info("Generated consolidated summary from individual documents")
             except Exception as e:
                 logger.error(f"Error generating consolidated summary: {e}")
@@ -131,11 +179,10 @@ def extract_facts_from_source_documents(force_reprocess=False):
     
     # Standard processing for PDF files
     logger.info("Processing source documents to extract key facts.")
-    source_docs_path = Path("data/source_documents")
-    source_files = list(source_docs_path.glob("*.pdf"))
+    source_files = sorted(source_docs_path.glob("*.pdf"))
     
     if not source_files:
-        logger.warning("No source documents found in data/source_documents/")
+        logger.warning(f"No source documents found in {source_docs_path}/")
         # Create a minimal facts dictionary
         facts = {
             "consolidated_summary": "No source documents were available for processing.",
@@ -150,7 +197,7 @@ def extract_facts_from_source_documents(force_reprocess=False):
     
     # Process source documents using OpenAI
     try:
-        facts = process_source_documents(client, source_files)
+        facts = process_source_documents(get_client(), source_files, max_workers=max_workers, token_budget=token_budget)
         
         # Save extracted facts
         with open(facts_file, 'w') as f:
@@ -172,26 +219,35 @@ def extract_facts_from_source_documents(force_reprocess=False):
         
         return facts
 
-def evaluate_demand_letter(letter_path, facts, model="gpt-4o"):
+@lru_cache(maxsize=None)
+def get_evaluation_template():
+    """Load and compile the evaluation prompt template."""
+    from jinja2 import Environment, FileSystemLoader
+    
+    env = Environment(loader=FileSystemLoader(Path(__file__).resolve().parent / "templates"))
+    return env.get_template("evaluation_prompt.j2")
+
+def build_evaluation_request(letter_path, facts, model="gpt-4o", case_dir=None):
     """
-    Evaluate a single demand letter using the GPT model.
+    Render the evaluation prompt for a demand letter.
+    
+    With a case folder, the source passages most relevant to the letter are
+    retrieved from the case's index and included as evidence (see retrieval.py).
     
     Args:
         letter_path: Path to the demand letter PDF
         facts: Dictionary of extracted facts from source documents
         model: OpenAI model to use for evaluation
+        case_dir: Case folder the letter belongs to (None = summary only)
     
     Returns:
-        Evaluation results as a dictionary
+        Keyword arguments for a chat completion request
     """
-    logger.info(f"Evaluating demand letter: {letter_path}")
-    
     # Extract text from the demand letter
     letter_text = extract_text_from_pdf(letter_path)
     
-    # Load the evaluation template
-    env = Environment(loader=FileSystemLoader("templates"))
-    template = env.get_template("evaluation_prompt.j2")
+    # Load the evaluation template (compiled once per run)
+    template = get_evaluation_template()
     
     # Prepare facts for the template
     facts_text = facts.get("consolidated_summary", "No consolidated facts available.")
@@ -199,53 +255,130 @@ def evaluate_demand_letter(letter_path, facts, model="gpt-4o"):
     # Debug the facts
     logger.debug(f"Facts for evaluation: {facts_text[:500]}...")
     
+    # Passages depend on the letter, so they follow the shared prefix
+    passages_text = evidence_passages(case_dir, letter_text) if case_dir is not None else ""
+    
     # Render the prompt
     prompt = template.render(
-        source_document_facts=facts_text,
-        demand_letter_content=letter_text
+        source_document_facts=facts_text if summary_needed(passages_text) else "",
+        source_passages=passages_text,
+        demand_letter_content=letter_text,
+        structured_output=True,
+        categories=list(CATEGORY_WEIGHTS)
     )
     
-    # Call OpenAI API with a stronger system message for critical evaluation
-    logger.info(f"Submitting evaluation to {model}")
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
+    # Use a stronger system message for critical evaluation. The system message,
+    # rubric and case facts are identical for every letter in a case, so they
+    # form a shared prefix the provider can serve from its prompt cache.
+    # The retrieved passages and the letter come after it.
+    return {
+        "model": model,
+        "prompt_cache_key": f"finch-eval-{hashlib.sha256(facts_text.encode('utf-8')).hexdigest()[:16]}",
+        "messages": [
             {"role": "system", "content": "You are an expert legal evaluator who specializes in assessing demand letters for personal injury cases. You have a reputation for being thorough, critical, and having very high standards. You should be strict in your evaluation and only give high scores when fully warranted by exceptional work. Apply the critical failure conditions rigorously."},
             {"role": "user", "content": prompt}
         ],
-    )
+        "response_format": evaluation_response_format(list(CATEGORY_WEIGHTS)),
+    }
+
+def evaluation_response_format(categories):
+    """
+    Build a JSON-schema response format that requires a score per category.
     
-    # Parse and return the evaluation results
-    try:
-        evaluation_text = response.choices[0].message.content
+    Args:
+        categories: Category names the response must contain
+    
+    Returns:
+        `response_format` argument for a chat completion request
+    """
+    category_schema = {
+        "type": "object",
+        "properties": {
+            "score": {"type": "integer", "enum": [1, 2, 3, 4, 5]},
+            "explanation": {"type": "string"}
+        },
+        "required": ["score", "explanation"],
+        "additionalProperties": False
+    }
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "demand_letter_evaluation",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {category: category_schema for category in categories},
+                "required": list(categories),
+                "additionalProperties": False
+            }
+        }
+    }
+
+def _parse_json_scores(evaluation_text):
+    """Read category scores from a JSON evaluation, skipping invalid entries."""
+    data = json.loads(evaluation_text)
+    if not isinstance(data, dict):
+        raise ValueError("Evaluation is not a JSON object")
+    
+    scores = {}
+    for category_raw, entry in data.items():
+        category = canonical_category(category_raw)
+        if category is None or not isinstance(entry, dict):
+            continue
+        score = entry.get("score")
+        if isinstance(score, int) and not isinstance(score, bool) and 1 <= score <= 5:
+            scores[category] = {"score": score, "explanation": str(entry.get("explanation", "")).strip()}
+    return scores
+
+def _parse_text_scores(evaluation_text):
+    """Read category scores from a free-text "Category: score - explanation" evaluation."""
+    # This handles various response formats from the model
+    lines = evaluation_text.strip().split('\n')
+    scores = {}
+    
+    for i, line in enumerate(lines):
+        # Look for lines with category names and scores
+        if ':' not in line:
+            continue
+        category_raw, rest = line.split(':', 1)
+        category = canonical_category(category_raw)
         
-        # Extract scores and explanations with improved parsing
-        # This handles various response formats from the model
-        lines = evaluation_text.strip().split('\n')
-        scores = {}
+        # Find the score (1-5)
+        score_match = re.search(r'\b[1-5]\b', rest)
         
-        for i, line in enumerate(lines):
-            # Look for lines with category names and scores
-            if ':' in line:
-                category, rest = line.split(':', 1)
-                
-                # Clean up the category name
-                category = category.strip()
-                
-                # Find the score (1-5)
-                import re
-                score_match = re.search(r'\b[1-5]\b', rest)
-                
-                if score_match:
-                    score = int(score_match.group(0))
-                    # Get explanation - everything after the score
-                    explanation_text = rest[score_match.end():].strip(' -')
-                    
-                    # If explanation is empty, look for it in the next line
-                    if not explanation_text and i+1 < len(lines):
-                        explanation_text = lines[i+1].strip()
-                    
-                    scores[category] = {"score": score, "explanation": explanation_text}
+        if category and score_match:
+            score = int(score_match.group(0))
+            # Get explanation - everything after the score
+            explanation_text = rest[score_match.end():].strip(' -')
+            
+            # If explanation is empty, look for it in the next line
+            if not explanation_text and i+1 < len(lines):
+                explanation_text = lines[i+1].strip()
+            
+            scores[category] = {"score": score, "explanation": explanation_text}
+    return scores
+
+def parse_evaluation_response(evaluation_text, letter_path, model="gpt-4o"):
+    """
+    Parse the model's evaluation into category scores and a weighted score.
+    
+    Structured (JSON) evaluations are expected; free-text evaluations in the
+    "Category: score - explanation" layout are still understood.
+    
+    Args:
+        evaluation_text: Content of the model's response
+        letter_path: Path to the evaluated demand letter PDF
+        model: OpenAI model that produced the evaluation
+    
+    Returns:
+        Evaluation results as a dictionary; `missing_categories` lists the
+        weighted categories without a valid score
+    """
+    try:
+        try:
+            scores = _parse_json_scores(evaluation_text)
+        except ValueError:
+            scores = _parse_text_scores(evaluation_text)
         
         # Calculate weighted score
         weighted_score = calculate_weighted_score(scores)
@@ -255,6 +388,7 @@ def evaluate_demand_letter(letter_path, facts, model="gpt-4o"):
             "model_used": model,
             "category_scores": scores,
             "weighted_score": weighted_score,
+            "missing_categories": [category for category in CATEGORY_WEIGHTS if category not in scores],
             "full_evaluation": evaluation_text
         }
         
@@ -265,97 +399,721 @@ def evaluate_demand_letter(letter_path, facts, model="gpt-4o"):
         return {
             "letter_name": os.path.basename(letter_path),
             "error": str(e),
-            "full_response": response.choices[0].message.content
+            "full_response": evaluation_text
         }
 
+def reask_missing_categories(result, request, max_reasks=2, refresh=False):
+    """
+    Ask the model again for only the categories missing from an evaluation.
+    
+    The follow-up continues the original conversation and requests a JSON
+    object containing just the missing categories, so a malformed response
+    costs a short completion instead of a full re-evaluation.
+    
+    Args:
+        result: Evaluation result from parse_evaluation_response
+        request: The chat completion request that produced the evaluation
+        max_reasks: Maximum number of follow-up requests
+        refresh: Bypass the response cache (see llm.chat_completion)
+    
+    Returns:
+        The updated evaluation result
+    """
+    if "error" in result:
+        return result
+    
+    messages = list(request["messages"]) + [{"role": "assistant", "content": result["full_evaluation"]}]
+    reasks = 0
+    while result["missing_categories"] and reasks < max_reasks:
+        missing = result["missing_categories"]
+        reasks += 1
+        logger.warning(f"{result['letter_name']}: re-asking for {', '.join(missing)}")
+        
+        messages.append({"role": "user", "content": f"Your evaluation did not include a valid score for: {', '.join(missing)}. Evaluate only these categories and respond with a JSON object containing only them, each with an integer \"score\" (1-5) and a one-sentence \"explanation\"."})
+        try:
+            response = chat_completion(
+                get_client(),
+                stage="evaluation",
+                model=request["model"],
+                messages=messages,
+                response_format=evaluation_response_format(missing),
+                refresh=refresh
+            )
+            reask_text = response.choices[0].message.content
+            if "usage" in result:
+                add_usage(result["usage"], usage_from_response(response))
+            reask_scores = _parse_json_scores(reask_text)
+        except Exception as e:
+            logger.error(f"Error re-asking for missing categories: {e}")
+            break
+        messages.append({"role": "assistant", "content": reask_text})
+        
+        for category in missing:
+            if category in reask_scores:
+                result["category_scores"][category] = reask_scores[category]
+        result["missing_categories"] = [category for category in CATEGORY_WEIGHTS if category not in result["category_scores"]]
+    
+    if reasks:
+        result["reasks"] = reasks
+        result["weighted_score"] = calculate_weighted_score(result["category_scores"])
+    if result["missing_categories"]:
+        logger.warning(f"{result['letter_name']}: no valid score for {', '.join(result['missing_categories'])}")
+    return result
+
+def _evaluate_sample(letter_path, model, request, sample=0, refresh=False):
+    """Run one evaluation of a letter and fill in any missing categories."""
+    response = chat_completion(get_client(), stage="evaluation", sample=sample, refresh=refresh, **request)
+    result = parse_evaluation_response(response.choices[0].message.content, letter_path, model=model)
+    result["usage"] = usage_from_response(response)
+    return reask_missing_categories(result, request, refresh=refresh)
+
+def scores_converged(samples, tolerance=SAMPLE_TOLERANCE):
+    """
+    Check whether the samples agree on every category.
+    
+    Args:
+        samples: Evaluation results of the same letter
+        tolerance: Largest acceptable standard error of a category's mean score
+    
+    Returns:
+        True if every category has at least MIN_SAMPLES scores and the
+        standard error of their mean is within `tolerance`
+    """
+    for category in CATEGORY_WEIGHTS:
+        scores = [sample["category_scores"][category]["score"] for sample in samples
+                  if category in sample["category_scores"]]
+        if len(scores) < MIN_SAMPLES or statistics.stdev(scores) / math.sqrt(len(scores)) > tolerance:
+            return False
+    return True
+
+def sample_count(value):
+    """Parse a --samples value; counts between 1 and MIN_SAMPLES could never converge."""
+    samples = int(value)
+    if samples < 1 or 1 < samples < MIN_SAMPLES:
+        raise argparse.ArgumentTypeError(f"must be 1 or at least {MIN_SAMPLES}, got {samples}")
+    return samples
+
+def combine_samples(samples, letter_path, model="gpt-4o"):
+    """
+    Average several evaluations of the same letter into one result.
+    
+    Args:
+        samples: Evaluation results of the same letter (without errors)
+        letter_path: Path to the evaluated demand letter PDF
+        model: OpenAI model that produced the evaluations
+    
+    Returns:
+        Evaluation result with the mean score per category, the variance of
+        each category's scores, and the weighted score of every sample
+    """
+    category_scores = {}
+    category_variance = {}
+    for category in CATEGORY_WEIGHTS:
+        entries = [sample["category_scores"][category] for sample in samples if category in sample["category_scores"]]
+        if not entries:
+            continue
+        scores = [entry["score"] for entry in entries]
+        mean = statistics.fmean(scores)
+        # Keep the explanation of the sample closest to the consensus
+        closest = min(entries, key=lambda entry: abs(entry["score"] - mean))
+        category_scores[category] = {"score": round(mean, 2), "explanation": closest["explanation"], "samples": scores}
+        category_variance[category] = round(statistics.variance(scores), 3) if len(scores) > 1 else 0.0
+    
+    usage = {}
+    for sample in samples:
+        add_usage(usage, sample.get("usage", {}))
+    result = {
+        "letter_name": os.path.basename(letter_path),
+        "model_used": model,
+        "category_scores": category_scores,
+        "weighted_score": calculate_weighted_score(category_scores),
+        "missing_categories": [category for category in CATEGORY_WEIGHTS if category not in category_scores],
+        "samples": len(samples),
+        "sample_weighted_scores": [round(sample["weighted_score"], 3) for sample in samples],
+        "category_variance": category_variance,
+        "full_evaluation": samples[0]["full_evaluation"],
+        "usage": usage
+    }
+    reasks = sum(sample.get("reasks", 0) for sample in samples)
+    if reasks:
+        result["reasks"] = reasks
+    return result
+
+def evaluate_with_samples(letter_path, model, request, max_samples, tolerance=SAMPLE_TOLERANCE, refresh=False):
+    """
+    Evaluate a letter several times and average the category scores.
+    
+    MIN_SAMPLES evaluations are requested concurrently; further rounds of
+    SAMPLE_ROUND concurrent evaluations follow only while the samples disagree
+    (see scores_converged), up to `max_samples`. Samples that fail are left
+    out of the average.
+    
+    Args:
+        letter_path: Path to the demand letter PDF
+        model: OpenAI model to use for evaluation
+        request: Rendered evaluation request
+        max_samples: Maximum number of evaluations
+        tolerance: Largest acceptable standard error of a category's mean score
+        refresh: Bypass the response cache (see llm.chat_completion)
+    
+    Returns:
+        The combined evaluation result (see combine_samples), with `converged`
+        telling whether the samples agreed before `max_samples` was reached,
+        or the first error if no sample succeeded
+    """
+    def evaluate_round(start, count):
+        # A failed sample is logged and skipped so the others still count
+        results = {}
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            futures = {executor.submit(_evaluate_sample, letter_path, model, request, sample, refresh): sample
+                       for sample in range(start, start + count)}
+            for future in as_completed(futures):
+                sample = futures[future]
+                try:
+                    results[sample] = future.result()
+                except Exception as e:
+                    logger.error(f"{os.path.basename(letter_path)}: sample {sample} failed: {e}")
+                    results[sample] = {"letter_name": os.path.basename(letter_path), "error": str(e)}
+        return [results[sample] for sample in sorted(results)]
+    
+    results = evaluate_round(0, min(MIN_SAMPLES, max_samples))
+    samples = [result for result in results if "error" not in result]
+    
+    taken = len(results)
+    while taken < max_samples and not scores_converged(samples, tolerance):
+        round_results = evaluate_round(taken, min(SAMPLE_ROUND, max_samples - taken))
+        taken += len(round_results)
+        samples += [result for result in round_results if "error" not in result]
+    
+    if not samples:
+        return results[0]
+    result = combine_samples(samples, letter_path, model=model)
+    result["converged"] = scores_converged(samples, tolerance)
+    logger.info(f"{result['letter_name']}: {len(samples)} samples, weighted score {result['weighted_score']:.2f}"
+                + ("" if result["converged"] else f" (not converged after {max_samples})"))
+    return result
+
+def evaluation_fingerprint(request, samples=1, tolerance=SAMPLE_TOLERANCE):
+    """Hash the inputs of an evaluation: the rendered request and, when sampling or cascading, their settings."""
+    settings = {}
+    if samples > 1:
+        settings["sampling"] = {"max_samples": samples, "tolerance": tolerance}
+    if len(evaluation_tiers(request["model"])) > 1:
+        settings["cascade"] = cascade_settings(request["model"])
+    return request_key(**settings, **request)
+
+def evaluate_demand_letter(letter_path, facts, model="gpt-4o", request=None, samples=1, tolerance=SAMPLE_TOLERANCE,
+                           refresh=False):
+    """
+    Evaluate a single demand letter using the GPT model.
+    
+    Args:
+        letter_path: Path to the demand letter PDF
+        facts: Dictionary of extracted facts from source documents
+        model: OpenAI model to use for evaluation
+        request: Already rendered evaluation request, if the caller has one
+        samples: Maximum number of evaluations to average (1 = a single pass)
+        tolerance: Largest acceptable standard error of a category's mean
+            score before sampling stops early
+        refresh: Call the API even if the responses are cached (--force)
+    
+    Returns:
+        Evaluation results as a dictionary
+    """
+    logger.info(f"Evaluating demand letter: {letter_path}")
+    
+    if request is None:
+        request = build_evaluation_request(letter_path, facts, model=model)
+    
+    # Call OpenAI API
+    logger.info(f"Submitting evaluation to {model}")
+    if samples > 1:
+        result = evaluate_with_samples(letter_path, model, request, samples, tolerance, refresh=refresh)
+    else:
+        result = _evaluate_sample(letter_path, model, request, refresh=refresh)
+    result["input_fingerprint"] = evaluation_fingerprint(request, samples, tolerance)
+    return result
+
+def evaluate_cascade(letter_path, facts, model="gpt-4o", request=None, samples=1, tolerance=SAMPLE_TOLERANCE,
+                     refresh=False):
+    """
+    Evaluate a letter with the model cascade (see cascade.py).
+    
+    The screening models evaluate the letter first, cheapest first; the
+    letter moves on to the next tier only while escalation_reason finds the
+    result untrustworthy. `model` is the last tier and its result is final.
+    
+    Args:
+        letter_path: Path to the demand letter PDF
+        facts: Dictionary of extracted facts from source documents
+        model: OpenAI model of the last tier
+        request: Already rendered evaluation request, if the caller has one
+        samples: Maximum number of evaluations to average per tier
+        tolerance: Agreement needed to stop sampling early
+        refresh: Call the API even if the responses are cached (--force)
+    
+    Returns:
+        Evaluation result of the tier that settled the letter, with every
+        tier's score and escalation reason under `cascade`
+    """
+    if request is None:
+        request = build_evaluation_request(letter_path, facts, model=model)
+    
+    tiers = evaluation_tiers(model)
+    steps = []
+    for tier, tier_model in enumerate(tiers):
+        started = time.perf_counter()
+        result = evaluate_demand_letter(letter_path, facts, model=tier_model, request=dict(request, model=tier_model),
+                                        samples=samples, tolerance=tolerance, refresh=refresh)
+        reason = escalation_reason(result) if tier < len(tiers) - 1 else None
+        record_cascade_tier("evaluation", tier_model, result.get("usage"), time.perf_counter() - started,
+                            calls=result.get("samples", 1) + result.get("reasks", 0), escalated=reason is not None)
+        steps.append({"model": tier_model, "weighted_score": result.get("weighted_score"), "escalation_reason": reason})
+        if reason is None:
+            break
+        logger.info(f"{letter_path.name}: escalating from {tier_model} ({reason})")
+    
+    result["cascade"] = steps
+    result["input_fingerprint"] = evaluation_fingerprint(request, samples, tolerance)
+    return result
+
+def load_reusable_evaluation(letter_path, fingerprint, results_dir="data/results"):
+    """
+    Return the stored evaluation of a letter if it was made from the same inputs.
+    
+    The fingerprint is the hash of the fully rendered evaluation request, so it
+    changes whenever the letter text, the case facts, the template or the model
+    changes. Results with errors or unscored categories are never reused.
+    
+    Args:
+        letter_path: Path to the demand letter PDF
+        fingerprint: Fingerprint of the evaluation request about to be made
+        results_dir: Folder the individual results are stored in
+    
+    Returns:
+        The stored evaluation result, or None if the letter must be evaluated
+    """
+    result_file = Path(results_dir) / f"{letter_path.stem}_evaluation.json"
+    try:
+        with open(result_file, 'r') as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        return None
+    
+    if result.get("input_fingerprint") != fingerprint or "error" in result or result.get("missing_categories"):
+        return None
+    return result
+
+def run_precheck(letter_path, model="gpt-4o", results_dir="data/results"):
+    """
+    Pre-check a letter's facts against its case metadata before evaluating it.
+    
+    Args:
+        letter_path: Path to the demand letter PDF
+        model: OpenAI model the letter would be evaluated with
+        results_dir: Folder the individual results are stored in
+    
+    Returns:
+        Tuple of (report, blocked result); the report is None when there is no
+        pre-check, the blocked result is None unless the letter is blocked
+    """
+    with stage_timer("precheck"):
+        report = precheck_letter(letter_path, Path(results_dir).parent)
+    if report is None or not report["blocked"]:
+        return report, None
+    
+    errors = [finding["message"] for finding in report["findings"] if finding["severity"] == "error"]
+    logger.warning(f"{letter_path.name} blocked by the pre-check: {'; '.join(errors)}")
+    return report, {
+        "letter_name": letter_path.name,
+        "model_used": model,
+        "error": f"Blocked by pre-check: {'; '.join(errors)}",
+        "precheck": report
+    }
+
+def evaluate_or_reuse(letter_path, facts, model="gpt-4o", results_dir="data/results", force=False, samples=1,
+                      tolerance=SAMPLE_TOLERANCE):
+    """
+    Evaluate a letter unless an evaluation of identical inputs is already stored.
+    
+    The letter is pre-checked first; a blocked letter is not evaluated and its
+    result carries the error instead. Otherwise the pre-check findings are
+    attached to the result. With a model cascade configured, the letter is
+    screened by the cheaper tiers before `model` (see evaluate_cascade).
+    
+    Args:
+        letter_path: Path to the demand letter PDF
+        facts: Dictionary of extracted facts from source documents
+        model: OpenAI model to use for evaluation
+        results_dir: Folder the individual results are stored in
+        force: Always evaluate, even if a matching result is stored, and call the
+            API instead of replaying cached responses
+        samples: Maximum number of evaluations to average (see evaluate_demand_letter)
+        tolerance: Agreement needed to stop sampling early
+    
+    Returns:
+        Tuple of (result, reused)
+    """
+    report, blocked = run_precheck(letter_path, model=model, results_dir=results_dir)
+    if blocked is not None:
+        return blocked, False
+    
+    request = build_evaluation_request(letter_path, facts, model=model, case_dir=Path(results_dir).parent)
+    if not force:
+        previous = load_reusable_evaluation(letter_path, evaluation_fingerprint(request, samples, tolerance), results_dir)
+        if previous is not None:
+            logger.info(f"Inputs of {letter_path.name} unchanged, reusing stored evaluation")
+            if previous.get("precheck") != report:
+                attach_precheck(previous, report)
+                save_evaluation(letter_path, previous, results_dir)
+            return previous, True
+    evaluate = evaluate_cascade if len(evaluation_tiers(model)) > 1 else evaluate_demand_letter
+    result = evaluate(letter_path, facts, model=model, request=request, samples=samples, tolerance=tolerance, refresh=force)
+    return attach_precheck(result, report), False
+
+def attach_precheck(result, report):
+    """Attach pre-check findings to an evaluation result (or drop stale ones when there is no report)."""
+    if report is None:
+        result.pop("precheck", None)
+    else:
+        result["precheck"] = report
+    return result
+
+def save_evaluation(letter_path, result, results_dir="data/results"):
+    """
+    Save an individual evaluation result next to the other results.
+    
+    The result is also recorded in the results store, under the case the
+    results folder belongs to.
+    
+    Args:
+        letter_path: Path to the evaluated demand letter PDF
+        result: Evaluation result dictionary
+        results_dir: Folder the result file is written to
+    """
+    result_file = Path(results_dir) / f"{letter_path.stem}_evaluation.json"
+    with open(result_file, 'w') as f:
+        json.dump(result, f, indent=2)
+    get_results_store().add_evaluation(result, case_id_for(Path(results_dir).parent))
+    
+    logger.info(f"Evaluation saved to {result_file}")
+
+@stage_timer("evaluation")
+def evaluate_letters(letters, facts, model="gpt-4o", max_workers=1, results_dir="data/results", force=False,
+                     samples=1, tolerance=SAMPLE_TOLERANCE):
+    """
+    Evaluate several demand letters, optionally in parallel.
+    
+    Letters whose stored evaluation was made from identical inputs are not
+    evaluated again; their stored results are returned instead. Each new
+    result is saved as soon as its letter finishes. A letter whose evaluation
+    raises is logged and skipped so the remaining letters still run.
+    
+    Args:
+        letters: List of paths to demand letter PDFs
+        facts: Dictionary of extracted facts from source documents
+        model: OpenAI model to use for evaluation
+        max_workers: Number of letters to evaluate concurrently (1 = serial)
+        results_dir: Folder the individual results are written to
+        force: Re-evaluate every letter even if its inputs are unchanged
+        samples: Maximum number of evaluations to average per letter
+        tolerance: Agreement needed to stop sampling a letter early
+    
+    Returns:
+        List of evaluation result dictionaries, in the order of `letters`
+    """
+    results = {}
+    reused = 0
+    usage = {}
+    
+    def evaluate(letter_path):
+        return evaluate_or_reuse(letter_path, facts, model=model, results_dir=results_dir, force=force,
+                                 samples=samples, tolerance=tolerance)
+    
+    def record(letter_path, outcome):
+        nonlocal reused
+        result, was_reused = outcome
+        if was_reused:
+            reused += 1
+        else:
+            save_evaluation(letter_path, result, results_dir)
+            add_usage(usage, result.get("usage", {}))
+        results[letter_path] = result
+    
+    if max_workers > 1 and len(letters) > 1:
+        logger.info(f"Evaluating {len(letters)} letters with {max_workers} workers")
+        # All workers share the one client from get_client() (and its connection pool)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(evaluate, letter_path): letter_path for letter_path in letters}
+            for future in as_completed(futures):
+                letter_path = futures[future]
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    logger.error(f"Error evaluating {letter_path}: {e}")
+                    continue
+                record(letter_path, outcome)
+    else:
+        for letter_path in letters:
+            try:
+                outcome = evaluate(letter_path)
+            except Exception as e:
+                logger.error(f"Error evaluating {letter_path}: {e}")
+                continue
+            record(letter_path, outcome)
+    
+    if reused:
+        logger.info(f"Reused {reused} of {len(letters)} stored evaluations with unchanged inputs")
+    
+    failed = len(letters) - len(results)
+    if failed:
+        logger.warning(f"{failed} of {len(letters)} letters failed to evaluate")
+    
+    # Report how much of this run's prompt traffic was served from the provider's cache
+    if usage.get("prompt_tokens"):
+        logger.info(f"Evaluation prompts: {usage['prompt_tokens']} tokens, {usage['cached_tokens']} cached "
+                    f"({usage['cached_tokens'] / usage['prompt_tokens']:.0%}), {usage['completion_tokens']} completion tokens")
+    
+    return [results[letter_path] for letter_path in letters if letter_path in results]
+
+@stage_timer("evaluation")
+def run_batch_evaluation(letters, facts, model="gpt-4o", batch_id=None, poll_interval=60, results_dir="data/results",
+                         force=False):
+    """
+    Evaluate demand letters through the OpenAI Batch API.
+    
+    Every evaluation prompt is rendered into one batch file and submitted;
+    letters whose inputs are unchanged since their stored evaluation are left
+    out of the batch and their stored results reused. The batch id is recorded in `batch_state.json`, so a later run (or `batch_id`)
+    resumes polling an unfinished batch instead of submitting it again.
+    
+    The state file also keeps, per letter, the submitted request, its input
+    fingerprint and pre-check report. Results are recorded against those, so
+    a letter or facts change while the batch runs never marks the old
+    response as current, and a resumed batch needs none of its letters.
+    
+    Args:
+        letters: List of paths to demand letter PDFs
+        facts: Dictionary of extracted facts from source documents
+        model: OpenAI model to use for evaluation
+        batch_id: Id of an already submitted batch to resume
+        poll_interval: Seconds between batch status checks
+        results_dir: Folder the batch files and individual results are written to
+        force: Re-evaluate every letter even if its inputs are unchanged
+    
+    Returns:
+        List of evaluation result dictionaries, in the order of `letters`
+    """
+    state_file = Path(results_dir) / "batch_state.json"
+    state = load_batch_state(state_file)
+    
+    if batch_id is None and state and state.get("status") not in TERMINAL_STATUSES:
+        batch_id = state["batch_id"]
+        logger.info(f"Resuming unfinished batch {batch_id}")
+    
+    results = {}
+    if batch_id is None:
+        requests = {}
+        submitted = {}
+        for letter_path in letters:
+            report, blocked = run_precheck(letter_path, model=model, results_dir=results_dir)
+            if blocked is not None:
+                save_evaluation(letter_path, blocked, results_dir)
+                results[letter_path.name] = blocked
+                continue
+            request = build_evaluation_request(letter_path, facts, model=model, case_dir=Path(results_dir).parent)
+            previous = None if force else load_reusable_evaluation(letter_path, evaluation_fingerprint(request), results_dir)
+            if previous is not None:
+                if previous.get("precheck") != report:
+                    save_evaluation(letter_path, attach_precheck(previous, report), results_dir)
+                results[letter_path.name] = previous
+            else:
+                requests[letter_path.name] = request
+                submitted[letter_path.name] = {"letter": str(letter_path), "request": request, "precheck": report,
+                                               "input_fingerprint": evaluation_fingerprint(request)}
+        reused = sum("error" not in result for result in results.values())
+        if reused:
+            logger.info(f"Reused {reused} of {len(letters)} stored evaluations with unchanged inputs")
+        if not requests:
+            return [results[letter_path.name] for letter_path in letters]
+        
+        batch_file = write_batch_file(requests, Path(results_dir) / "batch_input.jsonl")
+        batch_id = submit_batch(get_client(), batch_file, metadata={"model": model})
+        state = {"batch_id": batch_id, "status": "submitted", "letters": submitted}
+        save_batch_state(state_file, state)
+    elif not state or state.get("batch_id") != batch_id:
+        state = {"batch_id": batch_id}
+    
+    batch = wait_for_batch(get_client(), batch_id, poll_interval=poll_interval)
+    state["status"] = batch.status
+    save_batch_state(state_file, state)
+    
+    # The batch remembers which model it was submitted with
+    model = (batch.metadata or {}).get("model", model)
+    responses, errors = collect_batch_results(get_client(), batch)
+    
+    from openai.types.chat import ChatCompletion
+    
+    letters_by_name = {letter_path.name: letter_path for letter_path in letters}
+    submitted = state.get("letters", {})
+    for custom_id, body in responses.items():
+        response = ChatCompletion.model_validate(body)
+        record_call("evaluation", model, usage_from_response(response), batch=True)
+        if custom_id in submitted:
+            entry = submitted[custom_id]
+            letter_path, request = Path(entry["letter"]), entry["request"]
+            fingerprint, report = entry["input_fingerprint"], entry["precheck"]
+        elif custom_id in letters_by_name:
+            # Batches submitted before their requests were recorded (or by id only)
+            letter_path = letters_by_name[custom_id]
+            request = build_evaluation_request(letter_path, facts, model=model, case_dir=Path(results_dir).parent)
+            fingerprint = evaluation_fingerprint(request)
+            report = run_precheck(letter_path, model=model, results_dir=results_dir)[0]
+        else:
+            logger.error(f"Skipping {custom_id} from batch {batch_id}: its request was not recorded and the letter is not in this run")
+            continue
+        result = parse_evaluation_response(response.choices[0].message.content, letter_path, model=model)
+        result["usage"] = usage_from_response(response)
+        result["input_fingerprint"] = fingerprint
+        result = reask_missing_categories(result, request, refresh=force)
+        attach_precheck(result, report)
+        save_evaluation(letter_path, result, results_dir)
+        results[custom_id] = result
+    
+    for custom_id, error in errors.items():
+        logger.error(f"Error evaluating {custom_id} in batch {batch_id}: {error}")
+        record_call("evaluation", model, error=True)
+    
+    ordered = [letter_path.name for letter_path in letters if letter_path.name in results]
+    ordered += [custom_id for custom_id in results if custom_id not in letters_by_name]
+    return [results[custom_id] for custom_id in ordered]
+
 def compare_evaluations(evaluations):
     """
     Compare multiple demand letter evaluations.
     
+    The evaluations are loaded into a throwaway in-memory results store and
+    rendered with compare_stored_evaluations.
+    
     Args:
         evaluations: List of evaluation result dictionaries
     
     Returns:
         Comparison summary
     """
-    if len(evaluations) < 2:
+    store = ResultsStore(":memory:")
+    try:
+        store.add_evaluations(evaluations, "comparison")
+        return compare_stored_evaluations("comparison", store=store)
+    finally:
+        store.close()
+
+def compare_stored_evaluations(case_id, model=None, letters=None, store=None):
+    """
+    Compare the stored evaluations of a case's letters.
+    
+    Args:
+        case_id: Case whose latest evaluations are compared
+        model: Only compare evaluations made with this model
+        letters: Only compare these (letter_name, model) pairs (default: every
+            letter of the case, under each model's latest evaluation)
+        store: ResultsStore to read from (default: the shared results store)
+    
+    Returns:
+        Comparison summary
+    """
+    store = store or get_results_store()
+    ranking = store.leaderboard(case_id, model)
+    rankings = store.category_rankings(case_id, model)
+    if letters is not None:
+        letters = set(letters)
+        ranking = [row for row in ranking if (row["letter_name"], row["model"]) in letters]
+        rankings = {category: [row for row in rows if (row["letter_name"], row["model"]) in letters]
+                    for category, rows in rankings.items()}
+    
+    if len(ranking) < 2:
         return "Need at least two evaluations to compare."
     
-    # Sort by weighted score
-    sorted_evals = sorted(evaluations, key=lambda x: x.get("weighted_score", 0), reverse=True)
+    lines = ["# Demand Letter Evaluation Comparison", "", "## Overall Ranking", ""]
+    lines.extend(f"{rank}. {row['letter_name']} - Score: {row['weighted_score']:.2f}"
+                 for rank, row in enumerate(ranking, 1))
+    lines += ["", "## Category Comparison"]
     
-    # Generate comparison text
-    comparison = "# Demand Letter Evaluation Comparison\n\n"
-    comparison += "## Overall Ranking\n\n"
+    # Weighted categories in rubric order, then anything else the model scored
+    for category in list(CATEGORY_WEIGHTS) + sorted(set(rankings) - set(CATEGORY_WEIGHTS)):
+        if not rankings.get(category):
+            continue
+        lines += ["", f"### {category}", ""]
+        for row in rankings[category]:
+            score = "N/A" if row["score"] is None else f"{row['score']:g}"
+            lines.append(f"- {row['letter_name']}: {score}/5 - {row['explanation'] or 'No explanation provided'}")
     
-    for i, eval_result in enumerate(sorted_evals):
-        comparison += f"{i+1}. {eval_result['letter_name']} - Score: {eval_result.get('weighted_score', 'N/A'):.2f}\n"
+    return "\n".join(lines) + "\n"
+
+@stage_timer("comparison")
+def save_comparison(evaluations, results_dir="data/results"):
+    """
+    Write the comparison report of several evaluations.
     
-    comparison += "\n## Category Comparison\n\n"
+    The evaluations are recorded in the results store first (results already
+    stored unchanged are skipped), and the report is rendered from the store,
+    limited to the letters and models of `evaluations`: with a cascade, letters
+    settle under different models, and other models' rows may be stale.
     
-    # Compare each category
-    categories = ["Structure and Organization", "Factual Presentation", "Medical Documentation", 
-                 "Damages Calculation", "Legal Strategy", "Persuasiveness", "Source Document Representation"]
+    Args:
+        evaluations: List of evaluation result dictionaries
+        results_dir: Folder the comparison.md report is written to
+    """
+    case_id = case_id_for(Path(results_dir).parent)
+    store = get_results_store()
+    store.add_evaluations(evaluations, case_id)
+    comparison = compare_stored_evaluations(case_id, letters=[(e["letter_name"], e.get("model_used")) for e in evaluations],
+                                            store=store)
+    comparison_file = Path(results_dir) / "comparison.md"
     
-    for category in categories:
-        comparison += f"\n### {category}\n\n"
-        category_sorted = sorted(evaluations, 
-                               key=lambda x: x.get("category_scores", {}).get(category, {}).get("score", 0), 
-                               reverse=True)
-        
-        for eval_result in category_sorted:
-            cat_data = eval_result.get("category_scores", {}).get(category, {})
-            score = cat_data.get("score", "N/A")
-            explanation = cat_data.get("explanation", "No explanation provided")
-            comparison += f"- {eval_result['letter_name']}: {score}/5 - {explanation}\n"
+    with open(comparison_file, 'w') as f:
+        f.write(comparison)
     
-    return comparison
+    logger.info(f"Comparison saved to {comparison_file}")
 
-def main():
-    """Main execution function."""
-    parser = argparse.ArgumentParser(description="Evaluate legal demand letters against source documents.")
-    parser.add_argument("--reprocess", action="store_true", help="Force reprocessing of source documents")
-    parser.add_argument("--model", default="o3-2025-04-16", help="OpenAI model to use for evaluation")
-    parser.add_argument("--compare", action="store_true", help="Compare all evaluated letters")
-    args = parser.parse_args()
-    
+def run(args):
+    """Extract the facts, then evaluate and compare the letters as requested on the command line."""
     # Ensure folder structure exists
-    setup_folders()
+    setup_folders(args.data_dir)
+    results_dir = Path(args.data_dir) / "results"
     
     # Extract facts from source documents
-    facts = extract_facts_from_source_documents(force_reprocess=args.reprocess)
+    facts = extract_facts_from_source_documents(force_reprocess=args.reprocess, max_workers=args.extract_workers,
+                                                token_budget=args.token_budget, data_dir=args.data_dir)
     
     # Get all demand letters to evaluate
-    demand_letters_path = Path("data/demand_letters")
-    letters = list(demand_letters_path.glob("*.pdf"))
+    demand_letters_path = Path(args.data_dir) / "demand_letters"
+    letters = sorted(demand_letters_path.glob("*.pdf"))
     
     if not letters:
-        logger.error("No demand letters found in data/demand_letters/")
+        logger.error(f"No demand letters found in {demand_letters_path}/")
         return
     
-    evaluations = []
+    if args.batch or args.batch_id:
+        if args.samples > 1:
+            logger.warning("--samples is not supported with the Batch API; taking a single sample per letter")
+        if len(evaluation_tiers(args.model)) > 1:
+            logger.warning("--cascade is not supported with the Batch API; evaluating every letter with --model")
+            configure_cascade(models="")
+        evaluations = run_batch_evaluation(letters, facts, model=args.model, batch_id=args.batch_id,
+                                           poll_interval=args.batch_poll_interval, results_dir=results_dir,
+                                           force=args.force)
+    else:
+        evaluations = evaluate_letters(letters, facts, model=args.model, max_workers=args.workers,
+                                       results_dir=results_dir, force=args.force, samples=args.samples,
+                                       tolerance=args.sample_tolerance)
     
-    # Evaluate each letter
-    for letter_path in letters:
-        result = evaluate_demand_letter(letter_path, facts, model=args.model)
-        
-        # Save individual evaluation result
-        result_file = Path(f"data/results/{letter_path.stem}_evaluation.json")
-        with open(result_file, 'w') as f:
-            json.dump(result, f, indent=2)
-        
-        logger.info(f"Evaluation saved to {result_file}")
-        evaluations.append(result)
+    # Only successfully scored letters can be ranked
+    evaluations = [e for e in evaluations if "weighted_score" in e]
     
     # Compare evaluations if requested
     if args.compare and len(evaluations) >= 2:
-        comparison = compare_evaluations(evaluations)
-        comparison_file = Path("data/results/comparison.md")
-        
-        with open(comparison_file, 'w') as f:
-            f.write(comparison)
-        
-        logger.info(f"Comparison saved to {comparison_file}")
+        save_comparison(evaluations, results_dir)
         print("\nDemand Letter Comparison Summary:")
         print("---------------------------------")
         
@@ -363,5 +1121,61 @@ def main():
         for eval_result in sorted(evaluations, key=lambda x: x.get("weighted_score", 0), reverse=True):
             print(f"{eval_result['letter_name']}: {eval_result.get('weighted_score', 'N/A'):.2f}")
 
+def main():
+    """Main execution function."""
+    parser = argparse.ArgumentParser(description="Evaluate legal demand letters against source documents.")
+    parser.add_argument("--data-dir", default="data", help="Case folder with source_documents/, demand_letters/, extracted_facts/ and results/")
+    parser.add_argument("--reprocess", action="store_true", help="Force reprocessing of source documents")
+    parser.add_argument("--model", default="o3-2025-04-16", help="OpenAI model to use for evaluation")
+    parser.add_argument("--compare", action="store_true", help="Compare all evaluated letters")
+    parser.add_argument("--force", action="store_true", help="Re-evaluate letters even if their inputs are unchanged, bypassing the response cache")
+    parser.add_argument("--workers", type=int, default=1, help="Number of demand letters to evaluate concurrently")
+    parser.add_argument("--extract-workers", type=int, default=1, help="Number of source documents to extract concurrently")
+    parser.add_argument("--token-budget", type=int, help="Maximum prompt size in tokens for fact extraction and consolidation; larger documents are chunked (default: 24000)")
+    parser.add_argument("--ocr-dpi", type=int, help="Resolution scanned pages are rendered at for OCR (default: 300)")
+    parser.add_argument("--ocr-workers", type=int, help="Number of processes used to OCR scanned pages (default: CPU count)")
+    parser.add_argument("--llm-cache", choices=["on", "off", "replay"], help="Reuse recorded model responses (on), bypass the cache (off), or run offline against recorded responses only (replay)")
+    parser.add_argument("--evidence", choices=EVIDENCE_MODES, help="Source evidence in the evaluation prompt: retrieved source passages (passages), the consolidated summary (summary), or both (default)")
+    parser.add_argument("--evidence-budget", type=int, help="Maximum tokens of retrieved source passages per evaluation prompt (default: 4000)")
+    parser.add_argument("--precheck", choices=PRECHECK_MODES, help="Check letters against source_documents/case_metadata.json before evaluating: only report findings (warn, default), skip letters with contradicting facts (block), or skip the check (off)")
+    parser.add_argument("--rpm", type=int, help="Requests per minute allowed by your OpenAI account (default: read from the API's rate limit headers)")
+    parser.add_argument("--tpm", type=int, help="Tokens per minute allowed by your OpenAI account (default: read from the API's rate limit headers)")
+    parser.add_argument("--max-retries", type=int, help="Retries of a rate limited or failed model call, with exponential backoff (default: 6)")
+    parser.add_argument("--cascade", help="Comma-separated cheaper models that screen each letter (and extract facts) before --model, cheapest first; only uncertain results are escalated (default: no cascade)")
+    parser.add_argument("--decision-thresholds", help="Comma-separated weighted scores at which a decision about a letter changes; screening scores near one are escalated (default: 2.5,3.5)")
+    parser.add_argument("--cascade-margin", type=float, help="Distance from a decision threshold within which screening scores are escalated (default: 0.25)")
+    parser.add_argument("--cascade-max-spread", type=float, help="With --samples, largest difference between the samples' scores for one category before a screening result is escalated (default: 1)")
+    parser.add_argument("--samples", type=sample_count, default=1, help="Evaluate each letter up to this many times and average the scores, stopping early once they agree; 1 or at least 3 (default: 1)")
+    parser.add_argument("--sample-tolerance", type=float, default=SAMPLE_TOLERANCE, help="Largest standard error of a category's mean score at which sampling stops (default: 0.5)")
+    parser.add_argument("--batch", action="store_true", help="Evaluate all letters through the OpenAI Batch API")
+    parser.add_argument("--batch-id", help="Resume polling a previously submitted evaluation batch")
+    parser.add_argument("--batch-poll-interval", type=float, default=60, help="Seconds between batch status checks")
+    parser.add_argument("--results-db", help="SQLite results store shared by all cases (default: results.db next to main.py)")
+    parser.add_argument("--metrics-file", help="Where to write the run metrics report (default: results/run_metrics.json)")
+    parser.add_argument("--prometheus-textfile", help="Also write the run metrics in Prometheus textfile format to this path")
+    args = parser.parse_args()
+    
+    # Configure logging
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    
+    configure_ocr(dpi=args.ocr_dpi, workers=args.ocr_workers)
+    configure_llm_cache(mode=args.llm_cache)
+    configure_rate_limits(rpm=args.rpm, tpm=args.tpm, max_retries=args.max_retries)
+    configure_results_store(path=args.results_db, run_config=vars(args))
+    configure_retrieval(mode=args.evidence, budget=args.evidence_budget)
+    configure_precheck(mode=args.precheck)
+    configure_cascade(models=args.cascade, thresholds=args.decision_thresholds, margin=args.cascade_margin,
+                      max_spread=args.cascade_max_spread)
+    
+    try:
+        run(args)
+    finally:
+        # Report where time and money went, even for a failed run
+        report = write_report(args.metrics_file or Path(args.data_dir) / "results" / "run_metrics.json",
+                              extra={"config": vars(args)})
+        log_summary(report)
+        if args.prometheus_textfile:
+            write_prometheus_textfile(args.prometheus_textfile, report)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,311 @@
+"""
+Run instrumentation for the Demand Letter Evaluator
+
+Collects wall time, token usage, retries and estimated cost per pipeline stage
+(PDF extraction, fact extraction, consolidation, evaluation, comparison). The
+metrics of a run can be written as a JSON report and as a Prometheus textfile
+for the node_exporter textfile collector, so latency and spend regressions can
+be alerted on.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# USD per million tokens: (prompt, cached prompt, completion). Models are
+# matched by the longest prefix, so dated snapshots share their base price.
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "o3": (2.00, 0.50, 8.00),
+    "o4-mini": (1.10, 0.275, 4.40),
+}
+# Batch API requests are billed at half price
+BATCH_DISCOUNT = 0.5
+
+_lock = threading.Lock()
+_stages = {}
+_pdf_tiers = {}
+_cascade_tiers = {}
+_started_at = time.time()
+
+
+def _new_stage():
+    return {"runs": 0, "seconds": 0.0, "calls": 0, "cache_hits": 0, "call_seconds": 0.0,
+            "max_call_seconds": 0.0, "retries": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            "cached_tokens": 0, "cost_usd": 0.0, "unpriced_calls": 0}
+
+
+def model_price(model):
+    """Return the (prompt, cached prompt, completion) price of a model, or None if unknown."""
+    matches = [prefix for prefix in MODEL_PRICES if (model or "").startswith(prefix)]
+    return MODEL_PRICES[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(model, usage, batch=False):
+    """
+    Estimate the cost of one call in USD.
+
+    Args:
+        model: Model the call was made with
+        usage: Dictionary with prompt_tokens, completion_tokens and cached_tokens
+        batch: Whether the call went through the Batch API
+
+    Returns:
+        Estimated cost, or None if the model has no known price
+    """
+    price = model_price(model)
+    if price is None:
+        return None
+    prompt_price, cached_price, completion_price = price
+    cached = usage.get("cached_tokens", 0)
+    cost = ((usage.get("prompt_tokens", 0) - cached) * prompt_price + cached * cached_price
+            + usage.get("completion_tokens", 0) * completion_price) / 1_000_000
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+@contextmanager
+def stage_timer(stage):
+    """Add the wall time of the enclosed block to `stage`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            stats = _stages.setdefault(stage, _new_stage())
+            stats["runs"] += 1
+            stats["seconds"] += elapsed
+
+
+def record_call(stage, model, usage=None, seconds=0.0, retries=0, cache_hit=False, error=False, batch=False):
+    """
+    Record one model call.
+
+    Args:
+        stage: Pipeline stage the call belongs to
+        model: Model the call was made with
+        usage: Token usage (see llm.usage_from_response); ignored for cache hits
+        seconds: Time spent waiting for the response
+        retries: Number of retries the client needed
+        cache_hit: Whether the response came from the local response cache
+        error: Whether the call failed
+        batch: Whether the call went through the Batch API
+    """
+    with _lock:
+        stats = _stages.setdefault(stage, _new_stage())
+        stats["retries"] += retries
+        if error:
+            stats["errors"] += 1
+            return
+        if cache_hit:
+            # Recorded responses cost nothing and say nothing about API latency
+            stats["cache_hits"] += 1
+            return
+        stats["calls"] += 1
+        stats["call_seconds"] += seconds
+        stats["max_call_seconds"] = max(stats["max_call_seconds"], seconds)
+        usage = usage or {}
+        for key in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+            stats[key] += usage.get(key, 0)
+        cost = estimate_cost(model, usage, batch=batch)
+        if cost is None:
+            stats["unpriced_calls"] += 1
+        else:
+            stats["cost_usd"] += cost
+
+
+def record_pdf_extraction(tier_stats, cache_hit=False):
+    """
+    Record the pages and time spent per extraction tier for one PDF.
+
+    Args:
+        tier_stats: Tier -> {"pages", "seconds"} (see utils.extract_pdf_pages)
+        cache_hit: Whether the text came from the text cache
+    """
+    with _lock:
+        stats = _stages.setdefault("pdf_extraction", _new_stage())
+        if cache_hit:
+            stats["cache_hits"] += 1
+            return
+        for tier, tier_stat in tier_stats.items():
+            totals = _pdf_tiers.setdefault(tier, {"pages": 0, "seconds": 0.0})
+            totals["pages"] += tier_stat["pages"]
+            totals["seconds"] += tier_stat["seconds"]
+
+
+def record_cascade_tier(stage, model, usage=None, seconds=0.0, calls=1, escalated=False):
+    """
+    Record one letter (or document chunk) handled by a tier of the model cascade.
+
+    Args:
+        stage: Pipeline stage the cascade ran in
+        model: Model of the tier
+        usage: Token usage of the tier's calls for this item
+        seconds: Time the tier spent on this item
+        calls: Number of model calls the tier made for this item
+        escalated: Whether the item was passed on to the next tier
+    """
+    with _lock:
+        stats = _cascade_tiers.setdefault(stage, {}).setdefault(
+            model, {"items": 0, "escalated": 0, "calls": 0, "seconds": 0.0, "cost_usd": 0.0})
+        stats["items"] += 1
+        stats["escalated"] += int(escalated)
+        stats["calls"] += calls
+        stats["seconds"] += seconds
+        stats["cost_usd"] += estimate_cost(model, usage or {}) or 0.0
+
+
+def reset_metrics():
+    """Forget everything recorded so far and restart the run clock."""
+    global _started_at
+    with _lock:
+        _stages.clear()
+        _pdf_tiers.clear()
+        _cascade_tiers.clear()
+        _started_at = time.time()
+
+
+def run_report():
+    """
+    Build the report of everything recorded since the run started.
+
+    Returns:
+        Dictionary with run timing, per-stage metrics, per-tier PDF
+        extraction and model cascade metrics, and totals
+    """
+    with _lock:
+        stages = {stage: dict(stats) for stage, stats in _stages.items()}
+        pdf_tiers = {tier: dict(stats) for tier, stats in _pdf_tiers.items()}
+        cascade = {stage: {model: dict(stats) for model, stats in tiers.items()} for stage, tiers in _cascade_tiers.items()}
+        started_at = _started_at
+
+    for tier_stats in pdf_tiers.values():
+        tier_stats["seconds_per_page"] = tier_stats["seconds"] / tier_stats["pages"] if tier_stats["pages"] else 0.0
+    totals = {key: sum(stats[key] for stats in stages.values())
+              for key in ("calls", "retries", "errors", "prompt_tokens", "completion_tokens", "cached_tokens",
+                          "cost_usd", "unpriced_calls")}
+    return {
+        "started_at": datetime.fromtimestamp(started_at, timezone.utc).isoformat(),
+        "wall_time": time.time() - started_at,
+        "stages": stages,
+        "pdf_tiers": pdf_tiers,
+        "cascade": cascade,
+        "totals": totals,
+    }
+
+
+def _write_atomic(path, text):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_name(f"{path.name}.tmp")
+    with open(tmp_file, 'w') as f:
+        f.write(text)
+    os.replace(tmp_file, path)
+
+
+def write_report(path, extra=None):
+    """
+    Write the run report as JSON.
+
+    Args:
+        path: Output file
+        extra: Additional fields to include (e.g. the command line settings)
+
+    Returns:
+        The report
+    """
+    report = dict(run_report(), **(extra or {}))
+    _write_atomic(path, json.dumps(report, indent=2))
+    logger.info(f"Run metrics saved to {path}")
+    return report
+
+
+def write_prometheus_textfile(path, report=None):
+    """
+    Write the run report in the Prometheus text exposition format.
+
+    Every metric is a gauge describing the last run. The file is replaced
+    atomically so the textfile collector never reads a partial file.
+
+    Args:
+        path: Output file, conventionally ending in `.prom`
+        report: Report to write (default: the current run_report())
+    """
+    report = report or run_report()
+    lines = []
+
+    def gauge(name, help_text, samples):
+        lines.append(f"# HELP finch_{name} {help_text}")
+        lines.append(f"# TYPE finch_{name} gauge")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+            lines.append(f"finch_{name}{{{label_text}}} {value}" if label_text else f"finch_{name} {value}")
+
+    stages = report["stages"]
+    gauge("run_timestamp_seconds", "Unix time the last run finished.", [({}, round(time.time(), 3))])
+    gauge("run_seconds", "Wall time of the last run.", [({}, round(report["wall_time"], 3))])
+    gauge("stage_seconds", "Wall time spent in each stage.",
+          [({"stage": stage}, round(stats["seconds"], 3)) for stage, stats in stages.items()])
+    gauge("llm_calls", "Model calls made per stage.",
+          [({"stage": stage}, stats["calls"]) for stage, stats in stages.items()])
+    gauge("cache_hits", "Calls and PDFs served from the local caches per stage.",
+          [({"stage": stage}, stats["cache_hits"]) for stage, stats in stages.items()])
+    gauge("llm_call_seconds", "Time spent waiting for model responses per stage.",
+          [({"stage": stage}, round(stats["call_seconds"], 3)) for stage, stats in stages.items()])
+    gauge("llm_max_call_seconds", "Slowest model response per stage.",
+          [({"stage": stage}, round(stats["max_call_seconds"], 3)) for stage, stats in stages.items()])
+    gauge("llm_retries", "Retried model requests per stage.",
+          [({"stage": stage}, stats["retries"]) for stage, stats in stages.items()])
+    gauge("llm_errors", "Failed model calls per stage.",
+          [({"stage": stage}, stats["errors"]) for stage, stats in stages.items()])
+    gauge("llm_tokens", "Tokens used per stage.",
+          [({"stage": stage, "kind": kind}, stats[f"{kind}_tokens"])
+           for stage, stats in stages.items() for kind in ("prompt", "completion", "cached")])
+    gauge("llm_cost_usd", "Estimated model cost per stage in USD.",
+          [({"stage": stage}, round(stats["cost_usd"], 6)) for stage, stats in stages.items()])
+    gauge("pdf_pages", "PDF pages extracted per tier.",
+          [({"tier": tier}, stats["pages"]) for tier, stats in report["pdf_tiers"].items()])
+    gauge("pdf_seconds", "Time spent extracting PDF pages per tier.",
+          [({"tier": tier}, round(stats["seconds"], 3)) for tier, stats in report["pdf_tiers"].items()])
+
+    cascade = [({"stage": stage, "model": model}, stats) for stage, tiers in report.get("cascade", {}).items()
+               for model, stats in tiers.items()]
+    gauge("cascade_items", "Letters or chunks handled per model cascade tier.",
+          [(labels, stats["items"]) for labels, stats in cascade])
+    gauge("cascade_escalations", "Letters or chunks passed on to the next model cascade tier.",
+          [(labels, stats["escalated"]) for labels, stats in cascade])
+    gauge("cascade_calls", "Model calls made per model cascade tier.",
+          [(labels, stats["calls"]) for labels, stats in cascade])
+    gauge("cascade_cost_usd", "Estimated model cost per model cascade tier in USD.",
+          [(labels, round(stats["cost_usd"], 6)) for labels, stats in cascade])
+
+    _write_atomic(path, "\n".join(lines) + "\n")
+    logger.info(f"Prometheus metrics saved to {path}")
+
+
+def log_summary(report=None):
+    """Log one line per stage with its time, calls, tokens and cost."""
+    report = report or run_report()
+    for stage, stats in report["stages"].items():
+        logger.info(f"{stage}: {stats['seconds']:.2f}s, {stats['calls']} calls "
+                    f"({stats['cache_hits']} cached, {stats['retries']} retries, {stats['errors']} errors), "
+                    f"{stats['prompt_tokens']} prompt / {stats['completion_tokens']} completion tokens, "
+                    f"${stats['cost_usd']:.4f}")
+    for stage, tiers in report.get("cascade", {}).items():
+        for model, stats in tiers.items():
+            logger.info(f"{stage} tier {model}: {stats['items']} handled, {stats['escalated']} escalated, "
+                        f"{stats['calls']} calls, {stats['seconds'] / stats['items']:.2f}s and "
+                        f"${stats['cost_usd'] / stats['items']:.4f} per item")
+    totals = report["totals"]
+    unpriced = f" ({totals['unpriced_calls']} calls to unpriced models)" if totals["unpriced_calls"] else ""
+    logger.info(f"Run total: {report['wall_time']:.2f}s, {totals['calls']} calls, ${totals['cost_usd']:.4f}{unpriced}")
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI chat completions, files and batches endpoints.
+
+Serves canned, rubric-formatted responses with configurable latency and error
+rates, so the evaluator can be exercised and benchmarked without network
+access. Streaming requests get the same response as server-sent events.
+Batches are answered with the same canned responses after
+`batch_delay` seconds. Point a client at it with
+`OpenAI(base_url=..., api_key="stub")` or the OPENAI_BASE_URL environment variable.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Category lines of the evaluation template look like "Quality of Writing: [SCORE] - ..."
+RUBRIC_LINE = re.compile(r"^([A-Z][A-Za-z ]+): \[SCORE\]", re.MULTILINE)
+
+
+class StubState:
+    """Configuration and counters shared by all request handlers."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0, seed=None, batch_delay=0.0,
+                 malformed_rate=0.0, score_noise=0.0):
+        self.latency = latency
+        self.malformed_rate = malformed_rate
+        self.score_noise = score_noise
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.batch_delay = batch_delay
+        self.files = {}
+        self.batches = {}
+        self.seen_prefixes = set()
+
+    def cached_tokens(self, prompt):
+        """
+        Simulate provider prompt caching: count the prompt's longest prefix,
+        in 128-token blocks, already seen in an earlier request. Like the real
+        cache, nothing is reported for prompts under 1024 tokens.
+        """
+        block = 128 * 4
+        digests = [hashlib.sha256(prompt[:end].encode("utf-8")).digest()
+                   for end in range(block, len(prompt) + 1, block)]
+        with self.lock:
+            hits = 0
+            for digest in digests:
+                if digest not in self.seen_prefixes:
+                    break
+                hits += 1
+            self.seen_prefixes.update(digests)
+        cached = hits * 128
+        return cached if cached >= 1024 else 0
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.requests, "errors": self.errors}
+
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def _prompt_text(messages):
+    parts = []
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(content)
+    return "\n".join(parts)
+
+
+def canned_completion(request, drop_category=False, score_noise=0.0, rng=None):
+    """
+    Build a deterministic response for a chat completion request.
+
+    Requests with a JSON-schema `response_format` get a JSON object with a
+    score and explanation per schema property. Free-text evaluation prompts
+    get one "Category: score - explanation" line per rubric category found in
+    the prompt; any other prompt gets a short fact list. Scores are derived
+    from a hash of the prompt, so different letters score differently but the
+    same letter always scores the same.
+
+    Args:
+        request: Chat completion request body
+        drop_category: Leave the last category out, to simulate a malformed response
+        score_noise: Probability that each structured score is moved one point
+            up or down, to simulate sampling variance
+        rng: Random generator for the score noise
+    """
+    prompt = _prompt_text(request.get("messages", []))
+    digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+    response_format = request.get("response_format") or {}
+    schema = response_format.get("json_schema", {}).get("schema", {})
+
+    if response_format.get("type") == "json_schema":
+        categories = list(schema.get("properties", {}))
+        if drop_category and len(categories) > 1:
+            categories = categories[:-1]
+        rng = rng or random.Random(0)
+
+        def score(idx):
+            value = 1 + digest[idx % len(digest)] % 5
+            if rng.random() < score_noise:
+                value = min(5, max(1, value + rng.choice((-1, 1))))
+            return value
+
+        content = json.dumps({
+            category: {"score": score(idx), "explanation": f"Stub assessment of {category.lower()}."}
+            for idx, category in enumerate(categories)
+        })
+    elif RUBRIC_LINE.search(prompt):
+        lines = []
+        for idx, category in enumerate(RUBRIC_LINE.findall(prompt)):
+            score = 1 + digest[idx % len(digest)] % 5
+            lines.append(f"{category}: {score} - Stub assessment of {category.lower()}.")
+        content = "\n\n".join(lines)
+    else:
+        content = "\n".join(f"- Stub fact {idx + 1} ({digest.hex()[idx * 4:idx * 4 + 8]})" for idx in range(8))
+
+    prompt_tokens = _estimate_tokens(prompt)
+    completion_tokens = _estimate_tokens(content)
+    return {
+        "id": f"chatcmpl-stub-{digest.hex()[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Request handler; `server.state` holds the StubState."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_bytes(self, status, body, content_type="application/octet-stream"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self):
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_GET(self):
+        state = self.server.state
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if parts == ["stats"]:
+            self._send_json(200, state.stats())
+        elif len(parts) >= 3 and parts[-3] == "files" and parts[-1] == "content" and parts[-2] in state.files:
+            self._send_bytes(200, state.files[parts[-2]]["content"])
+        elif len(parts) >= 2 and parts[-2] == "files" and parts[-1] in state.files:
+            self._send_json(200, state.files[parts[-1]]["object"])
+        elif len(parts) >= 2 and parts[-2] == "batches" and parts[-1] in state.batches:
+            self._send_json(200, self._batch_object(parts[-1]))
+        else:
+            self._not_found()
+
+    def do_POST(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path.endswith("/files"):
+            self._create_file()
+        elif path.endswith("/batches"):
+            self._create_batch()
+        elif path.endswith("/chat/completions"):
+            self._chat_completion()
+        else:
+            self._not_found()
+
+    def _store_file(self, content, filename, purpose):
+        state = self.server.state
+        file_id = f"file-stub-{uuid.uuid4().hex[:24]}"
+        file_object = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        with state.lock:
+            state.files[file_id] = {"object": file_object, "content": content}
+        return file_object
+
+    def _create_file(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        # Parse the multipart/form-data upload with the stdlib MIME parser
+        message = BytesParser(policy=default_policy).parsebytes(
+            f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode() + body)
+        content, filename, purpose = b"", "upload.jsonl", "batch"
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if name == "file":
+                content = part.get_payload(decode=True) or b""
+                filename = part.get_filename() or filename
+            elif name == "purpose":
+                purpose = part.get_content().strip()
+        self._send_json(200, self._store_file(content, filename, purpose))
+
+    def _create_batch(self):
+        state = self.server.state
+        request = self._read_json()
+        input_file = state.files.get(request.get("input_file_id"))
+        if input_file is None:
+            self._send_json(400, {"error": {"message": "Unknown input_file_id"}})
+            return
+
+        batch_id = f"batch_stub_{uuid.uuid4().hex[:24]}"
+        lines = [json.loads(line) for line in input_file["content"].decode("utf-8").splitlines() if line.strip()]
+        output = "".join(json.dumps({
+            "id": f"batch_req_{idx}",
+            "custom_id": line["custom_id"],
+            "response": {"status_code": 200, "request_id": f"req_{idx}", "body": canned_completion(line["body"])},
+            "error": None,
+        }) + "\n" for idx, line in enumerate(lines))
+        output_file = self._store_file(output.encode("utf-8"), f"{batch_id}_output.jsonl", "batch_output")
+
+        with state.lock:
+            state.batches[batch_id] = {
+                "request": request,
+                "created_at": time.time(),
+                "total": len(lines),
+                "output_file_id": output_file["id"],
+            }
+        self._send_json(200, self._batch_object(batch_id))
+
+    def _batch_object(self, batch_id):
+        state = self.server.state
+        batch = state.batches[batch_id]
+        done = time.time() - batch["created_at"] >= state.batch_delay
+        request = batch["request"]
+        return {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": request.get("endpoint"),
+            "input_file_id": request.get("input_file_id"),
+            "completion_window": request.get("completion_window", "24h"),
+            "status": "completed" if done else "in_progress",
+            "output_file_id": batch["output_file_id"] if done else None,
+            "error_file_id": None,
+            "created_at": int(batch["created_at"]),
+            "metadata": request.get("metadata"),
+            "request_counts": {"total": batch["total"], "completed": batch["total"] if done else 0, "failed": 0},
+        }
+
+    def _chat_completion(self):
+        state = self.server.state
+        request = self._read_json()
+        with state.lock:
+            state.requests += 1
+            roll = state.random.random()
+            malformed = state.random.random() < state.malformed_rate
+            noise_rng = random.Random(state.random.random())
+            delay = max(0.0, state.latency + state.random.uniform(-state.jitter, state.jitter))
+
+        time.sleep(delay)
+
+        if roll < state.rate_limit_rate:
+            with state.lock:
+                state.errors += 1
+            self._send_json(429, {"error": {"message": "Rate limit reached (stub)", "type": "rate_limit_error"}},
+                            headers={"Retry-After": "1"})
+        elif roll < state.rate_limit_rate + state.error_rate:
+            with state.lock:
+                state.errors += 1
+            self._send_json(500, {"error": {"message": "Internal error (stub)", "type": "server_error"}})
+        else:
+            completion = canned_completion(request, drop_category=malformed, score_noise=state.score_noise,
+                                           rng=noise_rng)
+            cached = state.cached_tokens(_prompt_text(request.get("messages", [])))
+            completion["usage"]["prompt_tokens_details"] = {"cached_tokens": min(cached, completion["usage"]["prompt_tokens"])}
+            if request.get("stream"):
+                self._stream_completion(completion)
+            else:
+                self._send_json(200, completion)
+
+    def _stream_completion(self, completion):
+        """Send a completion as server-sent events, a few words per chunk."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        base = {key: completion[key] for key in ("id", "created", "model")}
+        base["object"] = "chat.completion.chunk"
+        words = re.findall(r"\S+\s*", completion["choices"][0]["message"]["content"])
+        deltas = [{"role": "assistant", "content": ""}] + [{"content": "".join(words[idx:idx + 4])}
+                                                           for idx in range(0, len(words), 4)]
+        for delta in deltas:
+            chunk = dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}])
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        chunk = dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+
+def start_stub_server(host="127.0.0.1", port=0, **options):
+    """
+    Start the stand-in server on a background thread.
+
+    Args:
+        host: Interface to bind
+        port: Port to bind (0 = any free port)
+        **options: StubState options (latency, jitter, error_rate, rate_limit_rate, seed,
+            batch_delay, malformed_rate, score_noise)
+
+    Returns:
+        Tuple of (server, base_url); call `server.shutdown()` to stop it
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(**options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}/v1"
+    logger.info(f"OpenAI stand-in listening on {base_url}")
+    return server, base_url
+
+
+def main():
+    """Run the stand-in server in the foreground."""
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI chat completions and batch endpoints.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind")
+    parser.add_argument("--port", type=int, default=8089, help="Port to bind")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform latency jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 429")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of structured responses missing a category")
+    parser.add_argument("--score-noise", type=float, default=0.0, help="Probability that each structured score moves one point")
+    parser.add_argument("--batch-delay", type=float, default=0.0, help="Seconds before a submitted batch completes")
+    parser.add_argument("--seed", type=int, help="Random seed for latency and error injection")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server, base_url = start_stub_server(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                                         error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                                         seed=args.seed, batch_delay=args.batch_delay,
+                                         malformed_rate=args.malformed_rate, score_noise=args.score_noise)
+    print(f"export OPENAI_BASE_URL={base_url} OPENAI_API_KEY=stub")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
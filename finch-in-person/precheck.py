@@ -0,0 +1,353 @@
+"""
+Deterministic pre-check of demand letters against the case's ground truth
+
+`source_documents/case_metadata.json` holds the case's structured facts: the
+accident date, the parties, the vehicle, the policy, the injuries and the
+treatment facilities. The billing and wage statements among the source
+documents carry the totals. Before a letter is sent to the model, the dates,
+amounts, names and identifiers in its text are checked against them. This
+takes milliseconds.
+
+Findings are "error" (a fact in the letter contradicts the records, e.g. a
+wrong accident date, plate or policy limit) or "warning" (something expected is
+missing, a name differs, or an amount does not match the statements). The findings are
+attached to the evaluation result; in "block" mode letters with errors are not
+evaluated at all.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from datetime import date
+from pathlib import Path
+
+from utils import extract_text_from_pdf
+
+logger = logging.getLogger(__name__)
+
+# Pre-check modes:
+#   block – letters with errors are not sent to the model
+#   warn  – findings are attached to the result, every letter is evaluated
+#   off   – no pre-check
+PRECHECK_MODES = ("block", "warn", "off")
+PRECHECK_MODE = os.environ.get("FINCH_PRECHECK", "warn")
+# Bump when the checks change so stored results are re-checked
+PRECHECK_VERSION = "2"
+
+MONTHS = {name: number for number, names in enumerate(
+    [("jan", "january"), ("feb", "february"), ("mar", "march"), ("apr", "april"), ("may",), ("jun", "june"),
+     ("jul", "july"), ("aug", "august"), ("sep", "sept", "september"), ("oct", "october"), ("nov", "november"),
+     ("dec", "december")], 1) for name in names}
+_MONTH = r"(?P<month>" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\.?"
+# PDF text sometimes splits a number ("202 3"), so years tolerate one inner space
+_YEAR = r"(?P<year>\d{4}|\d{3} \d|\d \d{3}|\d{2} \d{2})"
+DATE_PATTERNS = [
+    re.compile(r"\b(?P<year>\d{4})-(?P<mon>\d{1,2})-(?P<day>\d{1,2})\b"),
+    re.compile(r"\b(?P<mon>\d{1,2})/(?P<day>\d{1,2})/" + _YEAR + r"(?!\d)"),
+    re.compile(r"\b" + _MONTH + r"\s+(?P<day>\d{1,2})(?:st|nd|rd|th)?,?\s+" + _YEAR + r"(?!\d)", re.IGNORECASE),
+    re.compile(r"\b(?P<day>\d{1,2})(?:st|nd|rd|th)?\s+" + _MONTH + r",?\s+" + _YEAR + r"(?!\d)", re.IGNORECASE),
+]
+AMOUNT_PATTERN = re.compile(r"\$\s?(\d{1,3}(?:,\d{3})+|\d+)(\.\d{2})?")
+
+ACCIDENT_WORDS = re.compile(r"\b(?:accident|collision|crash|incident|rear-ended|date of loss|loss date)\b", re.IGNORECASE)
+ACCIDENT_DATE_LABEL = re.compile(
+    r"(?i:date of (?:the )?(?:loss|accident|incident|collision|injury)|loss date|accident date|d/o/l|dol)\s*[:\-]?\s*$")
+# Labelled identifiers; label matching ignores case, values must be upper case
+_ID_VALUE = r"([A-Z0-9]{1,4}(?:[ \-]?[A-Z0-9]{1,5}){0,3})"
+PLATE_PATTERN = re.compile(r"\b(?i:plate)\b(?:\s*(?i:no\.?|number|#))?\s*[:#]?\s*" + _ID_VALUE)
+POLICY_NUMBER_PATTERN = re.compile(r"(?i:policy)\s*(?i:no\.?|number|#)\s*[:#]?\s*([A-Z0-9][A-Z0-9\-]{4,})")
+LICENSE_PATTERN = re.compile(r"(?i:license)(?:\s*(?i:no\.?|number))?\s*[:#]\s*([A-Z0-9][A-Z0-9\-]{4,})")
+VIN_PATTERN = re.compile(r"\b[A-HJ-NPR-Z0-9]{17}\b")
+# Letter prefix and digits of identifiers like "GA-987654321", to catch look-alikes under any label
+PREFIXED_IDENTIFIER = re.compile(r"^([A-Z]{1,4})[ \-]?(\d{5,})$")
+POLICY_LIMIT_PATTERN = re.compile(r"(?i:policy limits?)(?:\s+(?i:of))?\s*[:\-]?\s*" + AMOUNT_PATTERN.pattern)
+# A person's name after "insured" or "defendant": two or three capitalized words, not followed by a further one
+INSURED_PATTERN = re.compile(
+    r"(?i:insured|defendant|at-fault driver)\s*[:,]?\s*((?:[A-Z][a-z'’\-]+ ){1,2}[A-Z][a-z'’\-]+)\b(?! [A-Z&])")
+# Words that make a capitalized phrase an organization or a role rather than a person
+NON_PERSON_WORDS = frozenset("""
+agency assurance auto automobile bank carrier casualty claim co company corp corporation driver enterprises fleet
+group holdings inc indemnity insurance insurer limited llc llp logistics ltd motorist motors mutual owner partners
+party policy rentals services transport transportation trucking underwriters vehicle
+""".split())
+
+MEDICAL_WORDS = re.compile(r"(?i:past medical|medical (?:expenses|bills|specials|costs|charges)|billed)")
+WAGE_WORDS = re.compile(r"(?i:lost wages|wage loss|lost (?:income|earnings))")
+# How far around a keyword a date is still read as belonging to it
+CONTEXT_CHARS = 120
+# How far after a keyword an amount is still read as belonging to it
+AMOUNT_CONTEXT_CHARS = 60
+
+
+def configure_precheck(mode=None):
+    """
+    Override the pre-check mode for this process.
+
+    Args:
+        mode: One of PRECHECK_MODES
+    """
+    global PRECHECK_MODE
+    if mode is not None:
+        if mode not in PRECHECK_MODES:
+            raise ValueError(f"Unknown pre-check mode {mode!r}, expected one of {PRECHECK_MODES}")
+        PRECHECK_MODE = mode
+
+
+def _year(text):
+    year = int(text.replace(" ", ""))
+    return year + 2000 if year < 100 else year
+
+
+def find_dates(text):
+    """
+    Find the dates written in a text.
+
+    Returns:
+        List of (date, start, end), in order of appearance
+    """
+    found = {}
+    for pattern in DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            parts = match.groupdict()
+            month = MONTHS[parts["month"].lower()] if parts.get("month") else int(parts["mon"])
+            try:
+                found[match.start()] = (date(_year(parts["year"]), month, int(parts["day"])), match.start(), match.end())
+            except ValueError:
+                continue
+    return [found[start] for start in sorted(found)]
+
+
+def parse_amount(text):
+    """Parse "$1,234.56" (or "1,234.56") into a float, or None."""
+    match = AMOUNT_PATTERN.search(text if "$" in text else f"${text}")
+    return float(match.group(1).replace(",", "") + (match.group(2) or "")) if match else None
+
+
+def find_amounts(text):
+    """
+    Find the dollar amounts in a text.
+
+    Returns:
+        List of (amount, start, end), in order of appearance
+    """
+    return [(float(match.group(1).replace(",", "") + (match.group(2) or "")), match.start(), match.end())
+            for match in AMOUNT_PATTERN.finditer(text)]
+
+
+def normalize_identifier(value):
+    """Upper-case an identifier and drop spaces and punctuation, so "AZ 8XZ-213" matches "az8xz213"."""
+    return re.sub(r"[^A-Z0-9]", "", str(value).upper())
+
+
+def identifier_matches(value, truth):
+    """
+    Whether an identifier read from a letter is exactly the expected one.
+
+    The value may run on into the next word ("AZ 8XZ-213 VIN"), so it matches
+    when a leading run of its space- or hyphen-separated parts normalizes to
+    exactly `truth`; a part of the identifier ("8XZ") does not match.
+    """
+    parts = re.split(r"[ \-]", value)
+    return any(normalize_identifier("".join(parts[:count])) == truth for count in range(1, len(parts) + 1))
+
+
+def load_case_metadata(case_dir):
+    """Load source_documents/case_metadata.json of a case, or None if there is none."""
+    metadata_file = Path(case_dir) / "source_documents" / "case_metadata.json"
+    try:
+        with open(metadata_file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+_lock = threading.Lock()
+# Case folder -> (statement file signature, totals)
+_totals = {}
+
+
+def source_totals(case_dir):
+    """
+    Read the billed medical total and the lost wage total from the case's statements.
+
+    Billing statements are recognized by "bill" in the file name and wage
+    statements by "wage"; the total is the amount following the last line
+    starting with "total". The totals are kept in memory until a statement
+    file changes, so the statements are read once per case, not per letter.
+
+    Returns:
+        Dictionary with "medical" and/or "wages" totals
+    """
+    statements = []
+    for doc_path in sorted((Path(case_dir) / "source_documents").glob("*.pdf")):
+        name = doc_path.stem.lower()
+        kind = "medical" if "bill" in name else "wages" if "wage" in name else None
+        if kind is not None:
+            statements.append((kind, doc_path))
+    signature = tuple((path.name, path.stat().st_mtime_ns, path.stat().st_size) for _, path in statements)
+    key = Path(case_dir).resolve()
+    with _lock:
+        cached = _totals.get(key)
+    if cached is not None and cached[0] == signature:
+        return dict(cached[1])
+
+    totals = {}
+    for kind, doc_path in statements:
+        text = extract_text_from_pdf(doc_path)
+        matches = list(re.finditer(r"(?im)^\s*total\b[^\n$]*[:\s]*\$\s?[\d,]+(?:\.\d{2})?", text))
+        if matches:
+            totals[kind] = parse_amount(matches[-1].group(0))
+    with _lock:
+        _totals[key] = (signature, totals)
+    return dict(totals)
+
+
+def _finding(findings, check, severity, message, expected=None, found=None):
+    findings.append({"check": check, "severity": severity, "message": message, "expected": expected, "found": found})
+
+
+def check_letter(text, metadata, totals=None):
+    """
+    Cross-check a letter's text against the case metadata and statement totals.
+
+    Args:
+        text: Text of the demand letter
+        metadata: Contents of case_metadata.json
+        totals: Statement totals (see source_totals)
+
+    Returns:
+        List of findings, each with check, severity, message, expected and found
+    """
+    findings = []
+    totals = totals or {}
+    vehicle = metadata.get("vehicle_info") or {}
+    dates = find_dates(text)
+    letter_amounts = {round(amount, 2) for amount, _, _ in find_amounts(text)}
+
+    # Accident date: a labelled date must match, and a letter that dates the
+    # accident at all must use the right date somewhere
+    if metadata.get("accident_date"):
+        expected = date.fromisoformat(metadata["accident_date"])
+        labelled = {found for found, start, _ in dates if ACCIDENT_DATE_LABEL.search(text[max(0, start - 40):start])}
+        context = {found for found, start, end in dates
+                   if ACCIDENT_WORDS.search(text[max(0, start - CONTEXT_CHARS):end + CONTEXT_CHARS])}
+        mentioned = {found for found, _, _ in dates}
+        if labelled - {expected}:
+            _finding(findings, "accident_date", "error", "The letter gives the wrong date of loss",
+                     str(expected), sorted(str(d) for d in labelled - {expected}))
+        elif expected not in mentioned and context:
+            _finding(findings, "accident_date", "error", "The accident date in the records is not the one in the letter",
+                     str(expected), sorted(str(d) for d in context))
+        elif expected not in mentioned:
+            _finding(findings, "accident_date", "warning", "The letter does not state the accident date", str(expected))
+
+    # Parties: names are read heuristically, so a mismatch is only a warning
+    if metadata.get("claimant_name"):
+        last_name = metadata["claimant_name"].split()[-1]
+        if not re.search(rf"\b{re.escape(last_name)}\b", text):
+            _finding(findings, "claimant_name", "warning", "The letter does not name the claimant", metadata["claimant_name"])
+    if metadata.get("defendant_name"):
+        known = {metadata["defendant_name"].split()[-1], (metadata.get("claimant_name") or " ").split()[-1]}
+        named = {match.group(1) for match in INSURED_PATTERN.finditer(text)
+                 if not NON_PERSON_WORDS & {word.lower() for word in match.group(1).split()}}
+        wrong = sorted(name for name in named if name.split()[-1] not in known)
+        if wrong:
+            _finding(findings, "defendant_name", "warning", "The letter names a different insured or defendant",
+                     metadata["defendant_name"], wrong)
+        elif not re.search(rf"\b{re.escape(metadata['defendant_name'].split()[-1])}\b", text):
+            _finding(findings, "defendant_name", "warning", "The letter does not name the at-fault driver",
+                     metadata["defendant_name"])
+
+    # Identifiers: a value given in the letter must match the records
+    identifiers = [("plate", vehicle.get("plate"), PLATE_PATTERN), ("policy_number", vehicle.get("policy_number"), POLICY_NUMBER_PATTERN),
+                   ("defendant_license", metadata.get("defendant_license"), LICENSE_PATTERN)]
+    for check, expected, pattern in identifiers:
+        if not expected:
+            continue
+        truth = normalize_identifier(expected)
+        wrong = sorted({match.group(1) for match in pattern.finditer(text)
+                        if any(c.isdigit() for c in match.group(1)) and not identifier_matches(match.group(1), truth)})
+        prefixed = PREFIXED_IDENTIFIER.match(truth)
+        if prefixed:
+            prefix, digits = prefixed.groups()
+            lookalikes = re.finditer(rf"\b{prefix}[ \-]?\d{{{len(digits)}}}\b", text)
+            wrong = sorted(set(wrong) | {match.group(0) for match in lookalikes if normalize_identifier(match.group(0)) != truth})
+        if wrong:
+            _finding(findings, check, "error", f"The letter gives the wrong {check.replace('_', ' ')}", expected, wrong)
+    if vehicle.get("vin"):
+        wrong = sorted({vin for vin in VIN_PATTERN.findall(text)
+                        if any(c.isdigit() for c in vin) and any(c.isalpha() for c in vin) and vin != vehicle["vin"].upper()})
+        if wrong:
+            _finding(findings, "vin", "error", "The letter gives the wrong VIN", vehicle["vin"], wrong)
+
+    # Policy limit
+    if vehicle.get("policy_limit"):
+        expected = parse_amount(vehicle["policy_limit"])
+        stated = sorted({float(match.group(1).replace(",", "") + (match.group(2) or ""))
+                         for match in POLICY_LIMIT_PATTERN.finditer(text)} - {expected})
+        if stated:
+            _finding(findings, "policy_limit", "error", "The letter misstates the policy limit",
+                     vehicle["policy_limit"], [f"${amount:,.2f}" for amount in stated])
+
+    # Statement totals: amounts claimed for medical bills or lost wages should
+    # include the totals of the billing and wage statements
+    for check, words, total in (("medical_total", MEDICAL_WORDS, totals.get("medical")),
+                                ("wage_total", WAGE_WORDS, totals.get("wages"))):
+        if total is None:
+            continue
+        claimed = set()
+        for keyword in words.finditer(text):
+            following = AMOUNT_PATTERN.search(text, keyword.end(), keyword.end() + AMOUNT_CONTEXT_CHARS)
+            if following:
+                claimed.add(parse_amount(following.group(0)))
+        if claimed and round(total, 2) not in letter_amounts:
+            label = "billed medical" if check == "medical_total" else "lost wage"
+            _finding(findings, check, "warning", f"The amounts claimed do not include the {label} total from the statements",
+                     f"${total:,.2f}", [f"${amount:,.2f}" for amount in sorted(claimed)])
+
+    # Injuries and providers the records document
+    lowered = text.lower()
+    for injury in metadata.get("injuries", []):
+        key = " ".join(re.sub(r"\(.*?\)", "", injury).lower().split()[-2:])
+        if key and key not in lowered:
+            _finding(findings, "injuries", "warning", f"The letter does not mention {injury}", injury)
+    for facility in metadata.get("treatment_facilities", []):
+        key = " ".join(facility.split(" - ")[0].lower().split()[:2])
+        if key and key not in lowered:
+            _finding(findings, "treatment_facilities", "warning", f"The letter does not mention {facility}", facility)
+
+    return findings
+
+
+def precheck_letter(letter_path, case_dir):
+    """
+    Run the pre-check of a letter against its case.
+
+    Args:
+        letter_path: Path to the demand letter PDF
+        case_dir: Case folder holding source_documents/case_metadata.json
+
+    Returns:
+        Report with version, blocked, errors, warnings and findings, or None
+        when the pre-check is off or the case has no metadata
+    """
+    if PRECHECK_MODE == "off":
+        return None
+    metadata = load_case_metadata(case_dir)
+    if metadata is None:
+        return None
+    findings = check_letter(extract_text_from_pdf(letter_path), metadata, source_totals(case_dir))
+    errors = sum(finding["severity"] == "error" for finding in findings)
+    report = {
+        "version": PRECHECK_VERSION,
+        "blocked": bool(errors) and PRECHECK_MODE == "block",
+        "errors": errors,
+        "warnings": len(findings) - errors,
+        "findings": findings,
+    }
+    for finding in findings:
+        log = logger.warning if finding["severity"] == "error" else logger.info
+        log(f"Pre-check {Path(letter_path).name}: {finding['message']} (expected {finding['expected']}, found {finding['found']})")
+    return report
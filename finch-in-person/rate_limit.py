@@ -0,0 +1,269 @@
+"""
+Shared rate limiting and retries for every model call
+
+A single RateLimiter per process meters requests and tokens per minute with
+two token buckets. Each call reserves one request and its estimated token
+count before it is sent, and waits if either bucket is empty. The real token
+usage is settled once the response arrives. The account's limits are read from
+the x-ratelimit-* response headers, unless they are configured explicitly.
+
+Failed calls are retried with jittered exponential backoff. A server-sent
+Retry-After is honored, and a 429 pauses every caller sharing the limiter,
+not just the one that hit it.
+"""
+
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Requests and tokens per minute (0 = learn the limits from response headers)
+RATE_LIMIT_RPM = int(os.environ.get("FINCH_RPM", 0))
+RATE_LIMIT_TPM = int(os.environ.get("FINCH_TPM", 0))
+# Retries of a failed call, and the backoff between them in seconds
+MAX_RETRIES = int(os.environ.get("FINCH_MAX_RETRIES", 6))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# Completion tokens assumed for a request that does not cap them
+DEFAULT_COMPLETION_TOKENS = 1000
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at `per_minute` per minute.
+
+    Reservations are taken immediately and may drive the level negative;
+    the caller then waits until the bucket has refilled to zero. Not
+    thread-safe on its own; RateLimiter holds the lock.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        """Take `amount` (capped at the capacity) and return how long to wait before using it."""
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level * 60 / self.capacity)
+
+    def credit(self, amount, now):
+        """Return unused tokens to the bucket (or take more, if `amount` is negative)."""
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+    def resize(self, per_minute):
+        """Change the capacity, keeping the current fill ratio."""
+        if per_minute != self.capacity:
+            self.level = self.level * per_minute / self.capacity
+            self.capacity = per_minute
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits shared by every call in the process."""
+
+    def __init__(self, rpm=0, tpm=0):
+        """
+        Args:
+            rpm: Requests per minute (0 = no limit until learned from headers)
+            tpm: Tokens per minute (0 = no limit until learned from headers)
+        """
+        self._lock = threading.Lock()
+        self.fixed_rpm = bool(rpm)
+        self.fixed_tpm = bool(tpm)
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.paused_until = 0.0
+
+    def acquire(self, tokens=0):
+        """Block until one request with about `tokens` tokens may be sent."""
+        with self._lock:
+            now = time.monotonic()
+            wait = self.paused_until - now
+            if self.requests:
+                wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens and tokens:
+                wait = max(wait, self.tokens.reserve(tokens, now))
+        if wait > 0:
+            logger.debug(f"Rate limiter waiting {wait:.2f}s")
+            time.sleep(wait)
+
+    def settle(self, estimated, actual):
+        """Correct a reservation of `estimated` tokens once the `actual` usage is known."""
+        with self._lock:
+            if self.tokens and estimated != actual:
+                self.tokens.credit(estimated - actual, time.monotonic())
+
+    def pause(self, seconds):
+        """Hold back every caller for `seconds`, e.g. after a 429."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers):
+        """
+        Adopt the limits and remaining quota reported in x-ratelimit-* headers.
+
+        Limits set explicitly (FINCH_RPM / FINCH_TPM) are never overridden.
+        """
+        def number(name):
+            try:
+                return int(float(headers.get(name)))
+            except (TypeError, ValueError):
+                return None
+
+        limit_requests, limit_tokens = number("x-ratelimit-limit-requests"), number("x-ratelimit-limit-tokens")
+        remaining_requests = number("x-ratelimit-remaining-requests")
+        remaining_tokens = number("x-ratelimit-remaining-tokens")
+        with self._lock:
+            now = time.monotonic()
+            for attr, fixed, limit, remaining in (("requests", self.fixed_rpm, limit_requests, remaining_requests),
+                                                  ("tokens", self.fixed_tpm, limit_tokens, remaining_tokens)):
+                bucket = getattr(self, attr)
+                if not fixed and limit:
+                    if bucket is None:
+                        bucket = TokenBucket(limit)
+                        setattr(self, attr, bucket)
+                    bucket.resize(limit)
+                if bucket is not None and remaining is not None:
+                    # Other processes on the same key may have used quota too
+                    bucket._refill(now)
+                    bucket.level = min(bucket.level, remaining)
+
+
+_limiter = RateLimiter(RATE_LIMIT_RPM, RATE_LIMIT_TPM)
+
+
+def get_rate_limiter():
+    """Return the process-wide rate limiter."""
+    return _limiter
+
+
+def configure_rate_limits(rpm=None, tpm=None, max_retries=None):
+    """
+    Override the rate limit settings for this process.
+
+    Args:
+        rpm: Requests per minute (0 = learn from response headers)
+        tpm: Tokens per minute (0 = learn from response headers)
+        max_retries: Retries of a failed call
+    """
+    global _limiter, MAX_RETRIES
+    if rpm is not None or tpm is not None:
+        _limiter = RateLimiter(RATE_LIMIT_RPM if rpm is None else rpm, RATE_LIMIT_TPM if tpm is None else tpm)
+    if max_retries is not None:
+        MAX_RETRIES = max_retries
+
+
+def estimate_request_tokens(request):
+    """
+    Estimate the tokens a chat completion request counts against the TPM limit.
+
+    The prompt is estimated at four characters per token; the completion at
+    the request's token cap, or DEFAULT_COMPLETION_TOKENS without one.
+    """
+    characters = 0
+    for message in request.get("messages", []):
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        characters += len(content)
+    completion = request.get("max_completion_tokens") or request.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    return characters // 4 + completion
+
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _is_retryable(error):
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    # Connection errors and timeouts carry no status code
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout",
+                                    "ConnectTimeout", "RemoteProtocolError")
+
+
+def retry_after(error):
+    """Return the delay the server asked for in a Retry-After header, in seconds, or None."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, error=None):
+    """
+    Seconds to wait before retry number `attempt` (0-based).
+
+    A Retry-After from the server wins; otherwise the delay doubles per
+    attempt up to BACKOFF_MAX, with jitter so concurrent callers spread out.
+    """
+    requested = retry_after(error) if error is not None else None
+    if requested is not None:
+        return requested + random.uniform(0, 0.1 * requested + 0.1)
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+def call_with_backoff(func, tokens=0, limiter=None, max_retries=None, on_retry=None):
+    """
+    Call `func` through the rate limiter, retrying transient failures.
+
+    Args:
+        func: Zero-argument callable making one API request
+        tokens: Estimated tokens of the request (see estimate_request_tokens)
+        limiter: Rate limiter to use (default: the process-wide one)
+        max_retries: Retries before giving up (default: MAX_RETRIES)
+        on_retry: Called as on_retry(error, delay) before every retry
+
+    Returns:
+        The return value of `func`
+
+    Raises:
+        The last error once the retries are used up, or any non-retryable error
+    """
+    limiter = limiter or get_rate_limiter()
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        limiter.acquire(tokens)
+        try:
+            return func()
+        except Exception as e:
+            # A failed request is not billed, so its tokens go back to the bucket
+            limiter.settle(tokens, 0)
+            if attempt >= max_retries or not _is_retryable(e):
+                raise
+            delay = backoff_delay(attempt, e)
+            if _status_code(e) == 429:
+                limiter.pause(delay)
+            logger.warning(f"Request failed ({_status_code(e) or type(e).__name__}), retry {attempt + 1} of "
+                           f"{max_retries} in {delay:.1f}s")
+            if on_retry:
+                on_retry(e, delay)
+            time.sleep(delay)
+            attempt += 1
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Indexed results store for the Demand Letter Evaluator
+
+Every evaluation is also recorded in one SQLite database shared by all cases,
+alongside the per-letter JSON files. Evaluations are grouped into runs and
+kept historically, and each category score has its own indexed row, so
+rankings, per-category comparisons and aggregates across thousands of letters
+are single queries instead of passes over JSON files.
+
+Usage:
+    python results_store.py import data/ cases/*/      Backfill stored JSON results
+    python results_store.py leaderboard --limit 100    Rank letters across all cases
+    python results_store.py history <case_id> <letter> Scores of one letter over time
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Database shared by every case (override with FINCH_RESULTS_DB or --results-db)
+RESULTS_DB = Path(os.environ.get("FINCH_RESULTS_DB", Path(__file__).resolve().parent / "results.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at TEXT NOT NULL,
+    command TEXT,
+    config TEXT
+);
+CREATE TABLE IF NOT EXISTS evaluations (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER REFERENCES runs(id),
+    case_id TEXT NOT NULL,
+    letter_name TEXT NOT NULL,
+    model TEXT,
+    weighted_score REAL,
+    input_fingerprint TEXT,
+    result_hash TEXT NOT NULL,
+    evaluated_at TEXT NOT NULL,
+    latest INTEGER NOT NULL DEFAULT 1,
+    result TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS evaluations_letter ON evaluations (case_id, letter_name, model, latest);
+CREATE INDEX IF NOT EXISTS evaluations_ranking ON evaluations (latest, weighted_score DESC);
+CREATE INDEX IF NOT EXISTS evaluations_case_ranking ON evaluations (case_id, latest, weighted_score DESC);
+CREATE INDEX IF NOT EXISTS evaluations_run ON evaluations (run_id);
+CREATE TABLE IF NOT EXISTS category_scores (
+    evaluation_id INTEGER NOT NULL REFERENCES evaluations(id),
+    category TEXT NOT NULL,
+    score REAL,
+    explanation TEXT,
+    PRIMARY KEY (evaluation_id, category)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS category_scores_ranking ON category_scores (category, score DESC);
+"""
+
+
+def case_id_for(case_dir):
+    """Use the case_id from case_metadata.json when there is one, else the folder name."""
+    metadata_file = Path(case_dir) / "source_documents" / "case_metadata.json"
+    try:
+        with open(metadata_file, 'r') as f:
+            return json.load(f).get("case_id") or Path(case_dir).resolve().name
+    except (OSError, ValueError):
+        return Path(case_dir).resolve().name
+
+
+class ResultsStore:
+    """
+    SQLite store of evaluation runs, evaluations and category scores.
+
+    Only the newest scored evaluation of each (case, letter, model) is flagged
+    `latest`; rankings and reports read those, older ones remain as history.
+    Results without a score (errors, letters blocked by the pre-check) are
+    kept as history only, so they never hide the last valid score.
+    One connection is shared by all threads of a process; WAL mode lets
+    several processes read while one writes.
+    """
+
+    def __init__(self, path=RESULTS_DB, run_config=None):
+        """
+        Args:
+            path: SQLite database file (created if missing)
+            run_config: Settings recorded with the run this process starts
+        """
+        self.path = Path(path)
+        self.run_config = run_config
+        self._run_id = None
+        self._lock = threading.RLock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def run_id(self):
+        """Return the id of this process's run, registering the run on first use."""
+        with self._lock:
+            if self._run_id is None:
+                with self.conn:
+                    cursor = self.conn.execute(
+                        "INSERT INTO runs (started_at, command, config) VALUES (?, ?, ?)",
+                        (datetime.now(timezone.utc).isoformat(), " ".join(sys.argv),
+                         json.dumps(self.run_config, default=str) if self.run_config else None))
+                self._run_id = cursor.lastrowid
+            return self._run_id
+
+    def add_evaluation(self, result, case_id, run_id=None):
+        """
+        Record one evaluation result.
+
+        A result identical to the latest stored one of the same letter and
+        model (e.g. a reused evaluation) is not stored again. A result without
+        a score is stored as history and leaves the latest flag where it is.
+
+        Args:
+            result: Evaluation result dictionary
+            case_id: Case the letter belongs to
+            run_id: Run to file the result under (default: this process's run)
+
+        Returns:
+            Id of the evaluation row
+        """
+        return self.add_evaluations([result], case_id, run_id)[0]
+
+    def add_evaluations(self, results, case_id, run_id=None):
+        """Record several evaluation results of one case in a single transaction (see add_evaluation)."""
+        evaluated_at = datetime.now(timezone.utc).isoformat()
+        ids = [None] * len(results)
+        with self._lock:
+            new = []
+            for idx, result in enumerate(results):
+                text = json.dumps(result, sort_keys=True, default=str)
+                result_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                scored = result.get("weighted_score") is not None
+                # Scored results are compared with the latest one, unscored ones with the newest row
+                previous = self.conn.execute(
+                    "SELECT id, result_hash FROM evaluations WHERE case_id = ? AND letter_name = ? AND model IS ?"
+                    + (" AND latest = 1" if scored else " ORDER BY id DESC LIMIT 1"),
+                    (case_id, result.get("letter_name"), result.get("model_used"))).fetchone()
+                if previous is not None and previous["result_hash"] == result_hash:
+                    ids[idx] = previous["id"]
+                else:
+                    new.append((idx, result, text, result_hash, previous if scored else None, scored))
+            if not new:
+                return ids
+
+            # The run is only registered once it has something to store
+            run_id = run_id or self.run_id()
+            with self.conn:
+                for idx, result, text, result_hash, latest, scored in new:
+                    if latest is not None:
+                        self.conn.execute("UPDATE evaluations SET latest = 0 WHERE id = ?", (latest["id"],))
+                    cursor = self.conn.execute(
+                        "INSERT INTO evaluations (run_id, case_id, letter_name, model, weighted_score, input_fingerprint, "
+                        "result_hash, evaluated_at, latest, result) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (run_id, case_id, result.get("letter_name"), result.get("model_used"), result.get("weighted_score"),
+                         result.get("input_fingerprint"), result_hash, evaluated_at, int(scored), text))
+                    self.conn.executemany(
+                        "INSERT INTO category_scores (evaluation_id, category, score, explanation) VALUES (?, ?, ?, ?)",
+                        [(cursor.lastrowid, category, data.get("score"), data.get("explanation"))
+                         for category, data in result.get("category_scores", {}).items() if isinstance(data, dict)])
+                    ids[idx] = cursor.lastrowid
+        return ids
+
+    def import_results(self, case_dir):
+        """
+        Backfill the JSON results of a case folder.
+
+        Returns:
+            Number of results read
+        """
+        results = []
+        for result_file in sorted((Path(case_dir) / "results").glob("*_evaluation.json")):
+            try:
+                with open(result_file, 'r') as f:
+                    results.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not load {result_file}: {e}")
+        self.add_evaluations(results, case_id_for(case_dir))
+        return len(results)
+
+    def _filters(self, case_id=None, model=None):
+        clauses, params = ["e.latest = 1", "e.weighted_score IS NOT NULL"], []
+        if case_id is not None:
+            clauses.append("e.case_id = ?")
+            params.append(case_id)
+        if model is not None:
+            clauses.append("e.model = ?")
+            params.append(model)
+        return " AND ".join(clauses), params
+
+    def leaderboard(self, case_id=None, model=None, limit=None):
+        """
+        Rank the latest scored evaluations by weighted score.
+
+        Args:
+            case_id: Restrict to one case (default: all cases)
+            model: Restrict to one evaluation model
+            limit: Return only the top `limit` letters
+
+        Returns:
+            List of rows with case_id, letter_name, model, weighted_score and evaluated_at
+        """
+        where, params = self._filters(case_id, model)
+        query = (f"SELECT e.case_id, e.letter_name, e.model, e.weighted_score, e.evaluated_at FROM evaluations e "
+                 f"WHERE {where} ORDER BY e.weighted_score DESC, e.case_id, e.letter_name")
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def category_rankings(self, case_id=None, model=None):
+        """
+        Return the category scores of the latest evaluations, best first within each category.
+
+        Returns:
+            Dictionary of category -> list of rows with case_id, letter_name, model, score and explanation
+        """
+        where, params = self._filters(case_id, model)
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT c.category, e.case_id, e.letter_name, e.model, c.score, c.explanation FROM category_scores c "
+                f"JOIN evaluations e ON e.id = c.evaluation_id WHERE {where} "
+                f"ORDER BY c.category, c.score DESC, e.case_id, e.letter_name", params).fetchall()
+        rankings = {}
+        for row in rows:
+            rankings.setdefault(row["category"], []).append(row)
+        return rankings
+
+    def category_summary(self, case_id=None, model=None):
+        """
+        Aggregate the latest category scores.
+
+        Returns:
+            Dictionary of category -> {"letters", "mean", "min", "max"}
+        """
+        where, params = self._filters(case_id, model)
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT c.category, COUNT(c.score) AS letters, AVG(c.score) AS mean, MIN(c.score) AS min, "
+                f"MAX(c.score) AS max FROM category_scores c JOIN evaluations e ON e.id = c.evaluation_id "
+                f"WHERE {where} GROUP BY c.category", params).fetchall()
+        return {row["category"]: {key: row[key] for key in ("letters", "mean", "min", "max")} for row in rows}
+
+    def history(self, case_id, letter_name, model=None):
+        """Return every stored evaluation of a letter, oldest first, with its run."""
+        query = ("SELECT e.id, e.run_id, e.model, e.weighted_score, e.input_fingerprint, e.evaluated_at, e.latest "
+                 "FROM evaluations e WHERE e.case_id = ? AND e.letter_name = ?")
+        params = [case_id, letter_name]
+        if model is not None:
+            query += " AND e.model = ?"
+            params.append(model)
+        with self._lock:
+            return self.conn.execute(query + " ORDER BY e.id", params).fetchall()
+
+
+_store = None
+_store_path = RESULTS_DB
+_run_config = None
+_store_lock = threading.Lock()
+
+
+def configure_results_store(path=None, run_config=None):
+    """
+    Override the results store settings for this process.
+
+    Args:
+        path: SQLite database file
+        run_config: Settings recorded with this process's run (e.g. the command line arguments)
+    """
+    global _store, _store_path, _run_config
+    with _store_lock:
+        if path is not None and Path(path) != _store_path:
+            _store_path = Path(path)
+            _store = None
+        if run_config is not None:
+            _run_config = run_config
+            if _store is not None:
+                _store.run_config = run_config
+
+
+def get_results_store():
+    """Return the process-wide results store, opening the database on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResultsStore(_store_path, run_config=_run_config)
+        return _store
+
+
+def render_leaderboard(store, case_id=None, model=None, limit=None):
+    """
+    Render a markdown leaderboard of the latest evaluations.
+
+    Args:
+        store: ResultsStore to read from
+        case_id: Restrict to one case (default: all cases)
+        model: Restrict to one evaluation model
+        limit: Number of letters to list (default: all)
+
+    Returns:
+        Markdown report
+    """
+    from utils import CATEGORY_WEIGHTS
+
+    scope = f"case {case_id}" if case_id else "all cases"
+    lines = [f"# Demand Letter Leaderboard ({scope})", "", "| Rank | Case | Letter | Model | Score |",
+             "|---:|---|---|---|---:|"]
+    lines.extend(f"| {rank} | {row['case_id']} | {row['letter_name']} | {row['model']} | {row['weighted_score']:.2f} |"
+                 for rank, row in enumerate(store.leaderboard(case_id, model, limit), 1))
+
+    summary = store.category_summary(case_id, model)
+    lines += ["", "## Category Scores", "", "| Category | Weight | Letters | Mean | Min | Max |", "|---|---:|---:|---:|---:|---:|"]
+    for category in list(CATEGORY_WEIGHTS) + sorted(set(summary) - set(CATEGORY_WEIGHTS)):
+        if category in summary:
+            stats = summary[category]
+            weight = f"{CATEGORY_WEIGHTS[category]:.0%}" if category in CATEGORY_WEIGHTS else "-"
+            lines.append(f"| {category} | {weight} | {stats['letters']} | {stats['mean']:.2f} | "
+                         f"{stats['min']:g} | {stats['max']:g} |")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    """Command line access to the results store."""
+    parser = argparse.ArgumentParser(description="Query and backfill the demand letter results store.")
+    parser.add_argument("--results-db", help="SQLite database file (default: results.db next to this script, or FINCH_RESULTS_DB)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Backfill the JSON results of case folders")
+    import_parser.add_argument("case_dirs", nargs="+", help="Case folders with a results/ folder")
+
+    leaderboard_parser = commands.add_parser("leaderboard", help="Rank the latest evaluations")
+    leaderboard_parser.add_argument("--case", help="Restrict to one case_id")
+    leaderboard_parser.add_argument("--model", help="Restrict to one evaluation model")
+    leaderboard_parser.add_argument("--limit", type=int, help="Number of letters to list")
+    leaderboard_parser.add_argument("--output", help="Write the markdown report to this file instead of printing it")
+
+    history_parser = commands.add_parser("history", help="List every stored evaluation of a letter")
+    history_parser.add_argument("case_id")
+    history_parser.add_argument("letter_name")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    configure_results_store(path=args.results_db, run_config={"command": args.command})
+    store = get_results_store()
+    if args.command == "import":
+        for case_dir in args.case_dirs:
+            logger.info(f"Imported {store.import_results(case_dir)} results from {case_dir}")
+    elif args.command == "leaderboard":
+        report = render_leaderboard(store, case_id=args.case, model=args.model, limit=args.limit)
+        if args.output:
+            Path(args.output).write_text(report)
+            logger.info(f"Leaderboard saved to {args.output}")
+        else:
+            print(report, end="")
+    else:
+        for row in store.history(args.case_id, args.letter_name):
+            marker = " (latest)" if row["latest"] else ""
+            print(f"{row['evaluated_at']}  run {row['run_id']}  {row['model']}  {row['weighted_score']}{marker}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Local retrieval over source document passages for the Demand Letter Evaluator
+
+Each case's extracted source text is split into short passages and indexed
+with BM25, entirely offline. When a letter is evaluated, every section of the
+letter is used as a query, and the best passages for each section are put in
+the prompt under a token budget. The evaluator then checks the letter against
+the original records instead of (or next to) the lossy consolidated summary.
+"""
+
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+
+from cache import CACHE_DIR, DiskCache
+from utils import chunk_text, count_tokens, extract_text_from_pdf, file_sha256
+
+logger = logging.getLogger(__name__)
+
+# Evidence given to the evaluator. Modes:
+#   passages – source passages retrieved for the letter (falls back to the summary without an index)
+#   summary  – the consolidated facts summary only
+#   both     – the summary, followed by the retrieved passages
+# The summary is built either way (the drafter and the fallback need it), so
+# "both" is the default and "passages" only saves evaluation prompt tokens.
+EVIDENCE_MODES = ("passages", "summary", "both")
+EVIDENCE_MODE = os.environ.get("FINCH_EVIDENCE", "both")
+# Maximum size of the retrieved passages in the evaluation prompt, in tokens
+EVIDENCE_TOKEN_BUDGET = int(os.environ.get("FINCH_EVIDENCE_BUDGET", 4000))
+# Size of an indexed passage in tokens, and of a letter section used as a query in characters
+PASSAGE_TOKENS = 200
+QUERY_CHARS = 600
+# Bump when the passage splitting changes so stored indexes are rebuilt
+INDEX_VERSION = "1"
+INDEX_NAME = "retrieval_index.json"
+# Passages selected per letter, so unchanged letters skip the search on reruns
+_selection_cache = DiskCache(CACHE_DIR / "passages", max_bytes=16 * 1024 * 1024)
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Distinct terms scored per query, rarest first
+MAX_QUERY_TERMS = 24
+
+STOPWORDS = frozenset("""
+a an and are as at be been by for from had has have he her his i in is it its of on or our she that the their
+this to was we were will with you your which who not no but all any also than then there these they those
+""".split())
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[./-][a-z0-9]+)*")
+_THOUSANDS_SEPARATOR = re.compile(r"(?<=\d),(?=\d{3}\b)")
+
+
+def configure_retrieval(mode=None, budget=None):
+    """
+    Override the evidence settings for this process.
+
+    Args:
+        mode: One of EVIDENCE_MODES
+        budget: Maximum tokens of retrieved passages per evaluation prompt
+    """
+    global EVIDENCE_MODE, EVIDENCE_TOKEN_BUDGET
+    if mode is not None:
+        if mode not in EVIDENCE_MODES:
+            raise ValueError(f"Unknown evidence mode {mode!r}, expected one of {EVIDENCE_MODES}")
+        EVIDENCE_MODE = mode
+    if budget is not None:
+        EVIDENCE_TOKEN_BUDGET = budget
+
+
+def tokenize(text):
+    """
+    Split a text into lowercase search terms.
+
+    Dates, amounts and identifiers stay whole ("03/14/2024", "12500.00",
+    "7abc123"), so they match exactly between the letter and the records.
+    """
+    text = _THOUSANDS_SEPARATOR.sub("", text.lower())
+    return [term for term in _TOKEN_PATTERN.findall(text) if term not in STOPWORDS]
+
+
+def query_sections(text):
+    """
+    Split a letter into line-aligned sections of about QUERY_CHARS characters.
+
+    Sections are only used as queries, so they are measured in characters
+    rather than tokens, which keeps the tokenizer out of cached runs.
+    """
+    sections, current = [], []
+    size = 0
+    for line in text.splitlines():
+        if current and size + len(line) > QUERY_CHARS:
+            sections.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        sections.append("\n".join(current))
+    return [section for section in sections if section.strip()]
+
+
+class BM25Index:
+    """
+    An in-memory BM25 index over source passages.
+
+    The BM25 weight of every term in every passage does not depend on the
+    query, so it is computed once when the index is built; a search only
+    adds up the weights of the query's terms.
+    """
+
+    def __init__(self, passages, key=None):
+        """
+        Args:
+            passages: List of {"document", "position", "text", "tokens"} dictionaries
+            key: Identifies the indexed source files; enables caching selections
+        """
+        self.passages = passages
+        self.key = key
+        counts = [Counter(tokenize(passage["text"])) for passage in passages]
+        lengths = [sum(terms.values()) for terms in counts]
+        average_length = sum(lengths) / len(lengths) if lengths else 0.0
+        self.postings = {}
+        for idx, terms in enumerate(counts):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[idx] / average_length) if average_length else BM25_K1
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, []).append((idx, frequency * (BM25_K1 + 1) / (frequency + norm)))
+        count = len(passages)
+        self.idf = {term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for term, postings in self.postings.items()}
+
+    def search(self, query, limit=5):
+        """
+        Find the passages that best match a query.
+
+        Only the query's MAX_QUERY_TERMS rarest terms are scored; common
+        words add little to BM25 but most of its cost.
+
+        Args:
+            query: Free text
+            limit: Maximum number of passages to return
+
+        Returns:
+            List of (score, passage index), best first
+        """
+        terms = sorted((term for term in set(tokenize(query)) if term in self.idf), key=self.idf.get, reverse=True)
+        scores = {}
+        for term in terms[:MAX_QUERY_TERMS]:
+            idf = self.idf[term]
+            for idx, weight in self.postings[term]:
+                scores[idx] = scores.get(idx, 0.0) + idf * weight
+        return heapq.nlargest(limit, ((score, idx) for idx, score in scores.items()))
+
+    def select_passages(self, text, token_budget=None, per_section=3):
+        """
+        Pick the source passages most relevant to each section of a text.
+
+        Sections take turns: every section's best passage is chosen before
+        any section's second best, so claims from all over the letter are
+        covered before the budget runs out.
+
+        Args:
+            text: Text to find evidence for (the demand letter)
+            token_budget: Maximum total tokens of the selected passages
+            per_section: Candidate passages considered per section
+
+        Returns:
+            Selected passages, in document order
+        """
+        token_budget = EVIDENCE_TOKEN_BUDGET if token_budget is None else token_budget
+        cache_key = None
+        if self.key:
+            cache_key = hashlib.sha256(json.dumps([self.key, text, token_budget, per_section, MAX_QUERY_TERMS,
+                                                   QUERY_CHARS]).encode("utf-8")).hexdigest()
+            cached = _selection_cache.get(cache_key)
+            if cached is not None:
+                return [self.passages[idx] for idx in cached["selected"]]
+
+        candidates = [self.search(section, per_section) for section in query_sections(text)]
+        selected, used = set(), 0
+        for rank in range(per_section):
+            for hits in candidates:
+                if rank >= len(hits) or hits[rank][1] in selected:
+                    continue
+                idx = hits[rank][1]
+                if used + self.passages[idx]["tokens"] <= token_budget:
+                    selected.add(idx)
+                    used += self.passages[idx]["tokens"]
+        if cache_key:
+            _selection_cache.put(cache_key, {"selected": sorted(selected)})
+        return [self.passages[idx] for idx in sorted(selected)]
+
+
+def format_passages(passages):
+    """Render selected passages for the evaluation prompt."""
+    return "\n\n".join(f"[{passage['document']}, passage {passage['position'] + 1}]\n{passage['text'].strip()}"
+                       for passage in passages)
+
+
+def build_passages(source_files):
+    """Split the extracted text of each source PDF into indexable passages."""
+    passages = []
+    for doc_path in source_files:
+        text = extract_text_from_pdf(doc_path)
+        if not text.strip():
+            continue
+        for position, chunk in enumerate(chunk_text(text, PASSAGE_TOKENS)):
+            passages.append({"document": doc_path.stem, "position": position, "text": chunk,
+                             "tokens": count_tokens(chunk)})
+    return passages
+
+
+# Guards the two dictionaries below; indexes are built under their case's own lock
+_lock = threading.Lock()
+# Case folder -> lock held while that case's index is loaded or built
+_case_locks = {}
+# Case folder -> (source file signature, BM25Index or None)
+_indexes = {}
+
+
+def _case_lock(case_dir):
+    with _lock:
+        return _case_locks.setdefault(case_dir, threading.Lock())
+
+
+def load_case_index(case_dir):
+    """
+    Return the retrieval index of a case, building or refreshing it as needed.
+
+    The passages are stored in extracted_facts/retrieval_index.json with the
+    fingerprints of the source PDFs they came from, and rebuilt once any
+    source document is added, changed or removed. Within a process the index
+    stays loaded until the source files change. Each case is built under its
+    own lock, so building one case's index never holds up another case.
+
+    Args:
+        case_dir: Case folder holding source_documents/ and extracted_facts/
+
+    Returns:
+        BM25Index, or None if the case has no readable source PDFs
+    """
+    case_dir = Path(case_dir)
+    resolved = case_dir.resolve()
+    source_files = sorted((case_dir / "source_documents").glob("*.pdf"))
+    signature = tuple((path.name, path.stat().st_mtime_ns, path.stat().st_size) for path in source_files)
+    with _case_lock(resolved):
+        with _lock:
+            cached = _indexes.get(resolved)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        index = None
+        if source_files:
+            index_file = case_dir / "extracted_facts" / INDEX_NAME
+            fingerprints = {path.stem: file_sha256(path) for path in source_files}
+            stored = None
+            try:
+                with open(index_file, 'r') as f:
+                    stored = json.load(f)
+            except (OSError, ValueError):
+                pass
+            if stored and stored.get("version") == INDEX_VERSION and stored.get("fingerprints") == fingerprints:
+                passages = stored["passages"]
+            else:
+                logger.info(f"Building retrieval index for {case_dir}")
+                passages = build_passages(source_files)
+                index_file.parent.mkdir(parents=True, exist_ok=True)
+                tmp_file = index_file.with_name(f"{index_file.name}.tmp")
+                with open(tmp_file, 'w') as f:
+                    json.dump({"version": INDEX_VERSION, "fingerprints": fingerprints, "passages": passages}, f)
+                os.replace(tmp_file, index_file)
+            key = hashlib.sha256(json.dumps([INDEX_VERSION, fingerprints], sort_keys=True).encode("utf-8")).hexdigest()
+            index = BM25Index(passages, key=key) if passages else None
+        with _lock:
+            _indexes[resolved] = (signature, index)
+        return index
+
+
+def evidence_passages(case_dir, text):
+    """
+    Retrieve the source passages relevant to a letter, as prompt text.
+
+    Args:
+        case_dir: Case folder the letter belongs to
+        text: Text of the letter
+
+    Returns:
+        Formatted passages, or "" when the evidence mode is "summary" or the
+        case has no index
+    """
+    if EVIDENCE_MODE == "summary":
+        return ""
+    index = load_case_index(case_dir)
+    if index is None:
+        return ""
+    passages = index.select_passages(text)
+    logger.debug(f"Selected {len(passages)} source passages ({sum(p['tokens'] for p in passages)} tokens)")
+    return format_passages(passages)
+
+
+def summary_needed(passages_text):
+    """Whether the consolidated summary goes in the prompt next to these passages."""
+    return EVIDENCE_MODE != "passages" or not passages_text
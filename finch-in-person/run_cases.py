@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Demand Letter Evaluator - Multi-case Runner
+Extracts facts and evaluates letters for every case folder under a root
+directory, sharing one bounded worker pool across all cases.
+
+Each case folder has the same layout as `data/` (source_documents/,
+demand_letters/, extracted_facts/, results/). Progress is checkpointed in
+`run_manifest.json` under the root, so an interrupted run resumes where it
+stopped instead of starting over.
+"""
+
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+
+from cascade import configure_cascade
+from llm import configure_llm_cache
+from metrics import log_summary, write_prometheus_textfile, write_report
+from main import (SAMPLE_TOLERANCE, evaluate_or_reuse, extract_facts_from_source_documents, sample_count,
+                  save_comparison, save_evaluation, setup_folders)
+from precheck import PRECHECK_MODES, configure_precheck
+from rate_limit import configure_rate_limits
+from results_store import case_id_for, configure_results_store
+from retrieval import EVIDENCE_MODES, configure_retrieval
+from utils import configure_ocr
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "run_manifest.json"
+
+
+def find_cases(root):
+    """Return the case folders under `root`, sorted by name."""
+    return sorted(path for path in Path(root).iterdir()
+                  if path.is_dir() and ((path / "source_documents").is_dir() or (path / "demand_letters").is_dir()))
+
+
+def load_manifest(manifest_file):
+    """Load the checkpoint manifest, or start a new one."""
+    try:
+        with open(manifest_file, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"cases": {}}
+
+
+def save_manifest(manifest_file, manifest):
+    """Write the checkpoint manifest atomically."""
+    manifest["updated_at"] = datetime.now(timezone.utc).isoformat()
+    tmp_file = Path(f"{manifest_file}.tmp")
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_file, manifest_file)
+
+
+def letter_inputs(letter_path, case_dir):
+    """Signature of what a letter's evaluation was made from: the letter file and the case's facts file."""
+    letter = Path(letter_path).stat()
+    facts_file = Path(case_dir) / "extracted_facts" / "case_facts.json"
+    facts_mtime = facts_file.stat().st_mtime_ns if facts_file.exists() else None
+    return [letter.st_mtime_ns, letter.st_size, facts_mtime]
+
+
+def duplicate_case_ids(cases):
+    """Map each case folder whose case_id is shared with another folder to a description of the clash."""
+    folders = {}
+    for case_dir in cases:
+        folders.setdefault(case_id_for(case_dir), []).append(case_dir)
+    return {case_dir: f"case_id {case_id} is also used by {', '.join(other.name for other in dirs if other != case_dir)}"
+            for case_id, dirs in folders.items() if len(dirs) > 1 for case_dir in dirs}
+
+
+def _load_case_evaluations(case_dir, letter_names):
+    """Load the stored results of a case's letters."""
+    evaluations = []
+    for letter_name in letter_names:
+        result_file = Path(case_dir) / "results" / f"{Path(letter_name).stem}_evaluation.json"
+        try:
+            with open(result_file, 'r') as f:
+                evaluations.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load {result_file}: {e}")
+    return [e for e in evaluations if "weighted_score" in e]
+
+
+def run_cases(root, model="o3-2025-04-16", max_workers=4, force_reprocess=False, token_budget=None,
+              compare=False, restart=False, samples=1, extract_workers=1, force=False, tolerance=SAMPLE_TOLERANCE):
+    """
+    Process every case under `root` from one shared worker pool.
+
+    Fact extraction is scheduled for every unfinished case first; as soon as
+    a case's facts are ready, its letters are queued on the same pool. The
+    manifest records each case's status and each letter's outcome after every
+    completed job. A rerun checks every case, finished or not, but only queues
+    letters that are new, failed or pending, or whose letter file or case
+    facts changed since they were evaluated.
+
+    Cases are stored in the results store under their case_id, so folders
+    sharing a case_id would overwrite each other's results; such cases are
+    marked failed and not processed.
+
+    Args:
+        root: Folder containing one sub-folder per case
+        model: OpenAI model to use for evaluation
+        max_workers: Size of the worker pool shared by all cases
+        force_reprocess: Re-extract every source document of every case
+        token_budget: Maximum prompt size in tokens for fact extraction
+        compare: Write a comparison report for each finished case
+        restart: Ignore the manifest and process every case again
+        samples: Maximum number of evaluations to average per letter
+        extract_workers: Number of source documents of a case extracted concurrently
+        force: Re-evaluate every letter, even finished ones with unchanged inputs
+        tolerance: Agreement needed to stop sampling early
+
+    Returns:
+        The final manifest
+    """
+    root = Path(root)
+    manifest_file = root / MANIFEST_NAME
+    manifest = {"cases": {}} if restart else load_manifest(manifest_file)
+    cases = find_cases(root)
+    logger.info(f"Found {len(cases)} cases in {root}")
+    duplicates = duplicate_case_ids(cases)
+
+    pending = {}
+    remaining = {}
+
+    def finish_case(case_dir):
+        entry = manifest["cases"][case_dir.name]
+        letters = entry["letters"]
+        failed = [name for name, status in letters.items() if status != "done"]
+        entry["status"] = "incomplete" if failed else "done"
+        if compare:
+            evaluations = _load_case_evaluations(case_dir, [name for name, status in letters.items() if status == "done"])
+            if len(evaluations) >= 2:
+                save_comparison(evaluations, case_dir / "results")
+        logger.info(f"Case {entry['case_id']} {entry['status']} ({len(letters) - len(failed)}/{len(letters)} letters)")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for case_dir in cases:
+            entry = manifest["cases"].setdefault(case_dir.name, {"case_id": case_id_for(case_dir), "status": "pending", "letters": {}})
+            if case_dir in duplicates:
+                logger.error(f"Skipping case {case_dir.name}: {duplicates[case_dir]}")
+                entry.update(status="failed", error=duplicates[case_dir])
+                continue
+            entry.pop("error", None)
+            # Finished cases are checked too: fact extraction only picks up
+            # changed documents, and only new or changed letters are queued
+            setup_folders(case_dir)
+            future = executor.submit(extract_facts_from_source_documents, force_reprocess=force_reprocess,
+                                     max_workers=extract_workers, token_budget=token_budget, data_dir=case_dir)
+            pending[future] = ("facts", case_dir, None)
+
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, case_dir, letter_path = pending.pop(future)
+                    entry = manifest["cases"][case_dir.name]
+
+                    if kind == "facts":
+                        try:
+                            facts = future.result()
+                        except Exception as e:
+                            logger.error(f"Error extracting facts for case {entry['case_id']}: {e}")
+                            entry["status"] = "failed"
+                            continue
+                        entry["status"] = "evaluating"
+                        inputs = entry.setdefault("inputs", {})
+                        letters = sorted((case_dir / "demand_letters").glob("*.pdf"))
+                        # Forget letters that were removed from the case
+                        for name in set(entry["letters"]) - {path.name for path in letters}:
+                            del entry["letters"][name]
+                            inputs.pop(name, None)
+                        queued = 0
+                        for path in letters:
+                            # Finished letters are not submitted again unless
+                            # the letter or the facts changed
+                            if (not force and entry["letters"].get(path.name) == "done"
+                                    and inputs.get(path.name) == letter_inputs(path, case_dir)):
+                                continue
+                            entry["letters"][path.name] = "pending"
+                            future = executor.submit(evaluate_or_reuse, path, facts, model=model,
+                                                     results_dir=case_dir / "results", force=force,
+                                                     samples=samples, tolerance=tolerance)
+                            pending[future] = ("letter", case_dir, path)
+                            queued += 1
+                        remaining[case_dir] = queued
+                        if not queued:
+                            finish_case(case_dir)
+                    else:
+                        try:
+                            result, reused = future.result()
+                            if not reused:
+                                save_evaluation(letter_path, result, case_dir / "results")
+                            entry["letters"][letter_path.name] = "done"
+                            entry.setdefault("inputs", {})[letter_path.name] = letter_inputs(letter_path, case_dir)
+                        except Exception as e:
+                            logger.error(f"Error evaluating {letter_path}: {e}")
+                            entry["letters"][letter_path.name] = "failed"
+                        remaining[case_dir] -= 1
+                        if remaining[case_dir] == 0:
+                            finish_case(case_dir)
+
+                # Checkpoint after every batch of completed jobs
+                save_manifest(manifest_file, manifest)
+        except KeyboardInterrupt:
+            logger.warning("Interrupted, saving checkpoint; rerun to resume")
+            for future in pending:
+                future.cancel()
+            save_manifest(manifest_file, manifest)
+            raise
+
+    save_manifest(manifest_file, manifest)
+    return manifest
+
+
+def main():
+    """Main execution function."""
+    parser = argparse.ArgumentParser(description="Evaluate demand letters for every case folder under a root directory.")
+    parser.add_argument("root", help="Folder containing one sub-folder per case")
+    parser.add_argument("--model", default="o3-2025-04-16", help="OpenAI model to use for evaluation")
+    parser.add_argument("--workers", type=int, default=4, help="Size of the worker pool shared by all cases")
+    parser.add_argument("--reprocess", action="store_true", help="Force reprocessing of every source document")
+    parser.add_argument("--extract-workers", type=int, default=1, help="Number of source documents of a case to extract concurrently")
+    parser.add_argument("--force", action="store_true", help="Re-evaluate every letter, including finished cases and letters with unchanged inputs (see main.py)")
+    parser.add_argument("--compare", action="store_true", help="Write a comparison report for each finished case")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint manifest and process every case again")
+    parser.add_argument("--cascade", help="Comma-separated cheaper models that screen each letter before --model (see main.py)")
+    parser.add_argument("--decision-thresholds", help="Comma-separated weighted scores near which screening results are escalated (see main.py)")
+    parser.add_argument("--cascade-margin", type=float, help="Distance from a decision threshold within which screening scores are escalated (see main.py)")
+    parser.add_argument("--cascade-max-spread", type=float, help="Largest spread of one category's sample scores a screening result may have (see main.py)")
+    parser.add_argument("--samples", type=sample_count, default=1, help="Evaluate each letter up to this many times and average the scores (see main.py)")
+    parser.add_argument("--sample-tolerance", type=float, default=SAMPLE_TOLERANCE, help="Largest standard error of a category's mean score at which sampling stops (see main.py)")
+    parser.add_argument("--token-budget", type=int, help="Maximum prompt size in tokens for fact extraction and consolidation")
+    parser.add_argument("--ocr-dpi", type=int, help="Resolution scanned pages are rendered at for OCR (default: 300)")
+    parser.add_argument("--ocr-workers", type=int, help="Number of processes used to OCR scanned pages")
+    parser.add_argument("--llm-cache", choices=["on", "off", "replay"], help="Response cache mode (see main.py)")
+    parser.add_argument("--evidence", choices=EVIDENCE_MODES, help="Source evidence in the evaluation prompt (see main.py)")
+    parser.add_argument("--evidence-budget", type=int, help="Maximum tokens of retrieved source passages per evaluation prompt")
+    parser.add_argument("--precheck", choices=PRECHECK_MODES, help="Pre-check of letters against the case metadata (see main.py)")
+    parser.add_argument("--rpm", type=int, help="Requests per minute allowed by your OpenAI account (see main.py)")
+    parser.add_argument("--tpm", type=int, help="Tokens per minute allowed by your OpenAI account (see main.py)")
+    parser.add_argument("--max-retries", type=int, help="Retries of a rate limited or failed model call (see main.py)")
+    parser.add_argument("--results-db", help="SQLite results store shared by all cases (see main.py)")
+    parser.add_argument("--prometheus-textfile", help="Also write the run metrics in Prometheus textfile format to this path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    configure_ocr(dpi=args.ocr_dpi, workers=args.ocr_workers)
+    configure_llm_cache(mode=args.llm_cache)
+    configure_rate_limits(rpm=args.rpm, tpm=args.tpm, max_retries=args.max_retries)
+    configure_results_store(path=args.results_db, run_config=vars(args))
+    configure_retrieval(mode=args.evidence, budget=args.evidence_budget)
+    configure_precheck(mode=args.precheck)
+    configure_cascade(models=args.cascade, thresholds=args.decision_thresholds, margin=args.cascade_margin,
+                      max_spread=args.cascade_max_spread)
+
+    try:
+        manifest = run_cases(args.root, model=args.model, max_workers=args.workers, force_reprocess=args.reprocess,
+                             token_budget=args.token_budget, compare=args.compare, restart=args.restart,
+                             samples=args.samples, extract_workers=args.extract_workers, force=args.force,
+                             tolerance=args.sample_tolerance)
+    finally:
+        report = write_report(Path(args.root) / "run_metrics.json", extra={"config": vars(args)})
+        log_summary(report)
+        if args.prometheus_textfile:
+            write_prometheus_textfile(args.prometheus_textfile, report)
+
+    statuses = [entry["status"] for entry in manifest["cases"].values()]
+    print(f"\n{statuses.count('done')} of {len(statuses)} cases done")
+    for case_name, entry in manifest["cases"].items():
+        if entry["status"] != "done":
+            print(f"- {entry['case_id']} ({case_name}): {entry['status']}" + (f", {entry['error']}" if entry.get("error") else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Demand Letter Evaluator - Service Mode
+Runs the evaluator as a long-lived local HTTP service, so the OpenAI client
+(and its connection pool), the compiled prompt template and each case's facts
+and retrieval index stay loaded between requests and scoring one letter costs only the model call.
+
+Endpoints (JSON in, JSON out):
+    GET  /health                  Liveness check
+    POST /evaluate                Queue a letter evaluation
+    POST /ingest                  Queue a source document ingest (fact update)
+    GET  /jobs/<job_id>           Status and result of a job
+    GET  /evaluations?data_dir=   Stored evaluations of a case
+    GET  /leaderboard             Ranking of the latest evaluations (case_id, model, limit)
+    GET  /metrics                 Run metrics since the service started
+
+POST bodies accept "wait": true to block until the job finishes and get its
+result in the response. Case folders and documents named in a request are
+paths relative to the cases root; anything outside it is rejected.
+"""
+
+import argparse
+import json
+import logging
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from cascade import configure_cascade
+from llm import configure_llm_cache
+from main import (MIN_SAMPLES, evaluate_or_reuse, extract_facts_from_source_documents, get_client,
+                  get_evaluation_template, sample_count, save_evaluation, setup_folders)
+from metrics import run_report
+from precheck import PRECHECK_MODES, configure_precheck
+from rate_limit import configure_rate_limits
+from retrieval import EVIDENCE_MODES, configure_retrieval, load_case_index
+from results_store import configure_results_store, get_results_store
+from utils import configure_ocr
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs kept for GET /jobs, oldest dropped first
+MAX_FINISHED_JOBS = 1000
+
+
+class EvaluatorService:
+    """Evaluation and ingest jobs over warm, shared resources."""
+
+    def __init__(self, data_dir="data", model="o3-2025-04-16", max_workers=4, extract_workers=1, samples=1,
+                 cases_root=None):
+        """
+        Args:
+            data_dir: Case folder used when a request does not name one
+            model: OpenAI model used when a request does not name one
+            max_workers: Number of jobs run concurrently
+            extract_workers: Number of source documents extracted concurrently per ingest
+            samples: Default maximum number of evaluations averaged per letter
+            cases_root: Folder every case and ingested document named in a
+                request must lie in (default: the folder holding `data_dir`)
+        """
+        self.data_dir = Path(data_dir)
+        self.cases_root = Path(cases_root).resolve() if cases_root else self.data_dir.resolve().parent
+        self.model = model
+        self.extract_workers = extract_workers
+        self.samples = samples
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+        # data_dir -> (case_facts.json mtime, facts)
+        self._facts = {}
+        # One lock per case, so ingests of the same case never overlap
+        self._case_locks = {}
+
+    def warm_up(self):
+        """Create the client, compile the template and load the default case's facts and index before the first request."""
+        get_client()
+        get_evaluation_template()
+        if (self.data_dir / "extracted_facts" / "case_facts.json").exists():
+            self.facts(self.data_dir)
+            load_case_index(self.data_dir)
+
+    def _case_lock(self, data_dir):
+        with self._lock:
+            return self._case_locks.setdefault(Path(data_dir).resolve(), threading.Lock())
+
+    def facts(self, data_dir):
+        """
+        Return a case's facts, reloading case_facts.json only when it has changed.
+
+        Cases without extracted facts are extracted first.
+        """
+        data_dir = Path(data_dir)
+        facts_file = data_dir / "extracted_facts" / "case_facts.json"
+        with self._case_lock(data_dir):
+            if not facts_file.exists():
+                setup_folders(data_dir)
+                extract_facts_from_source_documents(max_workers=self.extract_workers, data_dir=data_dir)
+            mtime = facts_file.stat().st_mtime_ns
+            cached = self._facts.get(data_dir.resolve())
+            if cached is None or cached[0] != mtime:
+                with open(facts_file, 'r') as f:
+                    self._facts[data_dir.resolve()] = (mtime, json.load(f))
+                logger.info(f"Loaded facts of {data_dir}")
+            return self._facts[data_dir.resolve()][1]
+
+    def _confined(self, base, value, name):
+        """Resolve a relative path from a request against `base`, rejecting anything outside the cases root."""
+        if not isinstance(value, str) or not value:
+            raise ValueError(f"'{name}' must be a non-empty string")
+        path = Path(value)
+        if path.is_absolute() or ".." in path.parts:
+            raise ValueError(f"'{name}' must be a relative path without '..': {value}")
+        path = Path(base) / path
+        # Catches symlinks leading out of the root
+        if not path.resolve().is_relative_to(self.cases_root):
+            raise ValueError(f"'{name}' is outside the cases root: {value}")
+        return path
+
+    def case_dir(self, value):
+        """Return the case folder named in a request, or the default case if it names none."""
+        return self._confined(self.cases_root, value, "data_dir") if value else self.data_dir
+
+    def validate(self, kind, params):
+        """
+        Check a request body before it is queued.
+
+        Args:
+            kind: "evaluate" or "ingest"
+            params: Request body
+
+        Returns:
+            The job's parameters, with paths resolved and defaults filled in
+
+        Raises:
+            ValueError: If a parameter is missing, of the wrong type or names a path outside the cases root
+        """
+        if not isinstance(params, dict):
+            raise ValueError("Request body must be a JSON object")
+        for flag in ("wait", "force", "reprocess"):
+            if not isinstance(params.get(flag, False), bool):
+                raise ValueError(f"'{flag}' must be true or false")
+        data_dir = self.case_dir(params.get("data_dir"))
+        if kind == "ingest":
+            source = None
+            if params.get("path") is not None:
+                source = self._confined(self.cases_root, params["path"], "path")
+                if source.suffix.lower() != ".pdf" or not source.is_file():
+                    raise ValueError(f"'path' must name an existing PDF: {params['path']}")
+            return {"data_dir": data_dir, "source": source, "reprocess": params.get("reprocess", False)}
+
+        if params.get("letter") is None:
+            raise ValueError("Missing 'letter'")
+        letter_path = self._confined(data_dir / "demand_letters", params["letter"], "letter")
+        if not letter_path.is_file():
+            raise ValueError(f"No such letter: {params['letter']}")
+        model = params.get("model") or self.model
+        if not isinstance(model, str):
+            raise ValueError("'model' must be a string")
+        samples = params.get("samples") or self.samples
+        if isinstance(samples, bool) or not isinstance(samples, int) or samples < 1 or 1 < samples < MIN_SAMPLES:
+            raise ValueError(f"'samples' must be 1 or an integer of at least {MIN_SAMPLES}")
+        return {"data_dir": data_dir, "letter_path": letter_path, "model": model, "samples": samples,
+                "force": params.get("force", False)}
+
+    def submit(self, kind, params):
+        """
+        Queue a job.
+
+        Args:
+            kind: "evaluate" or "ingest"
+            params: Job parameters from validate()
+
+        Returns:
+            The job record, with its future under "_future"
+        """
+        target = {"evaluate": self._evaluate, "ingest": self._ingest}[kind]
+        job = {"id": uuid.uuid4().hex, "kind": kind, "status": "queued", "submitted_at": time.time()}
+        with self._lock:
+            self.jobs[job["id"]] = job
+            finished = [job_id for job_id, other in self.jobs.items() if other["status"] in ("done", "failed")]
+            for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self.jobs[job_id]
+        job["_future"] = self.executor.submit(self._run, job, target, params)
+        return job
+
+    def _run(self, job, target, params):
+        job["status"] = "running"
+        started = time.perf_counter()
+        try:
+            job["result"] = target(params)
+            job["status"] = "done"
+        except Exception as e:
+            logger.error(f"Job {job['id']} ({job['kind']}) failed: {e}")
+            job["error"] = str(e)
+            job["status"] = "failed"
+        job["seconds"] = round(time.perf_counter() - started, 3)
+
+    def _evaluate(self, params):
+        data_dir, letter_path = params["data_dir"], params["letter_path"]
+        results_dir = data_dir / "results"
+        results_dir.mkdir(parents=True, exist_ok=True)
+        result, reused = evaluate_or_reuse(letter_path, self.facts(data_dir), model=params["model"],
+                                           results_dir=results_dir, force=params["force"], samples=params["samples"])
+        if not reused:
+            save_evaluation(letter_path, result, results_dir)
+        return dict(result, reused=reused)
+
+    def _ingest(self, params):
+        data_dir, source = params["data_dir"], params["source"]
+        with self._case_lock(data_dir):
+            setup_folders(data_dir)
+            if source is not None:
+                # Copy the new document into the case; unchanged documents are not re-extracted
+                target = data_dir / "source_documents" / source.name
+                if source.resolve() != target.resolve():
+                    shutil.copy2(source, target)
+            facts = extract_facts_from_source_documents(force_reprocess=params["reprocess"],
+                                                        max_workers=self.extract_workers, data_dir=data_dir)
+        return {"data_dir": str(data_dir), "documents": sorted(facts.get("individual_documents", {}))}
+
+    def job(self, job_id):
+        """Return a job without its future, or None if it is unknown."""
+        with self._lock:
+            job = self.jobs.get(job_id)
+        return None if job is None else {key: value for key, value in job.items() if not key.startswith("_")}
+
+    def evaluations(self, data_dir=None):
+        """Return the stored evaluations of a case."""
+        results_dir = self.case_dir(data_dir) / "results"
+        evaluations = []
+        for result_file in sorted(results_dir.glob("*_evaluation.json")):
+            with open(result_file, 'r') as f:
+                evaluations.append(json.load(f))
+        return evaluations
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Request handler; `server.service` holds the EvaluatorService."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if parts == ["health"]:
+            self._send_json(200, {"status": "ok", "jobs": len(service.jobs)})
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = service.job(parts[1])
+            if job is None:
+                self._send_json(404, {"error": f"Unknown job {parts[1]}"})
+            else:
+                self._send_json(200, job)
+        elif parts == ["evaluations"]:
+            data_dir = parse_qs(url.query).get("data_dir", [None])[0]
+            try:
+                evaluations = service.evaluations(data_dir)
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            self._send_json(200, evaluations)
+        elif parts == ["leaderboard"]:
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            try:
+                limit = int(query.get("limit") or 0) or None
+            except ValueError:
+                self._send_json(400, {"error": "'limit' must be an integer"})
+                return
+            rows = get_results_store().leaderboard(case_id=query.get("case_id"), model=query.get("model"), limit=limit)
+            self._send_json(200, [dict(row) for row in rows])
+        elif parts == ["metrics"]:
+            self._send_json(200, run_report())
+        else:
+            self._send_json(404, {"error": f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        service = self.server.service
+        kind = urlparse(self.path).path.strip("/")
+        if kind not in ("evaluate", "ingest"):
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            params = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self._send_json(400, {"error": f"Invalid JSON: {e}"})
+            return
+        try:
+            job_params = service.validate(kind, params)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        job = service.submit(kind, job_params)
+        if params.get("wait"):
+            job["_future"].result()
+            self._send_json(200, service.job(job["id"]))
+        else:
+            self._send_json(202, service.job(job["id"]))
+
+
+def start_server(service, host="127.0.0.1", port=8090):
+    """
+    Start the service on a background thread.
+
+    Args:
+        service: EvaluatorService handling the jobs
+        host: Interface to bind
+        port: Port to bind (0 = any free port)
+
+    Returns:
+        Tuple of (server, base_url); call `server.shutdown()` to stop it
+    """
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}"
+    logger.info(f"Evaluator service listening on {base_url}")
+    return server, base_url
+
+
+def main():
+    """Run the evaluator service in the foreground."""
+    parser = argparse.ArgumentParser(description="Serve demand letter evaluations from a long-lived process.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind")
+    parser.add_argument("--port", type=int, default=8090, help="Port to bind")
+    parser.add_argument("--data-dir", default="data", help="Case folder used when a request does not name one")
+    parser.add_argument("--cases-root", help="Folder that case folders and ingested documents named in requests must lie in (default: the folder holding --data-dir)")
+    parser.add_argument("--model", default="o3-2025-04-16", help="OpenAI model used when a request does not name one")
+    parser.add_argument("--workers", type=int, default=4, help="Number of jobs run concurrently")
+    parser.add_argument("--extract-workers", type=int, default=1, help="Number of source documents extracted concurrently per ingest")
+    parser.add_argument("--cascade", help="Comma-separated cheaper models that screen each letter before --model (see main.py)")
+    parser.add_argument("--decision-thresholds", help="Comma-separated weighted scores near which screening results are escalated (see main.py)")
+    parser.add_argument("--cascade-margin", type=float, help="Distance from a decision threshold within which screening scores are escalated (see main.py)")
+    parser.add_argument("--cascade-max-spread", type=float, help="Largest spread of one category's sample scores a screening result may have (see main.py)")
+    parser.add_argument("--samples", type=sample_count, default=1, help="Default maximum number of evaluations averaged per letter (1 or at least 3)")
+    parser.add_argument("--ocr-workers", type=int, help="Number of processes used to OCR scanned pages")
+    parser.add_argument("--llm-cache", choices=["on", "off", "replay"], help="Response cache mode (see main.py)")
+    parser.add_argument("--results-db", help="SQLite results store shared by all cases (see main.py)")
+    parser.add_argument("--evidence", choices=EVIDENCE_MODES, help="Source evidence in the evaluation prompt (see main.py)")
+    parser.add_argument("--evidence-budget", type=int, help="Maximum tokens of retrieved source passages per evaluation prompt")
+    parser.add_argument("--precheck", choices=PRECHECK_MODES, help="Pre-check of letters against the case metadata (see main.py)")
+    parser.add_argument("--rpm", type=int, help="Requests per minute allowed by your OpenAI account (see main.py)")
+    parser.add_argument("--tpm", type=int, help="Tokens per minute allowed by your OpenAI account (see main.py)")
+    parser.add_argument("--max-retries", type=int, help="Retries of a rate limited or failed model call (see main.py)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    configure_ocr(workers=args.ocr_workers)
+    configure_llm_cache(mode=args.llm_cache)
+    configure_rate_limits(rpm=args.rpm, tpm=args.tpm, max_retries=args.max_retries)
+    configure_results_store(path=args.results_db, run_config=vars(args))
+    configure_retrieval(mode=args.evidence, budget=args.evidence_budget)
+    configure_precheck(mode=args.precheck)
+    configure_cascade(models=args.cascade, thresholds=args.decision_thresholds, margin=args.cascade_margin,
+                      max_spread=args.cascade_max_spread)
+
+    service = EvaluatorService(data_dir=args.data_dir, model=args.model, max_workers=args.workers,
+                               extract_workers=args.extract_workers, samples=args.samples, cases_root=args.cases_root)
+    service.warm_up()
+    server, _ = start_server(service, args.host, args.port)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        service.executor.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Tests for Batch API evaluation (batch_api.py and main.run_batch_evaluation), against the local stand-in."""
+
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from batch_api import collect_batch_results
+from openai_stub import start_stub_server
+from results_store import ResultsStore
+
+
+def build_request(letter_path, facts, model="gpt-4o", case_dir=None):
+    return {"model": model, "messages": [{"role": "user", "content": f"Evaluate {letter_path.name}"}],
+            "response_format": main.evaluation_response_format(list(main.CATEGORY_WEIGHTS))}
+
+
+@pytest.fixture
+def batch_env(tmp_path, monkeypatch):
+    from openai import OpenAI
+
+    server, base_url = start_stub_server()
+    store = ResultsStore(tmp_path / "results.db")
+    built = []
+
+    def counting_build_request(letter_path, facts, **kwargs):
+        built.append(letter_path.name)
+        return build_request(letter_path, facts, **kwargs)
+
+    monkeypatch.setattr(main, "get_client", lambda: OpenAI(base_url=base_url, api_key="stub", max_retries=0))
+    monkeypatch.setattr(main, "get_results_store", lambda: store)
+    monkeypatch.setattr(main, "run_precheck", lambda *args, **kwargs: (None, None))
+    monkeypatch.setattr(main, "build_evaluation_request", counting_build_request)
+    results_dir = tmp_path / "case" / "results"
+    results_dir.mkdir(parents=True)
+    yield SimpleNamespace(results_dir=results_dir, built=built,
+                          letters=[tmp_path / "case" / "demand_letters" / f"letter_{n}.pdf" for n in (1, 2)])
+    store.close()
+    server.shutdown()
+
+
+def test_batch_results_are_recorded_against_the_submitted_requests(batch_env):
+    results = main.run_batch_evaluation(batch_env.letters, {}, model="o3", poll_interval=0,
+                                        results_dir=batch_env.results_dir)
+    assert [result["letter_name"] for result in results] == ["letter_1.pdf", "letter_2.pdf"]
+    assert all(not result["missing_categories"] for result in results)
+    # Requests are built once, at submit time, not again when collecting
+    assert batch_env.built == ["letter_1.pdf", "letter_2.pdf"]
+    for letter_path, result in zip(batch_env.letters, results):
+        assert result["input_fingerprint"] == main.evaluation_fingerprint(build_request(letter_path, {}, model="o3"))
+        assert (batch_env.results_dir / f"{letter_path.stem}_evaluation.json").exists()
+    state = json.loads((batch_env.results_dir / "batch_state.json").read_text())
+    assert state["status"] == "completed" and sorted(state["letters"]) == ["letter_1.pdf", "letter_2.pdf"]
+
+
+def test_resumed_batches_do_not_need_their_letters(batch_env, monkeypatch):
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    wait_for_batch = main.wait_for_batch
+    monkeypatch.setattr(main, "wait_for_batch", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        main.run_batch_evaluation(batch_env.letters, {}, model="o3", poll_interval=0, results_dir=batch_env.results_dir)
+    monkeypatch.setattr(main, "wait_for_batch", wait_for_batch)
+
+    results = main.run_batch_evaluation([], {}, model="o3", poll_interval=0, results_dir=batch_env.results_dir)
+    assert sorted(result["letter_name"] for result in results) == ["letter_1.pdf", "letter_2.pdf"]
+    assert batch_env.built == ["letter_1.pdf", "letter_2.pdf"]
+
+
+def test_unchanged_letters_are_left_out_of_the_batch(batch_env):
+    main.run_batch_evaluation(batch_env.letters, {}, model="o3", poll_interval=0, results_dir=batch_env.results_dir)
+    submitted = (batch_env.results_dir / "batch_input.jsonl").read_text()
+    results = main.run_batch_evaluation(batch_env.letters, {}, model="o3", poll_interval=0,
+                                        results_dir=batch_env.results_dir)
+    assert len(results) == 2
+    # Nothing was left to submit, so the previous batch file is untouched
+    assert (batch_env.results_dir / "batch_input.jsonl").read_text() == submitted
+
+
+def test_failed_requests_are_reported_as_errors():
+    output = "\n".join(json.dumps(line) for line in [
+        {"custom_id": "letter_1.pdf", "response": {"status_code": 200, "body": {"id": "ok"}}, "error": None},
+        {"custom_id": "letter_2.pdf", "response": {"status_code": 500, "body": {"error": "server error"}}, "error": None},
+    ])
+    errors = json.dumps({"custom_id": "letter_3.pdf", "error": {"message": "expired"}})
+    files = {"out": output, "err": errors}
+    client = SimpleNamespace(files=SimpleNamespace(content=lambda file_id: SimpleNamespace(text=files[file_id])))
+    batch = SimpleNamespace(id="batch_1", status="completed", output_file_id="out", error_file_id="err")
+
+    responses, failed = collect_batch_results(client, batch)
+    assert responses == {"letter_1.pdf": {"id": "ok"}}
+    assert sorted(failed) == ["letter_2.pdf", "letter_3.pdf"]
+    assert "server error" in failed["letter_2.pdf"] and "expired" in failed["letter_3.pdf"]
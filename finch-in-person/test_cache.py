@@ -0,0 +1,63 @@
+"""Tests for the on-disk JSON cache (cache.py)."""
+
+import os
+import time
+
+from cache import DiskCache
+
+
+def key(n):
+    return f"{n:064x}"
+
+
+def age(cache, k, seconds):
+    path = cache._path(k)
+    old = time.time() - seconds
+    os.utime(path, (old, old))
+
+
+def test_round_trip(tmp_path):
+    cache = DiskCache(tmp_path)
+    cache.put(key(1), {"value": 1})
+    assert cache.get(key(1)) == {"value": 1}
+    assert cache.get(key(2)) is None
+
+
+def test_entries_expire_after_ttl(tmp_path):
+    cache = DiskCache(tmp_path, ttl=60)
+    cache.put(key(1), {"value": 1})
+    assert cache.get(key(1)) == {"value": 1}
+    age(cache, key(1), 120)
+    assert cache.get(key(1)) is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    entry = {"value": "x" * 100}
+    cache = DiskCache(tmp_path, max_bytes=350)
+    for n in range(3):
+        cache.put(key(n), entry)
+        age(cache, key(n), 100 - n)
+    # Reading entry 0 makes it the most recently used
+    assert cache.get(key(0)) == entry
+    cache.put(key(3), entry)
+    assert cache.get(key(1)) is None
+    assert cache.get(key(0)) == entry
+    assert cache.get(key(3)) == entry
+    assert cache._size <= 350
+
+
+def test_overwriting_an_entry_does_not_grow_the_tracked_size(tmp_path):
+    cache = DiskCache(tmp_path)
+    cache.put(key(1), {"value": 1})
+    cache.put(key(2), {"value": 2})
+    size = cache._size
+    for _ in range(5):
+        cache.put(key(1), {"value": 1})
+    assert cache._size == size == cache._scan_size()
+
+
+def test_unreadable_entries_are_misses(tmp_path):
+    cache = DiskCache(tmp_path)
+    cache.put(key(1), {"value": 1})
+    cache._path(key(1)).write_text("{not json")
+    assert cache.get(key(1)) is None
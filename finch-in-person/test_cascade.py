@@ -0,0 +1,59 @@
+"""Tests for the model cascade escalation rules (cascade.py)."""
+
+import pytest
+
+import cascade
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(cascade, "CASCADE_MODELS", ["gpt-4o-mini"])
+    monkeypatch.setattr(cascade, "DECISION_THRESHOLDS", [2.5, 3.5])
+    monkeypatch.setattr(cascade, "CASCADE_MARGIN", 0.25)
+    monkeypatch.setattr(cascade, "CASCADE_MAX_SPREAD", 1)
+
+
+def result(scores, weighted_score=3.0, **extra):
+    return dict({"category_scores": {category: {"score": score} for category, score in scores.items()},
+                 "weighted_score": weighted_score, "missing_categories": []}, **extra)
+
+
+def test_tiers_end_with_the_evaluation_model():
+    assert cascade.evaluation_tiers("o3") == ["gpt-4o-mini", "o3"]
+    assert cascade.evaluation_tiers("gpt-4o-mini") == ["gpt-4o-mini"]
+    assert cascade.extraction_tiers() == ["gpt-4o-mini", cascade.EXTRACTION_MODEL]
+
+
+def test_clear_results_are_kept():
+    assert cascade.escalation_reason(result({"a": 3, "b": 3}, weighted_score=3.0)) is None
+
+
+@pytest.mark.parametrize("screening", [
+    {"error": "Invalid JSON"},
+    result({"a": 3}, missing_categories=["b"]),
+    result({"a": 3, "b": 3}, converged=False),
+    result({"a": 3, "b": 4}, weighted_score=3.4),
+    result({"a": 2, "b": 3}, weighted_score=2.3),
+])
+def test_untrustworthy_results_are_escalated(screening):
+    assert cascade.escalation_reason(screening)
+
+
+def test_category_scores_may_span_the_scale():
+    assert cascade.escalation_reason(result({"a": 1, "b": 5}, weighted_score=3.0)) is None
+
+
+def test_samples_disagreeing_on_a_category_are_escalated():
+    screening = result({"a": 3, "b": 3}, weighted_score=3.0)
+    screening["category_scores"]["a"]["samples"] = [3, 3, 4]
+    assert cascade.escalation_reason(screening) is None
+    screening["category_scores"]["b"]["samples"] = [2, 4]
+    assert cascade.escalation_reason(screening) == "b samples range from 2 to 4"
+
+
+def test_configure_cascade_parses_lists(monkeypatch):
+    cascade.configure_cascade(models="a, b,", thresholds="3")
+    assert cascade.CASCADE_MODELS == ["a", "b"]
+    assert cascade.DECISION_THRESHOLDS == [3.0]
+    cascade.configure_cascade(models="")
+    assert cascade.evaluation_tiers("o3") == ["o3"]
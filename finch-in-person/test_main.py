@@ -0,0 +1,190 @@
+"""Tests for the evaluator (main.py)."""
+
+import argparse
+import json
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+
+def sample(score):
+    scores = {category: {"score": score, "explanation": "ok"} for category in main.CATEGORY_WEIGHTS}
+    return {"letter_name": "letter_1.pdf", "category_scores": scores, "weighted_score": float(score),
+            "missing_categories": [], "full_evaluation": "{}", "usage": {}}
+
+
+def test_two_samples_never_count_as_converged():
+    assert not main.scores_converged([sample(3), sample(4)])
+    assert not main.scores_converged([sample(3), sample(3)])
+    assert main.scores_converged([sample(3), sample(3), sample(4)])
+    assert not main.scores_converged([sample(2), sample(3), sample(4)])
+
+
+
+@pytest.mark.parametrize("value", ["0", "2", "-1", "two"])
+def test_sample_counts_that_cannot_converge_are_rejected(value):
+    with pytest.raises((argparse.ArgumentTypeError, ValueError)):
+        main.sample_count(value)
+    assert main.sample_count("1") == 1 and main.sample_count("3") == 3
+
+def test_further_samples_are_requested_in_concurrent_rounds(monkeypatch):
+    scores = [2, 3, 4, 3, 3, 3, 3]
+    requested = []
+    lock = threading.Lock()
+
+    def evaluate_sample(letter_path, model, request, sample_index=0, refresh=False):
+        with lock:
+            requested.append(sample_index)
+        return sample(scores[sample_index])
+
+    monkeypatch.setattr(main, "_evaluate_sample", evaluate_sample)
+    result = main.evaluate_with_samples(Path("letter_1.pdf"), "o3", {"model": "o3"}, max_samples=7)
+    # 3 disagreeing samples, then one round of 2 brings the standard error within tolerance
+    assert sorted(requested) == [0, 1, 2, 3, 4]
+    assert result["samples"] == 5 and result["converged"]
+
+
+def test_a_failed_sample_does_not_discard_the_others(monkeypatch, caplog):
+    def evaluate_sample(letter_path, model, request, sample_index=0, refresh=False):
+        if sample_index == 1:
+            raise ConnectionError("connection reset")
+        return sample(3)
+
+    monkeypatch.setattr(main, "_evaluate_sample", evaluate_sample)
+    result = main.evaluate_with_samples(Path("letter_1.pdf"), "o3", {"model": "o3"}, max_samples=5)
+    assert "error" not in result
+    assert result["samples"] == 4 and result["converged"]
+    assert "sample 1 failed: connection reset" in caplog.text
+
+
+def test_all_samples_failing_returns_an_error(monkeypatch):
+    def evaluate_sample(letter_path, model, request, sample_index=0, refresh=False):
+        raise ConnectionError("connection reset")
+
+    monkeypatch.setattr(main, "_evaluate_sample", evaluate_sample)
+    result = main.evaluate_with_samples(Path("letter_1.pdf"), "o3", {"model": "o3"}, max_samples=3)
+    assert result == {"letter_name": "letter_1.pdf", "error": "connection reset"}
+
+
+def response(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+def all_categories(score=4):
+    return {category: {"score": score, "explanation": f"{category} is fine."} for category in main.CATEGORY_WEIGHTS}
+
+
+def test_json_scores_skip_invalid_entries():
+    scores = main._parse_json_scores(json.dumps({
+        "quality of writing": {"score": 4, "explanation": " Clear. "},
+        "Damages Calculation": {"score": 7, "explanation": "Out of range"},
+        "Legal Strategy": {"score": True, "explanation": "Not a number"},
+        "Medical Documentation": "5",
+        "Not A Category": {"score": 3, "explanation": "Ignored"},
+    }))
+    assert scores == {"Quality of Writing": {"score": 4, "explanation": "Clear."}}
+
+
+def test_json_scores_reject_non_objects():
+    with pytest.raises(ValueError):
+        main._parse_json_scores("[1, 2]")
+    with pytest.raises(ValueError):
+        main._parse_json_scores("Quality of Writing: 4")
+
+
+def test_text_scores_read_the_rubric_layout():
+    scores = main._parse_text_scores("Quality of Writing: 4 - Clear and concise.\n"
+                                     "Damages Calculation: 2\nThe totals do not add up.\n"
+                                     "Summary: 9 overall")
+    assert scores == {"Quality of Writing": {"score": 4, "explanation": "Clear and concise."},
+                      "Damages Calculation": {"score": 2, "explanation": "The totals do not add up."}}
+
+
+def test_parse_evaluation_response_lists_missing_categories():
+    scores = all_categories()
+    del scores["Legal Strategy"]
+    result = main.parse_evaluation_response(json.dumps(scores), Path("letters/letter_1.pdf"), model="o3")
+    assert result["letter_name"] == "letter_1.pdf"
+    assert result["missing_categories"] == ["Legal Strategy"]
+    assert result["weighted_score"] == main.calculate_weighted_score(result["category_scores"])
+
+
+def test_reask_asks_only_for_the_missing_categories(monkeypatch):
+    scores = all_categories()
+    del scores["Legal Strategy"], scores["Damages Calculation"]
+    result = main.parse_evaluation_response(json.dumps(scores), Path("letter_1.pdf"))
+    asked = []
+
+    def chat_completion(client, stage, model, messages, response_format, refresh=False):
+        missing = list(response_format["json_schema"]["schema"]["properties"])
+        asked.append(missing)
+        assert messages[-2] == {"role": "assistant", "content": result["full_evaluation"]}
+        return response(json.dumps({category: {"score": 3, "explanation": "Asked again."} for category in missing}))
+
+    monkeypatch.setattr(main, "get_client", lambda: None)
+    monkeypatch.setattr(main, "chat_completion", chat_completion)
+    result = main.reask_missing_categories(result, {"model": "o3", "messages": [{"role": "user", "content": "Evaluate"}]})
+    assert asked == [["Damages Calculation", "Legal Strategy"]]
+    assert result["missing_categories"] == [] and result["reasks"] == 1
+    assert result["category_scores"]["Legal Strategy"]["score"] == 3
+
+
+def test_reask_gives_up_after_max_reasks(monkeypatch):
+    scores = all_categories()
+    del scores["Legal Strategy"]
+    result = main.parse_evaluation_response(json.dumps(scores), Path("letter_1.pdf"))
+    monkeypatch.setattr(main, "get_client", lambda: None)
+    monkeypatch.setattr(main, "chat_completion", lambda *args, **kwargs: response("{}"))
+    result = main.reask_missing_categories(result, {"model": "o3", "messages": []}, max_reasks=2)
+    assert result["reasks"] == 2
+    assert result["missing_categories"] == ["Legal Strategy"]
+
+
+def stored(tmp_path, result):
+    (tmp_path / "letter_1_evaluation.json").write_text(json.dumps(result))
+
+
+def test_stored_results_are_reused_only_for_the_same_fingerprint(tmp_path):
+    letter = Path("letter_1.pdf")
+    request = {"model": "o3", "messages": [{"role": "user", "content": "Evaluate letter 1"}]}
+    fingerprint = main.evaluation_fingerprint(request)
+    result = dict(sample(4), input_fingerprint=fingerprint)
+    assert main.load_reusable_evaluation(letter, fingerprint, tmp_path) is None
+    stored(tmp_path, result)
+    assert main.load_reusable_evaluation(letter, fingerprint, tmp_path) == result
+
+    changed = dict(request, messages=[{"role": "user", "content": "Evaluate letter 1, revised"}])
+    for other in (main.evaluation_fingerprint(changed), main.evaluation_fingerprint(dict(request, model="gpt-4o")),
+                  main.evaluation_fingerprint(request, samples=3)):
+        assert other != fingerprint
+        assert main.load_reusable_evaluation(letter, other, tmp_path) is None
+
+
+def test_incomplete_results_are_not_reused(tmp_path):
+    fingerprint = "f" * 64
+    stored(tmp_path, dict(sample(4), input_fingerprint=fingerprint, missing_categories=["Legal Strategy"]))
+    assert main.load_reusable_evaluation(Path("letter_1.pdf"), fingerprint, tmp_path) is None
+    stored(tmp_path, {"letter_name": "letter_1.pdf", "error": "Invalid JSON", "input_fingerprint": fingerprint})
+    assert main.load_reusable_evaluation(Path("letter_1.pdf"), fingerprint, tmp_path) is None
+
+
+@pytest.mark.parametrize("force", [False, True])
+def test_force_skips_reuse_and_the_response_cache(tmp_path, monkeypatch, force):
+    request = {"model": "o3", "messages": [{"role": "user", "content": "Evaluate letter 1"}]}
+    stored(tmp_path, dict(sample(4), input_fingerprint=main.evaluation_fingerprint(request)))
+    calls = []
+
+    def evaluate_demand_letter(letter_path, facts, refresh=False, **kwargs):
+        calls.append(refresh)
+        return sample(3)
+
+    monkeypatch.setattr(main, "run_precheck", lambda *args, **kwargs: (None, None))
+    monkeypatch.setattr(main, "build_evaluation_request", lambda *args, **kwargs: request)
+    monkeypatch.setattr(main, "evaluate_demand_letter", evaluate_demand_letter)
+    result, reused = main.evaluate_or_reuse(Path("letter_1.pdf"), {}, model="o3", results_dir=tmp_path, force=force)
+    assert reused is not force
+    assert calls == ([True] if force else [])
@@ -0,0 +1,106 @@
+"""Tests for the deterministic letter pre-check (precheck.py)."""
+
+from datetime import date
+
+import pytest
+
+import precheck
+
+METADATA = {
+    "case_id": "CASE-001",
+    "claimant_name": "Isabella Moreno",
+    "accident_date": "2023-11-21",
+    "defendant_name": "Pedro Lopez",
+    "defendant_license": "AZ-12345678",
+    "vehicle_info": {
+        "plate": "AZ 8XZ-213",
+        "vin": "1FTEW1EG5FFA12345",
+        "policy_number": "GA-987654321",
+        "policy_limit": "$100,000",
+    },
+}
+
+CLEAN_LETTER = """Re: Isabella Moreno
+Date of Loss: November 21, 2023
+Insured: Pedro Lopez (AZ License: AZ-12345678)
+Vehicle: Plate: AZ 8XZ-213, VIN: 1FTEW1EG5FFA12345
+Policy No.: GA-987654321, Policy Limit: $100,000
+"""
+
+
+def findings(text, metadata=METADATA, totals=None):
+    return {(finding["check"], finding["severity"]) for finding in precheck.check_letter(text, metadata, totals)}
+
+
+def errors(text, metadata=METADATA):
+    return {check for check, severity in findings(text, metadata) if severity == "error"}
+
+
+def test_clean_letter_has_no_errors():
+    assert errors(CLEAN_LETTER) == set()
+
+
+@pytest.mark.parametrize("text", [
+    "Our letter template 2023 is attached for Ms. Moreno.",
+    "The plate AZ 8XZ-213 VIN 1FTEW1EG5FFA12345 belongs to the insured. Moreno",
+    "Plate: AZ8XZ213. Moreno",
+])
+def test_plate_matches_exactly_without_false_positives(text):
+    assert "plate" not in errors(text)
+
+
+@pytest.mark.parametrize("text", ["The plate 3 was visible. Moreno", "Plate: AZ 8XZ-999. Moreno"])
+def test_wrong_or_partial_plate_is_an_error(text):
+    assert "plate" in errors(text)
+
+
+def test_identifier_matches_requires_exact_identifier():
+    assert precheck.identifier_matches("AZ 8XZ-213 VIN", "AZ8XZ213")
+    assert not precheck.identifier_matches("8XZ-213", "AZ8XZ213")
+    assert not precheck.identifier_matches("AZ 8XZ-2134", "AZ8XZ213")
+
+
+def test_policy_number_lookalike_under_any_label_is_an_error():
+    assert "policy_number" in errors(CLEAN_LETTER.replace("Policy No.: GA-987654321", "Claim No.: GA-987654000"))
+
+
+def test_wrong_vin_and_policy_limit_are_errors():
+    text = CLEAN_LETTER.replace("1FTEW1EG5FFA12345", "1FTEW1EG5FFA99999").replace("$100,000", "$250,000")
+    assert {"vin", "policy_limit"} <= errors(text)
+
+
+@pytest.mark.parametrize("text", [
+    "Insured Guardian Auto Insurance denied the claim.",
+    "Defendant Acme Trucking Company was negligent.",
+    "Insured Big Rig Haulers Company",
+])
+def test_organizations_are_not_read_as_a_wrong_defendant(text):
+    wrong = [finding for finding in precheck.check_letter(text, METADATA) if finding["found"]
+             and finding["check"] == "defendant_name"]
+    assert wrong == []
+
+
+def test_name_mismatches_are_warnings():
+    result = findings("Ms. Smith was hit by your insured, John Carter, on November 21, 2023.")
+    assert ("defendant_name", "warning") in result
+    assert ("claimant_name", "warning") in result
+    assert not {severity for _, severity in result} & {"error"}
+
+
+def test_wrong_labelled_accident_date_is_an_error():
+    assert "accident_date" in errors(CLEAN_LETTER.replace("November 21, 2023", "November 12, 2023"))
+
+
+def test_find_dates_tolerates_split_years():
+    assert [found for found, _, _ in precheck.find_dates("Date of Loss: 11/21/202 3")] == [date(2023, 11, 21)]
+
+
+def test_medical_total_mismatch_is_a_warning():
+    text = CLEAN_LETTER + "Past medical expenses of $9,760.00 were billed."
+    assert ("medical_total", "warning") in findings(text, totals={"medical": 7760.0})
+    assert ("medical_total", "warning") not in findings(text.replace("9,760", "7,760"), totals={"medical": 7760.0})
+
+
+def test_configure_precheck_rejects_unknown_modes():
+    with pytest.raises(ValueError):
+        precheck.configure_precheck("strict")
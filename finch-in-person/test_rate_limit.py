@@ -0,0 +1,96 @@
+"""Tests for the token-bucket rate limiter and backoff (rate_limit.py)."""
+
+import pytest
+
+import rate_limit
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"status_code": status_code, "headers": headers or {}})()
+
+
+def test_token_bucket_refills_continuously():
+    bucket = rate_limit.TokenBucket(60)
+    bucket.updated = 0.0
+    assert bucket.reserve(60, now=0.0) == 0.0
+    # Empty: one more request waits for one second of refill
+    assert bucket.reserve(1, now=0.0) == pytest.approx(1.0)
+    bucket.credit(0, now=31.0)
+    assert bucket.level == pytest.approx(30.0)
+    # Never fills past its capacity
+    bucket.credit(0, now=1000.0)
+    assert bucket.level == 60
+
+
+def test_token_bucket_caps_reservations_at_capacity():
+    bucket = rate_limit.TokenBucket(100)
+    bucket.updated = 0.0
+    assert bucket.reserve(5000, now=0.0) == 0.0
+
+
+def test_limiter_adopts_limits_from_headers():
+    limiter = rate_limit.RateLimiter()
+    limiter.update_from_headers({"x-ratelimit-limit-requests": "500", "x-ratelimit-remaining-requests": "10",
+                                 "x-ratelimit-limit-tokens": "30000"})
+    assert limiter.requests.capacity == 500
+    assert limiter.requests.level <= 10
+    assert limiter.tokens.capacity == 30000
+
+
+def test_fixed_limits_are_not_overridden_by_headers():
+    limiter = rate_limit.RateLimiter(rpm=60)
+    limiter.update_from_headers({"x-ratelimit-limit-requests": "500"})
+    assert limiter.requests.capacity == 60
+
+
+def test_backoff_doubles_up_to_the_maximum():
+    for attempt in range(10):
+        expected = min(rate_limit.BACKOFF_MAX, rate_limit.BACKOFF_BASE * 2 ** attempt)
+        assert expected / 2 <= rate_limit.backoff_delay(attempt) <= expected
+
+
+def test_backoff_honors_retry_after():
+    assert 2.0 <= rate_limit.backoff_delay(0, StatusError(429, {"retry-after": "2"})) <= 2.4
+    assert rate_limit.retry_after(StatusError(429, {"retry-after-ms": "1500"})) == 1.5
+
+
+def test_call_with_backoff_retries_transient_errors(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(rate_limit.time, "sleep", sleeps.append)
+    limiter = rate_limit.RateLimiter()
+    outcomes = [StatusError(429, {"retry-after": "1"}), StatusError(503), "ok"]
+
+    def call():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    retries = []
+    assert rate_limit.call_with_backoff(call, limiter=limiter, max_retries=3,
+                                        on_retry=lambda error, delay: retries.append(error.status_code)) == "ok"
+    assert retries == [429, 503]
+    # The 429 held back every caller of the limiter
+    assert limiter.paused_until > 0
+
+
+def test_call_with_backoff_gives_up(monkeypatch):
+    monkeypatch.setattr(rate_limit.time, "sleep", lambda seconds: None)
+    calls = []
+
+    def failing(status):
+        def call():
+            calls.append(status)
+            raise StatusError(status)
+        return call
+
+    with pytest.raises(StatusError):
+        rate_limit.call_with_backoff(failing(400), limiter=rate_limit.RateLimiter(), max_retries=3)
+    assert calls == [400]
+    calls.clear()
+    with pytest.raises(StatusError):
+        rate_limit.call_with_backoff(failing(500), limiter=rate_limit.RateLimiter(), max_retries=2)
+    assert calls == [500, 500, 500]
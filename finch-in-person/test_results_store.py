@@ -0,0 +1,71 @@
+"""Tests for the SQLite results store (results_store.py)."""
+
+import pytest
+
+from results_store import ResultsStore
+
+
+def scored(letter, score, model="o3"):
+    return {"letter_name": letter, "model_used": model, "weighted_score": score,
+            "category_scores": {"Clarity": {"score": score, "explanation": "ok"}}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultsStore(tmp_path / "results.db")
+    yield store
+    store.close()
+
+
+def test_identical_results_are_stored_once(store):
+    first = store.add_evaluation(scored("a.pdf", 3.0), "CASE")
+    assert store.add_evaluation(scored("a.pdf", 3.0), "CASE") == first
+    assert len(store.history("CASE", "a.pdf")) == 1
+
+
+def test_new_results_become_latest(store):
+    store.add_evaluation(scored("a.pdf", 3.0), "CASE")
+    store.add_evaluation(scored("a.pdf", 4.0), "CASE")
+    assert [row["weighted_score"] for row in store.leaderboard("CASE")] == [4.0]
+    assert [row["latest"] for row in store.history("CASE", "a.pdf")] == [0, 1]
+
+
+def test_errors_do_not_hide_the_last_valid_score(store):
+    store.add_evaluation(scored("a.pdf", 3.0), "CASE")
+    blocked = {"letter_name": "a.pdf", "model_used": "o3", "error": "Blocked by pre-check"}
+    store.add_evaluation(blocked, "CASE")
+    store.add_evaluation(blocked, "CASE")
+    assert [row["weighted_score"] for row in store.leaderboard("CASE")] == [3.0]
+    assert [(row["weighted_score"], row["latest"]) for row in store.history("CASE", "a.pdf")] == [(3.0, 1), (None, 0)]
+
+
+def test_leaderboard_ranks_across_cases(store):
+    store.add_evaluations([scored("a.pdf", 2.0), scored("b.pdf", 4.5)], "ONE")
+    store.add_evaluation(scored("c.pdf", 3.0), "TWO")
+    assert [row["letter_name"] for row in store.leaderboard()] == ["b.pdf", "c.pdf", "a.pdf"]
+    assert store.category_summary()["Clarity"]["letters"] == 3
+
+
+def test_compare_evaluations_keeps_its_list_signature():
+    from main import compare_evaluations
+
+    report = compare_evaluations([scored("a.pdf", 2.0), scored("b.pdf", 4.5)])
+    assert report.index("1. b.pdf") < report.index("2. a.pdf")
+    assert compare_evaluations([scored("a.pdf", 2.0)]) == "Need at least two evaluations to compare."
+
+
+def test_comparison_only_includes_the_models_that_settled_each_letter(tmp_path, monkeypatch):
+    import main
+
+    store = ResultsStore(tmp_path / "results.db")
+    monkeypatch.setattr(main, "get_results_store", lambda: store)
+    results_dir = tmp_path / "CASE" / "results"
+    results_dir.mkdir(parents=True)
+    # An earlier run settled both letters with o3
+    store.add_evaluations([scored("letter_1.pdf", 2.95), scored("letter_2.pdf", 3.5)], "CASE")
+    # A cascade run settles letter_1 with the screening model instead
+    main.save_comparison([scored("letter_1.pdf", 2.85, model="gpt-4o-mini"), scored("letter_2.pdf", 3.5)], results_dir)
+    report = (results_dir / "comparison.md").read_text()
+    assert report.count("letter_1.pdf - Score") == 1
+    assert "letter_1.pdf - Score: 2.85" in report
+    store.close()
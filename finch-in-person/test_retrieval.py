@@ -0,0 +1,99 @@
+"""Tests for the BM25 source passage retrieval (retrieval.py)."""
+
+import importlib
+import threading
+
+import retrieval
+
+
+def passage(document, position, text, tokens=10):
+    return {"document": document, "position": position, "text": text, "tokens": tokens}
+
+
+PASSAGES = [
+    passage("Police_Report", 0, "The collision occurred at the intersection. The driver was cited for a red light."),
+    passage("Billing_Summary", 0, "Costa Vista Chiropractic billed $1,250.00 for therapy sessions."),
+    passage("Billing_Summary", 1, "TOTAL $7,760.00 for all medical treatment."),
+    passage("MRI_Report", 0, "MRI of the cervical spine shows no disc herniation."),
+]
+
+
+def test_tokenize_keeps_dates_amounts_and_identifiers_whole():
+    terms = retrieval.tokenize("On 11/21/2023 the bill was $7,760.00 for plate 8XZ-213 and the claim")
+    assert {"11/21/2023", "7760.00", "8xz-213"} <= set(terms)
+    assert "the" not in terms and "and" not in terms
+
+
+def test_search_ranks_the_matching_passage_first():
+    index = retrieval.BM25Index(PASSAGES)
+    hits = index.search("MRI cervical herniation", limit=2)
+    assert hits[0][1] == 3
+    assert hits[0][0] > (hits[1][0] if len(hits) > 1 else 0)
+
+
+def test_rare_terms_outweigh_common_ones():
+    index = retrieval.BM25Index(PASSAGES)
+    # "total" and "7760.00" occur only in the billing total passage
+    assert index.search("total 7,760.00", limit=1)[0][1] == 2
+
+
+def test_search_without_known_terms_returns_nothing():
+    assert retrieval.BM25Index(PASSAGES).search("zebra quantum") == []
+
+
+def test_select_passages_respects_budget_and_document_order():
+    index = retrieval.BM25Index(PASSAGES)
+    text = "The MRI showed no herniation.\n" + "x" * retrieval.QUERY_CHARS + "\nMedical bills total $7,760.00."
+    selected = index.select_passages(text, token_budget=20)
+    assert len(selected) == 2
+    assert sum(p["tokens"] for p in selected) <= 20
+    assert selected == sorted(selected, key=PASSAGES.index)
+
+
+def test_query_sections_are_line_aligned():
+    text = "\n".join(f"line {n} " + "y" * 100 for n in range(20))
+    sections = retrieval.query_sections(text)
+    assert len(sections) > 1
+    assert "\n".join(sections) == text
+
+
+def make_case(tmp_path, name):
+    case_dir = tmp_path / name
+    (case_dir / "source_documents").mkdir(parents=True)
+    (case_dir / "source_documents" / f"{name}.pdf").write_bytes(name.encode())
+    return case_dir
+
+
+def test_cases_build_their_indexes_concurrently(tmp_path, monkeypatch):
+    slow, fast = make_case(tmp_path, "slow"), make_case(tmp_path, "fast")
+    slow_started, fast_built = threading.Event(), threading.Event()
+    waited = {}
+
+    def build_passages(source_files):
+        if source_files[0].stem == "slow":
+            slow_started.set()
+            # Finishes only if the other case can be built meanwhile
+            waited["slow"] = fast_built.wait(timeout=5)
+        else:
+            fast_built.set()
+        return [passage(source_files[0].stem, 0, "medical bills")]
+
+    monkeypatch.setattr(retrieval, "build_passages", build_passages)
+    thread = threading.Thread(target=retrieval.load_case_index, args=(slow,))
+    thread.start()
+    slow_started.wait(timeout=5)
+    retrieval.load_case_index(fast)
+    thread.join()
+    assert waited["slow"]
+    assert retrieval.load_case_index(slow).search("medical")
+
+
+def test_summary_is_kept_next_to_passages_by_default(monkeypatch):
+    monkeypatch.delenv("FINCH_EVIDENCE", raising=False)
+    importlib.reload(retrieval)
+    # The summary is built for every case anyway, so the default uses it
+    assert retrieval.EVIDENCE_MODE == "both"
+    assert retrieval.summary_needed("passage text")
+    monkeypatch.setattr(retrieval, "EVIDENCE_MODE", "passages")
+    assert not retrieval.summary_needed("passage text")
+    assert retrieval.summary_needed("")
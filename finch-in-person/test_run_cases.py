@@ -0,0 +1,61 @@
+"""Tests for the multi-case runner's checkpointing (run_cases.py)."""
+
+import os
+
+import pytest
+
+import run_cases
+
+
+@pytest.fixture
+def case_root(tmp_path, monkeypatch):
+    for case in ("case_a", "case_b"):
+        (tmp_path / case / "demand_letters").mkdir(parents=True)
+        (tmp_path / case / "source_documents").mkdir()
+        (tmp_path / case / "demand_letters" / "letter_1.pdf").write_bytes(b"%PDF 1")
+    evaluated = []
+
+    def evaluate_or_reuse(letter_path, facts, **kwargs):
+        evaluated.append(f"{letter_path.parent.parent.name}/{letter_path.name}")
+        return {"letter_name": letter_path.name, "weighted_score": 3.0}, False
+
+    monkeypatch.setattr(run_cases, "extract_facts_from_source_documents", lambda **kwargs: {})
+    monkeypatch.setattr(run_cases, "evaluate_or_reuse", evaluate_or_reuse)
+    monkeypatch.setattr(run_cases, "save_evaluation", lambda *args: None)
+    return tmp_path, evaluated
+
+
+def test_reruns_only_queue_new_or_changed_letters(case_root):
+    root, evaluated = case_root
+    run_cases.run_cases(root, max_workers=2)
+    assert sorted(evaluated) == ["case_a/letter_1.pdf", "case_b/letter_1.pdf"]
+
+    evaluated.clear()
+    manifest = run_cases.run_cases(root, max_workers=2)
+    assert evaluated == []
+    assert all(entry["status"] == "done" for entry in manifest["cases"].values())
+
+    # A new letter in a finished case, and a changed one in the other
+    (root / "case_a" / "demand_letters" / "letter_2.pdf").write_bytes(b"%PDF 2")
+    changed = root / "case_b" / "demand_letters" / "letter_1.pdf"
+    changed.write_bytes(b"%PDF 1, revised")
+    os.utime(changed, ns=(0, changed.stat().st_mtime_ns + 1))
+    run_cases.run_cases(root, max_workers=2)
+    assert sorted(evaluated) == ["case_a/letter_2.pdf", "case_b/letter_1.pdf"]
+
+
+def test_removed_letters_are_forgotten(case_root):
+    root, _ = case_root
+    run_cases.run_cases(root, max_workers=1)
+    (root / "case_a" / "demand_letters" / "letter_1.pdf").unlink()
+    manifest = run_cases.run_cases(root, max_workers=1)
+    assert manifest["cases"]["case_a"]["letters"] == {}
+
+
+def test_duplicate_case_ids_are_rejected(case_root):
+    root, evaluated = case_root
+    for case in ("case_a", "case_b"):
+        (root / case / "source_documents" / "case_metadata.json").write_text('{"case_id": "CASE-001"}')
+    manifest = run_cases.run_cases(root, max_workers=1)
+    assert evaluated == []
+    assert {entry["status"] for entry in manifest["cases"].values()} == {"failed"}
@@ -0,0 +1,58 @@
+"""Tests for the request checks of the evaluator service (server.py)."""
+
+import pytest
+
+from server import EvaluatorService
+
+
+@pytest.fixture
+def service(tmp_path):
+    for case in ("data", "other"):
+        (tmp_path / case / "demand_letters").mkdir(parents=True)
+        (tmp_path / case / "demand_letters" / "letter_1.pdf").write_bytes(b"%PDF")
+    (tmp_path / "incoming").mkdir()
+    (tmp_path / "incoming" / "Record_012.pdf").write_bytes(b"%PDF")
+    (tmp_path / "incoming" / "notes.txt").write_text("notes")
+    service = EvaluatorService(data_dir=tmp_path / "data", max_workers=1)
+    yield service
+    service.executor.shutdown()
+
+
+def test_evaluate_parameters_are_resolved_in_the_case(service, tmp_path):
+    params = service.validate("evaluate", {"letter": "letter_1.pdf", "data_dir": "other", "samples": 3})
+    assert params["letter_path"] == tmp_path / "other" / "demand_letters" / "letter_1.pdf"
+    assert (params["samples"], params["force"], params["model"]) == (3, False, service.model)
+    assert service.validate("evaluate", {"letter": "letter_1.pdf"})["data_dir"] == tmp_path / "data"
+
+
+@pytest.mark.parametrize("params", [
+    {},
+    {"letter": "missing.pdf"},
+    {"letter": "/etc/passwd"},
+    {"letter": "../../other/demand_letters/letter_1.pdf"},
+    {"letter": "letter_1.pdf", "data_dir": "/tmp"},
+    {"letter": "letter_1.pdf", "data_dir": "../outside"},
+    {"letter": "letter_1.pdf", "samples": "abc"},
+    {"letter": "letter_1.pdf", "samples": 0.5},
+    {"letter": "letter_1.pdf", "samples": 2},
+    {"letter": "letter_1.pdf", "force": "yes"},
+    ["letter_1.pdf"],
+])
+def test_invalid_evaluate_requests_are_rejected(service, params):
+    with pytest.raises(ValueError):
+        service.validate("evaluate", params)
+
+
+def test_ingest_only_copies_pdfs_from_the_cases_root(service, tmp_path):
+    assert service.validate("ingest", {"path": "incoming/Record_012.pdf"})["source"] == tmp_path / "incoming" / "Record_012.pdf"
+    assert service.validate("ingest", {})["source"] is None
+    for path in ("incoming/notes.txt", str(tmp_path / "incoming" / "Record_012.pdf"), "../Record_012.pdf"):
+        with pytest.raises(ValueError):
+            service.validate("ingest", {"path": path})
+
+
+def test_symlinks_out_of_the_root_are_rejected(service, tmp_path_factory, tmp_path):
+    outside = tmp_path_factory.mktemp("outside")
+    (tmp_path / "link").symlink_to(outside, target_is_directory=True)
+    with pytest.raises(ValueError):
+        service.validate("evaluate", {"letter": "letter_1.pdf", "data_dir": "link"})
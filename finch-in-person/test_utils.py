@@ -0,0 +1,157 @@
+"""Tests for PDF text extraction, token-budgeted chunking and map-reduce fact merging (utils.py)."""
+
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import utils
+
+
+def paragraphs(count, words=60):
+    return "\n\n".join(" ".join(f"fact{n}-{w}" for w in range(words)) for n in range(count))
+
+
+def response(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+@pytest.mark.parametrize("text", [
+    paragraphs(40),
+    "\n".join(f"line {n} " + "word " * 30 for n in range(80)),
+    "x" * 20000,
+])
+def test_chunks_stay_within_the_budget(text):
+    chunks = utils.chunk_text(text, 200)
+    assert len(chunks) > 1
+    assert all(utils.count_tokens(chunk) <= 200 for chunk in chunks)
+
+
+def test_chunks_keep_every_word_in_order():
+    text = paragraphs(30)
+    chunks = utils.chunk_text(text, 150)
+    assert " ".join(chunks).split() == text.split()
+    assert utils.chunk_text("short text", 150) == ["short text"]
+
+
+@pytest.fixture
+def prompts(monkeypatch):
+    sent = []
+
+    def chat_completion(client, stage, model, messages, **kwargs):
+        prompt = messages[-1]["content"]
+        sent.append(prompt)
+        # Every call condenses its prompt into one short line
+        return response(f"summary of {utils.count_tokens(prompt)} tokens")
+
+    monkeypatch.setattr(utils, "chat_completion", chat_completion)
+    return sent
+
+
+def test_sections_that_fit_are_combined_in_one_call(prompts):
+    combined = utils.reduce_sections(None, ["## A\nfacts", "## B\nmore facts"], "system", "Merge these.",
+                                     token_budget=1000)
+    assert len(prompts) == 1
+    assert "## A\nfacts\n\n## B\nmore facts" in prompts[0]
+    assert combined.startswith("summary of")
+
+
+def test_reduce_keeps_every_prompt_within_the_budget(prompts):
+    sections = [f"## Document {n}\n{paragraphs(6)}" for n in range(12)]
+    utils.reduce_sections(None, sections, "system", "Merge these.", token_budget=1000, max_workers=4)
+    assert len(prompts) > 2
+    assert all(utils.count_tokens(prompt) <= 1000 - utils.PROMPT_OVERHEAD_TOKENS for prompt in prompts)
+    # The last call merges the summaries of every group
+    assert prompts[-1].count("## Part") == len(prompts) - 1
+
+
+
+def echo_model(monkeypatch, obeys_limit):
+    sent = []
+
+    def chat_completion(client, stage, model, messages, **kwargs):
+        prompt = messages[-1]["content"]
+        sent.append(prompt)
+        if obeys_limit and "words." in prompt.split("\n\n")[0]:
+            return response("short summary")
+        # Repeats every fact it was given, so the sections never shrink
+        return response(prompt.split("\n\n", 1)[1])
+
+    monkeypatch.setattr(utils, "chat_completion", chat_completion)
+    return sent
+
+
+def test_reduce_that_does_not_shrink_is_retried_with_a_word_limit(monkeypatch):
+    sent = echo_model(monkeypatch, obeys_limit=True)
+    sections = [f"## Document {n}\n{paragraphs(6)}" for n in range(12)]
+    combined = utils.reduce_sections(None, sections, "system", "Merge these.", token_budget=1000)
+    # The final prompt holds only the shortened group summaries
+    assert "## Document" not in combined and "short summary" in combined
+    assert any("Keep your answer under" in prompt for prompt in sent)
+
+
+def test_reduce_raises_instead_of_dropping_groups(monkeypatch):
+    echo_model(monkeypatch, obeys_limit=False)
+    sections = [f"## Document {n}\n{paragraphs(6)}" for n in range(12)]
+    with pytest.raises(RuntimeError, match="did not shrink"):
+        utils.reduce_sections(None, sections, "system", "Merge these.", token_budget=1000)
+
+def test_each_page_uses_the_cheapest_tier_that_reads_it(monkeypatch):
+    import pdfminer.high_level
+    import pypdf
+
+    calls = {}
+
+    class Reader:
+        def __init__(self, path):
+            self.pages = [SimpleNamespace(extract_text=lambda text=text: text) for text in ("typed page", "", "", "")]
+
+    def pdfminer_text(path, page_numbers=None):
+        calls["pdfminer"] = page_numbers
+        return "odd encoding page\f\f\f"
+
+    def ocr_pages(path, page_numbers=None):
+        calls["ocr"] = page_numbers
+        return ["scanned page", "   "]
+
+    monkeypatch.setattr(pypdf, "PdfReader", Reader)
+    monkeypatch.setattr(pdfminer.high_level, "extract_text", pdfminer_text)
+    monkeypatch.setattr(utils, "ocr_pdf_pages", ocr_pages)
+    extraction = utils._extract_pages_uncached(Path("record.pdf"))
+    assert extraction["page_tiers"] == ["pypdf", "pdfminer", "ocr", "none"]
+    assert extraction["pages"][:3] == ["typed page", "odd encoding page", "scanned page"]
+    # Each tier only sees the pages the cheaper tiers could not read (0-based for pdfminer, 1-based for OCR)
+    assert calls == {"pdfminer": [1, 2, 3], "ocr": [3, 4]}
+    assert {tier: stats["pages"] for tier, stats in extraction["tier_stats"].items()} == {"pypdf": 1, "pdfminer": 1, "ocr": 2}
+
+
+def test_text_pages_never_reach_the_slower_tiers(monkeypatch):
+    import pypdf
+
+    class Reader:
+        def __init__(self, path):
+            self.pages = [SimpleNamespace(extract_text=lambda: "typed page")] * 3
+
+    def unexpected(*args, **kwargs):
+        raise AssertionError("slower tier called")
+
+    monkeypatch.setattr(pypdf, "PdfReader", Reader)
+    monkeypatch.setattr(utils, "ocr_pdf_pages", unexpected)
+    extraction = utils._extract_pages_uncached(Path("record.pdf"))
+    assert extraction["page_tiers"] == ["pypdf"] * 3
+
+
+def test_ocr_workers_are_spawned_from_one_shared_pool(monkeypatch):
+    monkeypatch.setattr(utils, "_ocr_pool", None)
+    monkeypatch.setattr(utils, "OCR_WORKERS", 2)
+    pool = utils._get_ocr_pool()
+    try:
+        assert utils._get_ocr_pool() is pool
+        assert pool._mp_context.get_start_method() == "spawn"
+        assert pool.submit(os.getpid).result() != os.getpid()
+        # Changing the worker count replaces the pool on its next use
+        utils.configure_ocr(workers=1)
+        assert utils._ocr_pool is None
+    finally:
+        pool.shutdown()
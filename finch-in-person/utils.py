@@ -7,120 +7,698 @@ import logging
 from pathlib import Path
 import base64
 import time
+import hashlib
+import threading
+from functools import lru_cache
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-from pathlib import Path
-from typing import Union
+from typing import Any, Dict, List, Tuple, Union
 
-from pdfminer.high_level import extract_text  # pip install pdfminer.six
-from pypdf import PdfReader                  # pip install pypdf
-import pytesseract                            # pip install pytesseract pdf2image pillow
-from pdf2image import convert_from_path
-def extract_text_from_pdf(pdf_path: Union[str, Path]) -> str:
+# The PDF and OCR libraries (pdfminer.six, pypdf, pytesseract, pdf2image) are
+# imported where they are used, so code paths that never parse a PDF, such as
+# loading stored facts or comparing stored results, start without them
+
+from cache import CACHE_DIR, DiskCache
+from cascade import extraction_escalation_reason, extraction_tiers
+from llm import chat_completion, usage_from_response
+from metrics import record_cascade_tier, record_pdf_extraction, stage_timer
+
+# Bump when the extraction logic changes so cached text is not reused
+EXTRACTOR_VERSION = "2"
+
+# Cache of extracted PDF text, shared by the evaluator and the drafter
+TEXT_CACHE_MAX_BYTES = int(os.environ.get("FINCH_TEXT_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+_text_cache = DiskCache(CACHE_DIR / "pdf_text", max_bytes=TEXT_CACHE_MAX_BYTES)
+
+# OCR settings: render resolution and number of OCR worker processes
+OCR_DPI = int(os.environ.get("FINCH_OCR_DPI", 300))
+OCR_WORKERS = int(os.environ.get("FINCH_OCR_WORKERS", os.cpu_count() or 1))
+
+# One pool of OCR_WORKERS processes shared by every document OCR'd concurrently
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+def file_sha256(file_path: Union[str, Path]) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def configure_ocr(dpi=None, workers=None):
+    """
+    Override the OCR settings for this process.
+    
+    Args:
+        dpi: Resolution pages are rendered at before OCR
+        workers: Number of OCR worker processes (1 = OCR in this process)
+    """
+    global OCR_DPI, OCR_WORKERS, _ocr_pool
+    if dpi is not None:
+        OCR_DPI = dpi
+    if workers is not None:
+        with _ocr_pool_lock:
+            OCR_WORKERS = max(1, workers)
+            if _ocr_pool is not None:
+                _ocr_pool.shutdown()
+                _ocr_pool = None
+
+def _get_ocr_pool():
+    """Return the shared OCR process pool, starting it on first use."""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            import multiprocessing
+            # Forking a process that is running extraction threads can deadlock, so workers are spawned
+            _ocr_pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _ocr_pool
+
+def _ocr_page(pdf_path: str, page_number: int, dpi: int) -> str:
+    """Render a single page and OCR it; runs inside an OCR worker process."""
+    import pytesseract                          # pip install pytesseract pdf2image pillow
+    from pdf2image import convert_from_path
+    
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number)
+    return "\n".join(pytesseract.image_to_string(img) for img in images)
+
+def ocr_pdf_pages(pdf_path: Union[str, Path], page_numbers=None, dpi=None, max_workers=None) -> List[str]:
+    """
+    OCR the pages of a PDF across the shared pool of worker processes.
+    
+    Each worker renders and recognizes one page at a time, and at most
+    2 × max_workers pages of this document are queued at once, so memory
+    stays bounded by a handful of page images no matter how long the document
+    is. Documents OCR'd concurrently share the same OCR_WORKERS processes
+    instead of each starting their own.
+    
+    Args:
+        pdf_path: Path to the PDF
+        page_numbers: 1-based page numbers to OCR (default: every page)
+        dpi: Render resolution (default: OCR_DPI)
+        max_workers: Number of pages kept in flight per worker; 1 = OCR in
+            this process (default: OCR_WORKERS)
+        
+    Returns:
+        List of page texts, in page_numbers order
+    """
+    pdf_path = str(pdf_path)
+    dpi = dpi or OCR_DPI
+    max_workers = max_workers or OCR_WORKERS
+    if page_numbers is None:
+        from pdf2image import pdfinfo_from_path
+        page_numbers = range(1, pdfinfo_from_path(pdf_path)["Pages"] + 1)
+    page_numbers = list(page_numbers)
+    
+    if max_workers <= 1 or len(page_numbers) <= 1:
+        return [_ocr_page(pdf_path, page_number, dpi) for page_number in page_numbers]
+    
+    page_texts = {}
+    window = 2 * max_workers
+    executor = _get_ocr_pool()
+    pending = {}
+    for page_number in page_numbers:
+        if len(pending) >= window:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                page_texts[pending.pop(future)] = future.result()
+        pending[executor.submit(_ocr_page, pdf_path, page_number, dpi)] = page_number
+    for future in as_completed(pending):
+        page_texts[pending[future]] = future.result()
+    
+    return [page_texts[page_number] for page_number in page_numbers]
+
+def extract_pdf_pages(pdf_path: Union[str, Path], use_cache: bool = True) -> Dict[str, Any]:
     """
-    Robust text extraction that handles:
-      • normal / text-based PDFs   (PyPDF2 → fast)
-      • PDFs with tricky encodings (pdfminer.six)
-      • image-only / scanned PDFs  (OCR fallback)
+    Extract text page by page, choosing the cheapest tier that works per page.
+    
+    Pages with a text layer are read with PyPDF; pages PyPDF returns nothing for
+    are retried with pdfminer.six, and only pages that are still empty are OCR'd.
+    Results are cached on disk keyed by the file's content hash,
+    EXTRACTOR_VERSION and OCR_DPI, so an unchanged PDF is never parsed or OCR'd twice.
+    
+    Args:
+        pdf_path: Path to the PDF
+        use_cache: If False, always re-extract (the result is still cached)
+        
+    Returns:
+        Dictionary with "pages" (text per page), "page_tiers" (tier per page:
+        "pypdf", "pdfminer", "ocr" or "none") and "tier_stats" (page count
+        and seconds spent per tier)
     """
     pdf_path = Path(pdf_path)
+    # The OCR resolution changes OCR output, so it is part of the key
+    key = hashlib.sha256(f"{file_sha256(pdf_path)}:{EXTRACTOR_VERSION}:{OCR_DPI}".encode()).hexdigest()
+    
+    if use_cache:
+        cached = _text_cache.get(key)
+        if cached is not None:
+            logger.debug(f"Text cache hit for {pdf_path} ({_format_tier_stats(cached['tier_stats'])})")
+            record_pdf_extraction(cached["tier_stats"], cache_hit=True)
+            return cached
+    
+    extraction = _extract_pages_uncached(pdf_path)
+    logger.info(f"Extracted {pdf_path.name}: {_format_tier_stats(extraction['tier_stats'])}")
+    record_pdf_extraction(extraction["tier_stats"])
+    
+    # Failed extractions are not cached so they are retried next time
+    if any(page.strip() for page in extraction["pages"]):
+        _text_cache.put(key, dict(extraction, source=pdf_path.name))
+    return extraction
+
+def extract_text_and_tier(pdf_path: Union[str, Path], use_cache: bool = True) -> Tuple[str, str]:
+    """
+    Extract text from a PDF and report which extraction tier produced it.
+    
+    Args:
+        pdf_path: Path to the PDF
+        use_cache: If False, always re-extract (the result is still cached)
+        
+    Returns:
+        Tuple of (text, tier) where tier is "pypdf", "pdfminer", "ocr", "none",
+        or "mixed" when different pages needed different tiers
+    """
+    extraction = extract_pdf_pages(pdf_path, use_cache=use_cache)
+    text = "\n".join(page for page in extraction["pages"] if page.strip())
+    tiers = {tier for tier, page in zip(extraction["page_tiers"], extraction["pages"]) if page.strip()}
+    if not tiers:
+        return "", "none"
+    return text, tiers.pop() if len(tiers) == 1 else "mixed"
+
+def extract_text_from_pdf(pdf_path: Union[str, Path]) -> str:
+    """
+    Robust text extraction that handles, page by page:
+      • normal / text-based pages   (PyPDF2 → fast)
+      • pages with tricky encodings (pdfminer.six)
+      • image-only / scanned pages  (OCR fallback)
+    Results are cached on disk (see extract_pdf_pages).
+    """
+    text, _ = extract_text_and_tier(pdf_path)
+    return text
 
-    # Fast path – PyPDF2 works on most text-based PDFs
+def _format_tier_stats(tier_stats: Dict[str, Dict[str, float]]) -> str:
+    return ", ".join(f"{stats['pages']} pages {tier} ({stats['seconds']:.2f}s)" for tier, stats in tier_stats.items())
+
+def _extract_pages_uncached(pdf_path: Path) -> Dict[str, Any]:
+    """Run the extraction tiers page by page and collect per-tier stats."""
+    from pdf2image import pdfinfo_from_path
+    from pdfminer.high_level import extract_text  # pip install pdfminer.six
+    from pypdf import PdfReader                  # pip install pypdf
+    
+    pages: List[str] = []
+    page_tiers: List[str] = []
+    tier_stats: Dict[str, Dict[str, float]] = {}
+    
+    def record(tier, page_count, started):
+        stats = tier_stats.setdefault(tier, {"pages": 0, "seconds": 0.0})
+        stats["pages"] += page_count
+        stats["seconds"] += time.perf_counter() - started
+    
+    # Fast path – PyPDF2 works on most text-based pages
+    started = time.perf_counter()
     try:
         reader = PdfReader(str(pdf_path))
-        text = "\n".join(page.extract_text() or "" for page in reader.pages)
-        if text.strip():
-            return text
+        for page in reader.pages:
+            try:
+                pages.append(page.extract_text() or "")
+            except Exception as e:
+                logger.debug(f"PyPDF2 failed on a page of {pdf_path}: {e}")
+                pages.append("")
     except Exception as e:
         logger.debug(f"PyPDF2 failed on {pdf_path}: {e}")
-
+        pages = []
+    
+    if not pages:
+        # PyPDF could not even read the page tree – let pdfminer and OCR
+        # work out the page count themselves
+        try:
+            page_count = pdfinfo_from_path(str(pdf_path))["Pages"]
+        except Exception as e:
+            logger.debug(f"Could not count pages of {pdf_path}: {e}")
+            page_count = 0
+        pages = [""] * page_count
+    page_tiers = ["pypdf" if page.strip() else "none" for page in pages]
+    if any(tier == "pypdf" for tier in page_tiers):
+        record("pypdf", page_tiers.count("pypdf"), started)
+    
     # Second try – pdfminer.six is slower but more tolerant
-    try:
-        text = extract_text(str(pdf_path))
-        if text.strip():
-            return text
-    except Exception as e:
-        logger.debug(f"pdfminer.six failed on {pdf_path}: {e}")
+    missing = [idx for idx, page in enumerate(pages) if not page.strip()]
+    if missing or not pages:
+        started = time.perf_counter()
+        try:
+            if pages:
+                # pdfminer terminates every page with a form feed
+                mined = extract_text(str(pdf_path), page_numbers=missing).split("\f")
+                for idx, page_text in zip(missing, mined):
+                    if page_text.strip():
+                        pages[idx] = page_text
+                        page_tiers[idx] = "pdfminer"
+            else:
+                mined = [page_text for page_text in extract_text(str(pdf_path)).split("\f") if page_text.strip()]
+                pages = mined
+                page_tiers = ["pdfminer"] * len(mined)
+        except Exception as e:
+            logger.debug(f"pdfminer.six failed on {pdf_path}: {e}")
+        if "pdfminer" in page_tiers:
+            record("pdfminer", page_tiers.count("pdfminer"), started)
+    
+    # Fallback – image-only pages → OCR just those pages
+    missing = [idx for idx, page in enumerate(pages) if not page.strip()]
+    if missing:
+        started = time.perf_counter()
+        try:
+            ocr_texts = ocr_pdf_pages(pdf_path, page_numbers=[idx + 1 for idx in missing])
+            for idx, page_text in zip(missing, ocr_texts):
+                if page_text.strip():
+                    pages[idx] = page_text
+                    page_tiers[idx] = "ocr"
+        except Exception as e:
+            logger.error(f"OCR failed on {pdf_path}: {e}")
+        record("ocr", len(missing), started)
+    
+    if not any(page.strip() for page in pages):
+        logger.warning(f"Could not extract text from {pdf_path}")
+    elif "none" in page_tiers:
+        logger.warning(f"Could not extract text from {page_tiers.count('none')} pages of {pdf_path}")
+    
+    return {"pages": pages, "page_tiers": page_tiers, "tier_stats": tier_stats}
+
+# Prompts used to extract and consolidate facts
+EXTRACTION_SYSTEM_PROMPT = "You are a legal assistant who extracts key facts from legal and medical documents for personal injury cases."
+CONSOLIDATION_SYSTEM_PROMPT = "You are a legal assistant who summarizes and organizes case facts for personal injury demand letters."
+CONSOLIDATION_INSTRUCTIONS = "Based on these extracted facts from multiple documents, create a consolidated and organized summary of the most important facts for this case. Organize by categories like incident details, injuries, treatment, damages, etc."
+MERGE_INSTRUCTIONS = "These are facts extracted from consecutive parts of the same document. Merge them into a single list of the most important facts, removing duplicates but keeping every date, injury, treatment and amount."
+
+# Maximum size of a single extraction or consolidation prompt, in tokens.
+# Longer documents are split into chunks and their facts merged hierarchically.
+TOKEN_BUDGET = int(os.environ.get("FINCH_TOKEN_BUDGET", 24000))
+# Tokens reserved for the instructions wrapped around each chunk
+PROMPT_OVERHEAD_TOKENS = 300
+# Safety stop for hierarchical reduces that never fit a single prompt
+MAX_REDUCE_LEVELS = 6
 
-    # Fallback – probably a scanned (image-only) PDF → OCR each page
+@lru_cache(maxsize=None)
+def _get_encoding(model):
     try:
-        images = convert_from_path(str(pdf_path), dpi=300)
-        ocr_text = []
-        for idx, img in enumerate(images):
-            page_text = pytesseract.image_to_string(img)
-            if page_text.strip():
-                ocr_text.append(page_text)
-        if ocr_text:
-            return "\n".join(ocr_text)
+        import tiktoken  # optional: pip install tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
     except Exception as e:
-        logger.error(f"OCR failed on {pdf_path}: {e}")
+        logger.debug(f"tiktoken unavailable, estimating token counts: {e}")
+        return None
 
-    logger.warning(f"Could not extract text from {pdf_path}")
-    return ""
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """
+    Count the tokens in a text, using tiktoken when it is installed.
+    
+    Without tiktoken the count is estimated at four characters per token.
+    """
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
 
-def process_source_documents(client, source_files):
+def chunk_text(text: str, max_tokens: int, model: str = "gpt-4o") -> List[str]:
     """
-    Process source documents to extract key facts using OpenAI.
+    Split a text into chunks of at most `max_tokens` tokens.
+    
+    Chunks break on paragraph boundaries where possible, then on lines, and
+    only split inside a line when a single line is over the limit.
     
     Args:
-        client: OpenAI client
-        source_files: List of paths to source document PDFs
+        text: Text to split
+        max_tokens: Token limit per chunk
+        model: Model whose tokenizer is used for counting
         
     Returns:
-        Dictionary of extracted facts
+        List of chunks (a single chunk if the text already fits)
     """
-    # This would be a complex function in practice
-    # For each document, we'd extract the text and then use OpenAI to extract key facts
+    if count_tokens(text, model) <= max_tokens:
+        return [text]
     
-    all_facts = {}
+    def pieces(block, separators):
+        # Break a block into pieces that each fit, preferring coarse separators
+        if count_tokens(block, model) <= max_tokens:
+            return [block]
+        if not separators:
+            # A single unbreakable run: split by characters proportionally
+            size = max(1, len(block) * max_tokens // count_tokens(block, model))
+            return [block[i:i + size] for i in range(0, len(block), size)]
+        separator, rest = separators[0], separators[1:]
+        return [piece for part in block.split(separator) for piece in pieces(part, rest)]
     
-    # Process each source document
-    for doc_path in source_files:
-        logger.info(f"Processing source document: {doc_path}")
-        doc_name = doc_path.stem
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in pieces(text, ["\n\n", "\n", " "]):
+        piece_tokens = count_tokens(piece, model)
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece_tokens + 1
+    if current:
+        chunks.append("\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+def _map_calls(func, items, max_workers=1):
+    """
+    Apply `func` to every item, concurrently if max_workers > 1.
+    
+    Results are returned in the order of `items`. Model calls are paced by
+    the shared rate limiter (see rate_limit.py), not here.
+    """
+    items = list(items)
+    if max_workers > 1 and len(items) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # executor.map yields results in submission order, which keeps
+            # the output deterministic regardless of completion order
+            return list(executor.map(func, items))
+    
+    return [func(item) for item in items]
+
+def _extract_chunk_facts(client, doc_name, chunk, part, parts):
+    """
+    Ask the model for the key facts in one chunk of a document.
+    
+    With a model cascade the cheapest tier answers first, and the chunk is
+    only passed on to the next tier when its answer is empty or truncated.
+    """
+    part_note = f" (part {part} of {parts})" if parts > 1 else ""
+    tiers = extraction_tiers()
+    for tier, model in enumerate(tiers):
+        started = time.perf_counter()
+        response = chat_completion(
+            client,
+            stage="fact_extraction",
+            model=model,
+            messages=[
+                {"role": "system", "content": EXTRACTION_SYSTEM_PROMPT},
+                {"role": "user", "content": f"Extract the most important facts from this document that would be relevant for a demand letter. Focus on dates, injuries, treatments, and damages.\n\nDocument: {doc_name}{part_note}\n\n{chunk}"}
+            ],
+            temperature=0.2
+        )
+        if len(tiers) == 1:
+            break
+        reason = extraction_escalation_reason(response) if tier < len(tiers) - 1 else None
+        record_cascade_tier("fact_extraction", model, usage_from_response(response), time.perf_counter() - started,
+                            escalated=reason is not None)
+        if reason is None:
+            break
+        logger.info(f"Escalating extraction of {doc_name}{part_note} from {model}: {reason}")
+    return response.choices[0].message.content
+
+def reduce_sections(client, sections, system_prompt, instructions, token_budget=None, max_workers=1,
+                    stage="consolidation"):
+    """
+    Combine text sections with the model, keeping every prompt under budget.
+    
+    If all sections fit in one prompt they are combined in a single call.
+    Otherwise they are packed into groups that each fit, every group is
+    combined concurrently, and the combined groups are reduced again until a
+    single prompt remains. A level whose output is not smaller than its input
+    is redone with an explicit word limit per group.
+    
+    Args:
+        client: OpenAI client
+        sections: List of text sections (e.g. "## Document\nfacts")
+        system_prompt: System message for every call
+        instructions: Instructions placed before the sections in every call
+        token_budget: Maximum prompt size in tokens (default: TOKEN_BUDGET)
+        max_workers: Number of calls to run concurrently per level
+        stage: Pipeline stage the calls are recorded under in the run metrics
         
-        # Extract text from PDF (in a real implementation)
-        doc_text = extract_text_from_pdf(doc_path)
+    Returns:
+        The combined text
         
-        # Use OpenAI to extract key facts
-        response = client.chat.completions.create(
+    Raises:
+        RuntimeError: If the combined sections stop shrinking, so no single
+            prompt could hold them without dropping facts
+    """
+    token_budget = token_budget or TOKEN_BUDGET
+    section_budget = max(256, token_budget - PROMPT_OVERHEAD_TOKENS - count_tokens(instructions))
+    
+    def combine(group, word_limit=None):
+        limit = f" Keep your answer under {word_limit} words." if word_limit else ""
+        response = chat_completion(
+            client,
+            stage=stage,
             model="gpt-4o",
             messages=[
-                {"role": "system", "content": "You are a legal assistant who extracts key facts from legal and medical documents for personal injury cases."},
-                {"role": "user", "content": f"Extract the most important facts from this document that would be relevant for a demand letter. Focus on dates, injuries, treatments, and damages.\n\nDocument: {doc_name}\n\n{doc_text}"}
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"{instructions}{limit}\n\n" + "\n\n".join(group)}
             ],
             temperature=0.2
         )
+        return response.choices[0].message.content
+    
+    level = 0
+    while True:
+        # Sections that are too large on their own are split first
+        pieces = [piece for section in sections for piece in chunk_text(section, section_budget)]
+        groups = []
+        group_tokens = 0
+        for piece in pieces:
+            piece_tokens = count_tokens(piece) + 2
+            if groups and group_tokens + piece_tokens <= section_budget:
+                groups[-1].append(piece)
+                group_tokens += piece_tokens
+            else:
+                groups.append([piece])
+                group_tokens = piece_tokens
+        
+        if len(groups) <= 1:
+            return combine(groups[0] if groups else [])
+        
+        level += 1
+        if level > MAX_REDUCE_LEVELS:
+            raise RuntimeError(f"Reduce did not fit one prompt after {MAX_REDUCE_LEVELS} levels "
+                               f"({len(groups)} groups left)")
+        logger.info(f"Reducing {len(pieces)} sections in {len(groups)} groups (level {level})")
+        input_tokens = sum(count_tokens(piece) for piece in pieces)
+        combined = _map_calls(combine, groups, max_workers)
+        if sum(count_tokens(text) for text in combined) >= input_tokens:
+            # Ask for shorter answers so the next level can fit in fewer groups
+            word_limit = max(100, section_budget // len(groups) * 3 // 4)
+            logger.warning(f"Reduce level {level} did not shrink, retrying with a {word_limit} word limit")
+            combined = _map_calls(lambda group: combine(group, word_limit), groups, max_workers)
+            if sum(count_tokens(text) for text in combined) >= input_tokens:
+                raise RuntimeError(f"Reduce level {level} did not shrink {input_tokens} tokens of sections")
+        sections = [f"## Part {idx + 1}\n{text}" for idx, text in enumerate(combined)]
+
+def consolidate_facts(client, individual_documents, token_budget=None, max_workers=1):
+    """
+    Build the consolidated case summary from per-document facts.
+    
+    Args:
+        client: OpenAI client
+        individual_documents: Dictionary of document name -> extracted facts
+        token_budget: Maximum prompt size in tokens (default: TOKEN_BUDGET)
+        max_workers: Number of reduce calls to run concurrently
+        
+    Returns:
+        Consolidated summary text
+    """
+    sections = [f"## {doc_name}\n{facts}" for doc_name, facts in individual_documents.items()]
+    with stage_timer("consolidation"):
+        return reduce_sections(client, sections, CONSOLIDATION_SYSTEM_PROMPT, CONSOLIDATION_INSTRUCTIONS,
+                               token_budget=token_budget, max_workers=max_workers)
+
+def extract_facts_from_documents(client, doc_paths, token_budget=None, max_workers=1):
+    """
+    Extract the key facts from several source documents using OpenAI.
+    
+    Each document is split into chunks that fit the token budget. Every chunk
+    of every document is extracted concurrently, then the facts of documents
+    with several chunks are merged with reduce_sections.
+    
+    Args:
+        client: OpenAI client
+        doc_paths: List of paths to source document PDFs
+        token_budget: Maximum prompt size in tokens (default: TOKEN_BUDGET)
+        max_workers: Number of calls to run concurrently (1 = serial)
+        
+    Returns:
+        Dictionary of document name -> extracted facts, in doc_paths order
+    """
+    token_budget = token_budget or TOKEN_BUDGET
+    chunk_budget = max(256, token_budget - PROMPT_OVERHEAD_TOKENS)
+    
+    # Extract text from the PDFs
+    with stage_timer("pdf_extraction"):
+        texts = _map_calls(extract_text_from_pdf, doc_paths, max_workers)
+    
+    with stage_timer("fact_extraction"):
+        return _extract_facts_from_texts(client, doc_paths, texts, chunk_budget, token_budget, max_workers)
+
+def _extract_facts_from_texts(client, doc_paths, texts, chunk_budget, token_budget, max_workers):
+    """Extract and merge the facts of every chunk of every document."""
+    tasks = []
+    for doc_path, doc_text in zip(doc_paths, texts):
+        chunks = chunk_text(doc_text, chunk_budget)
+        logger.info(f"Processing source document: {doc_path}" + (f" ({len(chunks)} chunks)" if len(chunks) > 1 else ""))
+        tasks.extend((doc_path.stem, chunk, idx + 1, len(chunks)) for idx, chunk in enumerate(chunks))
+    
+    chunk_facts = _map_calls(lambda task: _extract_chunk_facts(client, *task), tasks, max_workers)
+    
+    parts_by_doc = {doc_path.stem: [] for doc_path in doc_paths}
+    for (doc_name, _, part, parts), facts in zip(tasks, chunk_facts):
+        parts_by_doc[doc_name].append(f"## {doc_name} (part {part} of {parts})\n{facts}" if parts > 1 else facts)
+    
+    all_facts = {}
+    for doc_name, parts in parts_by_doc.items():
+        if len(parts) > 1:
+            all_facts[doc_name] = reduce_sections(client, parts, EXTRACTION_SYSTEM_PROMPT, MERGE_INSTRUCTIONS,
+                                                  token_budget=token_budget, max_workers=max_workers,
+                                                  stage="fact_extraction")
+        else:
+            all_facts[doc_name] = parts[0] if parts else ""
+    return all_facts
+
+def extract_document_facts(client, doc_path, token_budget=None):
+    """
+    Extract the key facts from a single source document using OpenAI.
+    
+    Args:
+        client: OpenAI client
+        doc_path: Path to the source document PDF
+        token_budget: Maximum prompt size in tokens (default: TOKEN_BUDGET)
+        
+    Returns:
+        Extracted facts as text
+    """
+    return extract_facts_from_documents(client, [doc_path], token_budget=token_budget)[doc_path.stem]
+
+def _changed_documents(source_files, previous_facts):
+    """Fingerprint the source files and list those added or changed since `previous_facts`."""
+    previous_documents = previous_facts.get("individual_documents", {})
+    previous_fingerprints = previous_facts.get("document_fingerprints", {})
+    fingerprints = {doc_path.stem: file_sha256(doc_path) for doc_path in source_files}
+    changed_files = [doc_path for doc_path in source_files
+                     if doc_path.stem not in previous_documents
+                     or previous_fingerprints.get(doc_path.stem) != fingerprints[doc_path.stem]]
+    return fingerprints, changed_files
+
+def documents_changed(source_files, previous_facts):
+    """
+    Check whether source documents were added, changed or removed since facts were extracted.
+    
+    Only hashes the files, so callers can skip creating an OpenAI client when
+    the stored facts are still current.
+    
+    Args:
+        source_files: List of paths to source document PDFs
+        previous_facts: Previously extracted facts with per-document fingerprints
         
-        # Extract the facts
-        facts = response.choices[0].message.content
-        all_facts[doc_name] = facts
+    Returns:
+        True if process_source_documents would re-extract or drop any document
+    """
+    fingerprints, changed_files = _changed_documents(source_files, previous_facts)
+    return bool(changed_files) or set(previous_facts.get("individual_documents", {})) != set(fingerprints)
+
+def process_source_documents(client, source_files, max_workers=1, previous_facts=None, token_budget=None):
+    """
+    Process source documents to extract key facts using OpenAI.
+    
+    When `previous_facts` carries per-document fingerprints, only documents that
+    were added or changed since then are sent to the model; documents that are no
+    longer present are dropped, and the consolidated summary is only rebuilt if
+    the per-document facts actually changed.
+    
+    Args:
+        client: OpenAI client
+        source_files: List of paths to source document PDFs
+        max_workers: Number of model calls to run concurrently (1 = serial)
+        previous_facts: Previously extracted facts to update incrementally
+        token_budget: Maximum prompt size in tokens (default: TOKEN_BUDGET)
         
-        # Avoid rate limiting
-        time.sleep(0.5)
+    Returns:
+        Dictionary of extracted facts
+    """
+    # For each document, we extract the text and then use OpenAI to extract key facts.
+    # With max_workers > 1 the calls fan out over a thread pool; the OpenAI
+    # client is thread-safe, so a single client is shared by all workers.
+    
+    previous_facts = previous_facts or {}
+    previous_documents = previous_facts.get("individual_documents", {})
+    fingerprints, changed_files = _changed_documents(source_files, previous_facts)
+    
+    if previous_documents:
+        removed = sorted(set(previous_documents) - set(fingerprints))
+        logger.info(f"{len(changed_files)} new or changed, {len(source_files) - len(changed_files)} unchanged, "
+                    f"{len(removed)} removed source documents")
+    
+    if max_workers > 1 and len(changed_files) > 1:
+        logger.info(f"Extracting facts from {len(changed_files)} documents with {max_workers} workers")
+    new_facts = extract_facts_from_documents(client, changed_files, token_budget=token_budget, max_workers=max_workers)
+    
+    # Reuse the stored facts of unchanged documents, in source_files order
+    all_facts = {}
+    for doc_path in source_files:
+        doc_name = doc_path.stem
+        all_facts[doc_name] = new_facts[doc_name] if doc_name in new_facts else previous_documents[doc_name]
     
-    # Compile all facts into a final summary
-    fact_text = "\n\n".join([f"## {doc_name}\n{facts}" for doc_name, facts in all_facts.items()])
+    if all_facts == previous_documents and previous_facts.get("consolidated_summary"):
+        logger.info("Per-document facts unchanged, reusing consolidated summary")
+        return {
+            "consolidated_summary": previous_facts["consolidated_summary"],
+            "individual_documents": all_facts,
+            "document_fingerprints": fingerprints
+        }
     
     # Use OpenAI to create a consolidated fact summary
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are a legal assistant who summarizes and organizes case facts for personal injury demand letters."},
-            {"role": "user", "content": f"Based on these extracted facts from multiple documents, create a consolidated and organized summary of the most important facts for this case. Organize by categories like incident details, injuries, treatment, damages, etc.\n\n{fact_text}"}
-        ],
-        temperature=0.2
-    )
+    consolidated_summary = consolidate_facts(client, all_facts, token_budget=token_budget, max_workers=max_workers)
     
     # Return the consolidated facts
     return {
-        "consolidated_summary": response.choices[0].message.content,
-        "individual_documents": all_facts
+        "consolidated_summary": consolidated_summary,
+        "individual_documents": all_facts,
+        "document_fingerprints": fingerprints
     }
 
+# Updated weights to match the new evaluation criteria
+CATEGORY_WEIGHTS = {
+    "Quality of Writing": 0.20,
+    "Factual Presentation": 0.10,
+    "Medical Documentation": 0.15,
+    "Damages Calculation": 0.25,
+    "Precedent and Legal Authority": 0.10,
+    "Legal Strategy": 0.05,
+    # "Persuasiveness": 0.10,
+    "Settlement Justification": 0.10,
+    "Source Document Representation": 0.05
+}
+
+def canonical_category(category_raw):
+    """
+    Map a category name as written by the model to its name in CATEGORY_WEIGHTS.
+    
+    Args:
+        category_raw: Category name, possibly with heading markup or extra words
+        
+    Returns:
+        The canonical category name, or None if it matches no weighted category
+    """
+    # Clean up category name (remove heading markings, trim, lowercase for matching)
+    category_clean = category_raw.replace("###", "").strip().lower()
+    
+    # Map to handle variations in category naming
+    category_map = {category.lower(): category for category in CATEGORY_WEIGHTS}
+    
+    # Map to standard category name if possible
+    if category_clean in category_map:
+        return category_map[category_clean]
+    
+    # Try to find a match by partial string
+    for key, value in category_map.items():
+        if key in category_clean:
+            return value
+    return None
+
 def calculate_weighted_score(scores):
     """
     Calculate the weighted score based on category scores.
@@ -131,32 +709,6 @@ def calculate_weighted_score(scores):
     Returns:
         Weighted total score
     """
-    # Updated weights to match the new evaluation criteria
-    weights = {
-        "Quality of Writing": 0.20,
-        "Factual Presentation": 0.10,
-        "Medical Documentation": 0.15,
-        "Damages Calculation": 0.25,
-        "Precedent and Legal Authority": 0.10,
-        "Legal Strategy": 0.05,
-        # "Persuasiveness": 0.10,
-        "Settlement Justification": 0.10,
-        "Source Document Representation": 0.05
-    }
-    
-    # Map to handle variations in category naming
-    category_map = {
-        "quality of writing": "Quality of Writing",
-        "factual presentation": "Factual Presentation",
-        "medical documentation": "Medical Documentation",
-        "damages calculation": "Damages Calculation",
-        "precedent and legal authority": "Precedent and Legal Authority",
-        "legal strategy": "Legal Strategy",
-        # "persuasiveness": "Persuasiveness",
-        "settlement justification": "Settlement Justification",
-        "source document representation": "Source Document Representation"
-    }
-    
     total_score = 0
     total_weight = 0
     
@@ -164,24 +716,12 @@ def calculate_weighted_score(scores):
     logger.debug(f"Raw scores: {scores}")
     
     for category_raw, score_data in scores.items():
-        # Clean up category name (remove heading markings, trim, lowercase for matching)
-        category_clean = category_raw.replace("###", "").strip().lower()
-        
-        # Map to standard category name if possible
-        if category_clean in category_map:
-            category = category_map[category_clean]
-        else:
-            # Try to find a match by partial string
-            category = None
-            for key, value in category_map.items():
-                if key in category_clean:
-                    category = value
-                    break
+        category = canonical_category(category_raw)
         
         # If we found a matching category with a weight
-        if category and category in weights and "score" in score_data:
+        if category and "score" in score_data:
             score = score_data["score"]
-            weight = weights[category]
+            weight = CATEGORY_WEIGHTS[category]
             
             logger.debug(f"Adding score for {category}: {score} × {weight}")
             total_score += score * weight
@@ -195,4 +735,4 @@ def calculate_weighted_score(scores):
         return final_score
     else:
         logger.warning("No valid categories found for scoring")
-        return 0
\ No newline at end of file
+        return 0